@@ -5,6 +5,17 @@ import vtk, qt, ctk, slicer
 from slicer.ScriptedLoadableModule import *
 from slicer.util import VTKObservationMixin
 
+# slice view axis names -> index of the axis the slices are perpendicular to (0=R, 1=A, 2=S)
+AXIS_INDICES = {"R (Yellow)": 0, "A (Green)": 1, "S (Red)": 2}
+
+def axisIndexFromName(axis):
+  """
+  Index of the axis (0=R, 1=A, 2=S) of a slice view axis name such as "S (Red)".
+  """
+  if axis not in AXIS_INDICES:
+    raise ValueError("Invalid axis name: "+axis)
+  return AXIS_INDICES[axis]
+
 #
 # SegmentGeometry
 #
@@ -183,7 +194,10 @@ class SegmentGeometryWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     self.ui.OrientationcheckBox.connect('stateChanged(int)', self.initializeAxisLine)
     self.ui.orientationspinBox.connect("valueChanged(double)", self.updateParameterNodeFromGUI)
     self.ui.orientationspinBox.connect("valueChanged(double)", self.updateAxisLineAngle)
+    self.ui.orientationspinBox.connect("valueChanged(double)", self.onAngleChanged)
     self.ui.CompactnesscheckBox.connect('stateChanged(int)', self.updateParameterNodeFromGUI)
+    self.ui.DoubecheckBox.connect('stateChanged(int)', self.onNormalizationChanged)
+    self.ui.SummerscheckBox.connect('stateChanged(int)', self.onNormalizationChanged)
     self.ui.areaSegmentSelector.connect('currentSegmentChanged(QString)', self.updateParameterNodeFromGUI)
     
     # Buttons
@@ -227,6 +241,10 @@ class SegmentGeometryWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     """
     # Parameter node will be reset, do not use it anymore
     self.setParameterNode(None)
+    # Nodes of the cached labelmaps are gone
+    self.logic.labelmapCache.invalidate()
+    self.logic.orientationState = None
+    self.logic.normalizationState = None
 
   def onSceneEndClose(self, caller, event):
     """
@@ -513,51 +531,26 @@ class SegmentGeometryWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         sliders.TypeOfTransform = slicer.qMRMLTransformSliders.ROTATION    
         #sliders.setMRMLTransformNode(slicer.mrmlScene.GetFirstNodeByName("SegmentGeometry Point Transformation"))
 
-    import SegmentStatistics
-    segmentationNode.GetDisplayNode().SetSegmentVisibility(segmentId, True)
-    segStatLogic = SegmentStatistics.SegmentStatisticsLogic()
-    segStatLogic.getParameterNode().SetParameter("Segmentation", segmentationNode.GetID())
-    segStatLogic.getParameterNode().SetParameter("LabelmapSegmentStatisticsPlugin.obb_origin_ras.enabled",str(True))
-    segStatLogic.getParameterNode().SetParameter("LabelmapSegmentStatisticsPlugin.obb_diameter_mm.enabled",str(True))
-    segStatLogic.getParameterNode().SetParameter("LabelmapSegmentStatisticsPlugin.obb_direction_ras_x.enabled",str(True))
-    segStatLogic.getParameterNode().SetParameter("LabelmapSegmentStatisticsPlugin.obb_direction_ras_y.enabled",str(True))
-    segStatLogic.getParameterNode().SetParameter("LabelmapSegmentStatisticsPlugin.obb_direction_ras_z.enabled",str(True))
-    segStatLogic.computeStatistics()
-    stats = segStatLogic.getStatistics()
-
-    # Draw ROI for each oriented bounding box
+    # rotate the principal axes of the segment onto R, A and S around its centroid, with the long axis along S
     import numpy as np
-    # Get bounding box
-    obb_origin_ras = np.array(stats[segmentId,"LabelmapSegmentStatisticsPlugin.obb_origin_ras"])
-    obb_diameter_mm = np.array(stats[segmentId,"LabelmapSegmentStatisticsPlugin.obb_diameter_mm"])
-    obb_direction_ras_x = np.array(stats[segmentId,"LabelmapSegmentStatisticsPlugin.obb_direction_ras_x"])
-    obb_direction_ras_y = np.array(stats[segmentId,"LabelmapSegmentStatisticsPlugin.obb_direction_ras_y"])
-    obb_direction_ras_z = np.array(stats[segmentId,"LabelmapSegmentStatisticsPlugin.obb_direction_ras_z"])
-    # Position and orient ROI using a transform
-    obb_center_ras = obb_origin_ras+0.5*(obb_diameter_mm[0] * obb_direction_ras_x + obb_diameter_mm[1] * obb_direction_ras_y + obb_diameter_mm[2] * obb_direction_ras_z)
-    boundingBoxToRasTransform = np.row_stack((np.column_stack((obb_direction_ras_x, obb_direction_ras_y, obb_direction_ras_z, [0,0,0])), (0, 0, 0, 1)))
-    boundingBoxToRasTransformMatrix = slicer.util.vtkMatrixFromArray(boundingBoxToRasTransform)
+    from SegmentGeometryLib import SegmentAxes
+    segmentationNode.GetDisplayNode().SetSegmentVisibility(segmentId, True)
+    principal = self.logic.segmentPrincipalAxes(segmentationNode, segmentId, SegmentAxes.DEFAULT_MAX_VOXELS)
+    if principal is None:
+      return
+    alignmentMatrix = SegmentAxes.alignmentMatrix(principal["centroid"], principal["axes"])
     transformNode = slicer.mrmlScene.GetFirstNodeByName(segName + " SegmentGeometry Transformation")
-    transformNode.SetMatrixTransformFromParent(boundingBoxToRasTransformMatrix)
+    transformNode.SetMatrixTransformToParent(slicer.util.vtkMatrixFromArray(alignmentMatrix))
     segmentationNode.SetAndObserveTransformNodeID(transformNode.GetID())
     volumeNode.SetAndObserveTransformNodeID(transformNode.GetID())
-    slicer.modules.markups.logic().JumpSlicesToLocation(segcentroid_ras[0], segcentroid_ras[1], segcentroid_ras[2], True)
+    centroid = principal["centroid"]
+    slicer.modules.markups.logic().JumpSlicesToLocation(centroid[0], centroid[1], centroid[2], True)
 
-    segcentroid_ras_new = segmentationNode.GetSegmentCenterRAS(segmentId)
-    Centroid_diff = [0.0, 0.0, 0.0]  
-    for i in range(0,3):
-      Centroid_diff[i] = (segcentroid_ras_new[i] -  segcentroid_ras[i])
-
-    trans_new = slicer.mrmlScene.GetNodeByID(segmentationNode.GetTransformNodeID())
-    matrix = vtk.vtkMatrix4x4()
-    trans_new.GetMatrixTransformToParent(matrix)
-    matrix.SetElement(0,3, matrix.GetElement(0,3) - Centroid_diff[0]) 
-    matrix.SetElement(1,3, matrix.GetElement(1,3) - Centroid_diff[1])
-    matrix.SetElement(2,3, matrix.GetElement(2,3) - Centroid_diff[2]) 
-    trans_new.SetMatrixTransformToParent(matrix)
     pointNode = slicer.mrmlScene.GetFirstNodeByName("SegmentGeometry Point Transformation")
     if pointNode != None:
-      pointNode.SetMatrixTransformFromParent(boundingBoxToRasTransformMatrix)  
+      rotationMatrix = np.eye(4)
+      rotationMatrix[:3, :3] = principal["axes"]
+      pointNode.SetMatrixTransformFromParent(slicer.util.vtkMatrixFromArray(rotationMatrix))
 
     self.ui.OrientationcheckBox.checked = False  
     lineNode = slicer.mrmlScene.GetFirstNodeByName("SegmentGeometry Neutral Axis A")
@@ -750,96 +743,25 @@ class SegmentGeometryWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     lineNode = slicer.mrmlScene.GetFirstNodeByName("SegmentGeometry Neutral Axis A")
     if lineNode == None and volumeNode != None:
       spacing = volumeNode.GetSpacing()
-      #determine the centroid of the current slice
-      segcentroid_ras = segmentationNode.GetSegmentCenterRAS(segmentId)
-      #slicer.modules.markups.logic().JumpSlicesToLocation(segcentroid_ras[0], segcentroid_ras[1], segcentroid_ras[2], True)
       if axis=="R (Yellow)":     
         sliceNodeID = "vtkMRMLSliceNodeYellow"
       if axis=="A (Green)":
         sliceNodeID = "vtkMRMLSliceNodeGreen"
       if axis=="S (Red)":      
         sliceNodeID = "vtkMRMLSliceNodeRed"
-      
-      # Get image data from slice view
       sliceNode = slicer.mrmlScene.GetNodeByID(sliceNodeID)
-      appLogic = slicer.app.applicationLogic()
-      sliceLogic = appLogic.GetSliceLogic(sliceNode)
-      sliceLayerLogic = sliceLogic.GetBackgroundLayer()
-      reslice = sliceLayerLogic.GetReslice()
-      reslicedImage = vtk.vtkImageData()
-      reslicedImage.DeepCopy(reslice.GetOutput())
 
-      # Create new volume node using resliced image
-      newVolume = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode","MyNewVolume")
-      newVolume.SetIJKToRASMatrix(sliceNode.GetXYToRAS())
-      newVolume.SetAndObserveImageData(reslicedImage)
-      newVolume.CreateDefaultDisplayNodes()
-      newVolume.CreateDefaultStorageNode()
-      labelmapVolumeNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLLabelMapVolumeNode")
-      segmentIds = vtk.vtkStringArray()
-      segmentIds.InsertNextValue(segmentId)
-      slicer.vtkSlicerSegmentationsModuleLogic.ExportSegmentsToLabelmapNode(segmentationNode, segmentIds, labelmapVolumeNode, newVolume)
+      #determine the centroid of the segment in the current slice from its labelmap in memory
+      linecenter = self.logic.segmentSliceCentroid(segmentationNode, segmentId, slicer.util.arrayFromVTKMatrix(sliceNode.GetSliceToRAS()))
 
-      seg = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentationNode")
-      slicer.modules.segmentations.logic().ImportLabelmapToSegmentationNode(labelmapVolumeNode, seg)
-      segName = seg.GetDisplayNode().GetVisibleSegmentIDs()[0]
-      
-      import SegmentStatistics
-      segStatLogic = SegmentStatistics.SegmentStatisticsLogic()
-      segStatLogic.getParameterNode().SetParameter("Segmentation", seg.GetID())
-      segStatLogic.getParameterNode().SetParameter("LabelmapSegmentStatisticsPlugin.centroid_ras.enabled", str(True))
-      segStatLogic.computeStatistics()
-      stats = segStatLogic.getStatistics()
-      
-      linecenter = stats[stats["SegmentIDs"][0],"LabelmapSegmentStatisticsPlugin.centroid_ras"]
-      
       # if tried to draw line not over the segment, jump to the center
-      if linecenter == None:
+      if linecenter is None:
         segcentroid_ras = segmentationNode.GetSegmentCenterRAS(segmentId)
         slicer.modules.markups.logic().JumpSlicesToLocation(segcentroid_ras[0], segcentroid_ras[1], segcentroid_ras[2], True)
-        if axis=="R (Yellow)":     
-          sliceNodeID = "vtkMRMLSliceNodeYellow"
-        if axis=="A (Green)":
-          sliceNodeID = "vtkMRMLSliceNodeGreen"
-        if axis=="S (Red)":      
-          sliceNodeID = "vtkMRMLSliceNodeRed"
-      
-        # Get image data from slice view
-        sliceNode = slicer.mrmlScene.GetNodeByID(sliceNodeID)
-        appLogic = slicer.app.applicationLogic()
-        sliceLogic = appLogic.GetSliceLogic(sliceNode)
-        sliceLayerLogic = sliceLogic.GetBackgroundLayer()
-        reslice = sliceLayerLogic.GetReslice()
-        reslicedImage = vtk.vtkImageData()
-        reslicedImage.DeepCopy(reslice.GetOutput())
-  
-        # Create new volume node using resliced image
-        newVolume = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode","MyNewVolume")
-        newVolume.SetIJKToRASMatrix(sliceNode.GetXYToRAS())
-        newVolume.SetAndObserveImageData(reslicedImage)
-        newVolume.CreateDefaultDisplayNodes()
-        newVolume.CreateDefaultStorageNode()
-        labelmapVolumeNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLLabelMapVolumeNode")
-        segmentIds = vtk.vtkStringArray()
-        segmentIds.InsertNextValue(segmentId)
-        slicer.vtkSlicerSegmentationsModuleLogic.ExportSegmentsToLabelmapNode(segmentationNode, segmentIds, labelmapVolumeNode, newVolume)
-
-        seg = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentationNode")
-        slicer.modules.segmentations.logic().ImportLabelmapToSegmentationNode(labelmapVolumeNode, seg)
-        segName = seg.GetDisplayNode().GetVisibleSegmentIDs()[0]
-        
-        import SegmentStatistics
-        segStatLogic = SegmentStatistics.SegmentStatisticsLogic()
-        segStatLogic.getParameterNode().SetParameter("Segmentation", seg.GetID())
-        segStatLogic.getParameterNode().SetParameter("LabelmapSegmentStatisticsPlugin.centroid_ras.enabled", str(True))
-        segStatLogic.computeStatistics()
-        stats = segStatLogic.getStatistics()
-      
-        linecenter = stats[stats["SegmentIDs"][0],"LabelmapSegmentStatisticsPlugin.centroid_ras"]
-    
-      slicer.mrmlScene.RemoveNode(labelmapVolumeNode)
-      slicer.mrmlScene.RemoveNode(newVolume)
-      slicer.mrmlScene.RemoveNode(seg)
+        linecenter = self.logic.segmentSliceCentroid(segmentationNode, segmentId, slicer.util.arrayFromVTKMatrix(sliceNode.GetSliceToRAS()))
+        if linecenter is None:
+          linecenter = segcentroid_ras
+      linecenter = list(linecenter)
       
     elif lineNode != None:
       spacing = volumeNode.GetSpacing()
@@ -949,6 +871,21 @@ class SegmentGeometryWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     shNode.SetItemExpanded(newFolder,0)    
 
 
+  def onAngleChanged(self):
+    """
+    Update the neutral axis columns of the last results for the new angle, also while the axis line is dragged
+    """
+    if self.ui.OrientationcheckBox.checked == True:
+      self.logic.updateOrientation(self.ui.orientationspinBox.value)
+
+
+  def onNormalizationChanged(self):
+    """
+    Add or remove the normalized columns of the last results without measuring the segment again
+    """
+    self.logic.updateNormalization(self.ui.DoubecheckBox.checked, self.ui.SummerscheckBox.checked)
+
+
   def updateAxisLineAngle(self):
     """
     Update axis line with angle 
@@ -1156,7 +1093,8 @@ class SegmentGeometryWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
                      self.ui.ThetacheckBox.checked, self.ui.RcheckBox.checked,
                      self.ui.DoubecheckBox.checked, self.ui.SummerscheckBox.checked, 
                      self.ui.CompactnesscheckBox.checked, self.ui.areaSegmentSelector.currentNode(),self.ui.areaSegmentSelector.currentSegmentID(),
-                     self.ui.CentroidcheckBox.checked,self.ui.PerimcheckBox.checked,self.ui.ResultsText)
+                     self.ui.CentroidcheckBox.checked,self.ui.PerimcheckBox.checked,self.ui.ResultsText,
+                     sceneFree=False)
       
     except Exception as e:
       slicer.util.errorDisplay("Failed to compute results: "+str(e))
@@ -1191,6 +1129,14 @@ class SegmentGeometryLogic(ScriptedLoadableModuleLogic):
     Called when the logic class is instantiated. Can be used for initializing member variables.
     """
     ScriptedLoadableModuleLogic.__init__(self)
+    from SegmentGeometryLib import LabelmapCache
+    self.labelmapCache = LabelmapCache()
+    # moment tensors of the last run with a custom neutral axis, see updateOrientation
+    self.orientationState = None
+    # columns in mm of the last run, see updateNormalization
+    self.normalizationState = None
+    # time and memory of the stages of the last run, see Profiling.StageReport
+    self.lastReport = None
 
   def setDefaultParameters(self, parameterNode):
     """
@@ -1199,13 +1145,38 @@ class SegmentGeometryLogic(ScriptedLoadableModuleLogic):
 
   def run(self, segmentationNode, segmentNode, volumeNode, axis, interval, tableNode, plotChartNode, LengthcheckBox, FeretcheckBox, CSAcheckBox, IntensitycheckBox, SMAcheckBox_1,
   MODcheckBox_1, JzcheckBox, ZpolcheckBox, OrientationcheckBox, angle, ThetacheckBox, RcheckBox, DoubecheckBox, SummerscheckBox,
-  CompactnesscheckBox, areaSegementationNode, areaSegmentID, CentroidcheckBox, PerimcheckBox, ResultsText):
+  CompactnesscheckBox, areaSegementationNode, areaSegmentID, CentroidcheckBox, PerimcheckBox, ResultsText, wholeStack=True,
+  perimeterMethod="contour", feretAngles=False, workers=None, sceneFree=True, resampleAnisotropic=False, traceMemory=False,
+  weightedMoments=False, brightnessPercentiles=None):
     """
     Run the processing algorithm.
+    If wholeStack is True, the moment based properties of all slices are computed with a single
+    pass over the labelmap instead of slice by slice.
+    perimeterMethod is either "contour" (marching squares contour of all islands and holes,
+    computed for the whole stack at once) or "tracer" (legacy outer boundary tracer).
+    If feretAngles is True, the directions of the maximum and minimum feret diameters are added to the table.
+    workers is the number of threads that process chunks of slices concurrently; None uses one per core
+    and 1 runs serially. The results do not depend on the number of workers.
+    If sceneFree is True, the labelmap of the segment is taken straight from the segmentation and
+    cropped in memory, without temporary nodes, unless the volume has to be resampled first. Set it to
+    False to also keep the masked "SegmentGeometry Resampled Volume" of the segment in the scene, which
+    the Slice Index, Cx and Cy columns refer to; the Apply button does so.
+    Anisotropic voxels are measured on their native grid, with each pixel weighted by its width
+    and height. If resampleAnisotropic is True, the volume is resampled to isotropic voxels with
+    Crop Volume first instead, which is slower and takes more memory.
+    Returns a Profiling.StageReport (also kept in self.lastReport) of the time of every stage,
+    from the labelmap export to the plot, which is logged and can be saved with its toJson or
+    toChromeTrace methods. If traceMemory is True, the peak memory of every stage is traced
+    with tracemalloc too, which makes the run slower.
+    If the brightness is measured (IntensitycheckBox) and weightedMoments is True, the centroid and
+    second moments of every slice weighted by the pixel brightness, for example calibrated to
+    mineral density, are added to the table. brightnessPercentiles is a list of percentiles (0 to
+    100) of the pixel brightness of every slice to add to the table.
     """
 
     import numpy as np
     import time
+    from SegmentGeometryLib import Profiling, SectionFeret, SectionMetrics, SectionMoments, SectionPerimeter, SectionTable, SegmentBatch, SliceChunks
 
     start = time.time()
     logging.info('Processing started')
@@ -1213,15 +1184,14 @@ class SegmentGeometryLogic(ScriptedLoadableModuleLogic):
 
     if not segmentationNode:
       raise ValueError("Segmentation node is invalid")
+
+    if perimeterMethod not in SectionPerimeter.PERIMETER_METHODS:
+      raise ValueError("Invalid perimeter method: "+perimeterMethod)
     
-    if axis=="R (Yellow)":
-      axisIndex = 0
-    elif axis=="A (Green)":
-      axisIndex = 1
-    elif axis=="S (Red)":
-      axisIndex = 2
-    else:
-      raise ValueError("Invalid axis name: "+axis)
+    axisIndex = axisIndexFromName(axis)
+
+    self.orientationState = None
+    self.normalizationState = None
 
     # Make a table and set the first column as the slice number. 
     tableNode.RemoveAllColumns()
@@ -1235,6 +1205,23 @@ class SegmentGeometryLogic(ScriptedLoadableModuleLogic):
     plotChartNode.SetXAxisTitle("Percent of Length")
     plotChartNode.SetYAxisTitle('Second Moment of Area (mm^4)')
     
+    # temporary nodes are only needed if the volume has to be resampled: by the segment transform to
+    # measure the brightness, or isotropically if asked for
+    spacing = volumeNode.GetSpacing()
+    anisotropic = spacing[0] != spacing[1] or spacing[0] != spacing[2] or spacing[1] != spacing[2]
+    sceneExport = (sceneFree == False or (IntensitycheckBox == True and segmentationNode.GetTransformNodeID() != None)
+                   or (anisotropic and resampleAnisotropic == True))
+
+    # arrays of an earlier run can be reused if nothing they depend on has changed
+    if CompactnesscheckBox == True:
+      exportIDs = [segmentNode, areaSegmentID]
+    else:
+      exportIDs = [segmentNode]
+    cacheKeys = {}
+    for segmentID in exportIDs:
+      cacheKeys[segmentID] = self.labelmapCacheKey(segmentationNode, segmentID, volumeNode, IntensitycheckBox == True and segmentID == segmentNode, sceneExport)
+    cacheMiss = any(key not in self.labelmapCache for key in cacheKeys.values())
+
     # move segment to the center of the volume
     segcentroid_ras = segmentationNode.GetSegmentCenterRAS(segmentNode)
     volumeBounds = [0,]*6
@@ -1249,7 +1236,7 @@ class SegmentGeometryLogic(ScriptedLoadableModuleLogic):
       Centroid_diff[i] = (segcentroid_ras[i] -  roiCenter[i])
       
     trans = segmentationNode.GetTransformNodeID()
-    if trans != None:
+    if trans != None and sceneExport == True:
       trans = slicer.mrmlScene.GetNodeByID(segmentationNode.GetTransformNodeID())
       og_matrix = vtk.vtkMatrix4x4()
       trans.GetMatrixTransformToParent(og_matrix)
@@ -1274,10 +1261,11 @@ class SegmentGeometryLogic(ScriptedLoadableModuleLogic):
     for i in range(0,3):
       roiCenter[i] = (combinedBounds[i*2+1] + combinedBounds[i*2])/2
       roiRadius[i] = (combinedBounds[i*2+1] - combinedBounds[i*2])/2
-    roi=slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsROINode", "TempMarkupsROI")
-    roi.SetDisplayVisibility(0)
-    roi.SetXYZ(roiCenter[0], roiCenter[1], roiCenter[2])
-    roi.SetRadiusXYZ(roiRadius[0], roiRadius[1], roiRadius[2])        
+    if sceneExport == True:
+      roi=slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsROINode", "TempMarkupsROI")
+      roi.SetDisplayVisibility(0)
+      roi.SetXYZ(roiCenter[0], roiCenter[1], roiCenter[2])
+      roi.SetRadiusXYZ(roiRadius[0], roiRadius[1], roiRadius[2])        
 
     boxflag = 0
     for i in range(6):
@@ -1288,11 +1276,11 @@ class SegmentGeometryLogic(ScriptedLoadableModuleLogic):
     spacingflag = 0
     spacing = volumeNode.GetSpacing() 
     trans = segmentationNode.GetTransformNodeID()
-    if spacing[0] != spacing[1] or spacing[0] != spacing[2] or spacing[1] != spacing[2]:
+    if (spacing[0] != spacing[1] or spacing[0] != spacing[2] or spacing[1] != spacing[2]) and resampleAnisotropic == True:
       spacingflag = 1
    
-    # if segment is outside volume or volume is anisotropic, use crop volume
-    if boxflag == 1 or spacingflag == 1:
+    # if segment is outside volume or volume is to be resampled isotropically, use crop volume
+    if (boxflag == 1 or spacingflag == 1) and cacheMiss == True and sceneExport == True:
       volumetransformNode = volumeNode.GetTransformNodeID()
       volumeNode.SetAndObserveTransformNodeID(None)
       volumesLogic = slicer.modules.volumes.logic()
@@ -1302,7 +1290,7 @@ class SegmentGeometryLogic(ScriptedLoadableModuleLogic):
       parameters.SetInputVolumeNodeID(volumeNode.GetID())
       parameters.SetOutputVolumeNodeID(newVolume.GetID())
       parameters.SetROINodeID(roi.GetID())
-      if volumetransformNode != None and spacingflag == 1:
+      if spacingflag == 1:
         parameters.SetIsotropicResampling(True)
       slicer.modules.cropvolume.logic().Apply(parameters)
       volumeNode.SetAndObserveTransformNodeID(volumetransformNode)
@@ -1313,176 +1301,97 @@ class SegmentGeometryLogic(ScriptedLoadableModuleLogic):
       slicer.mrmlScene.RemoveNode(parameters)
 
     
+    # table columns of the selected properties, in table order
+    names = ["Segment", "Slice Index", "Percent (%)"]
+    if LengthcheckBox == True:
+      names += ["Length (mm)"]
+    if FeretcheckBox == True:
+      names += ["Max Feret Diameter (mm)", "Min Feret Diameter (mm)"]
+    if FeretcheckBox == True and feretAngles == True:
+      names += ["Max Feret Angle (deg)", "Min Feret Angle (deg)"]
+    if PerimcheckBox == True:
+      names += ["Perimeter (mm)"]
+    if volumeNode != None and IntensitycheckBox == True:
+      names += ["Mean Brightness"]
+    if volumeNode != None and IntensitycheckBox == True and brightnessPercentiles is not None:
+      names += [SectionTable.percentileName(percentile) for percentile in brightnessPercentiles]
+    if volumeNode != None and IntensitycheckBox == True and weightedMoments == True:
+      names += ["Weighted CSA", "Weighted Cx", "Weighted Cy", "Weighted Theta (deg)", "Weighted Ix", "Weighted Iy",
+                "Weighted Ixy", "Weighted Jz", "Weighted Iminor", "Weighted Imajor"]
+    if CSAcheckBox == True:
+      names += ["CSA (mm^2)"]
+    if CompactnesscheckBox == True:
+      names += ["Compactness"]
+    if CentroidcheckBox == True:
+      names += ["Cx", "Cy"]
+    if ThetacheckBox == True:
+      names += ["Theta (deg)"]
+    if SMAcheckBox_1 == True:
+      names += ["Iminor (mm^4)", "Imajor (mm^4)"]
+    if MODcheckBox_1 == True:
+      names += ["Zminor (mm^3)", "Zmajor (mm^3)"]
+    if RcheckBox == True:
+      names += ["Rminor (mm)", "Rmajor (mm)"]
+    if JzcheckBox == True:
+      names += ["Jz (mm^4)"]
+    if ZpolcheckBox == True:
+      names += ["Zpol (mm^3)"]
+    if RcheckBox == True and ZpolcheckBox == True:
+      names += ["Rmax (mm)"]
+    if OrientationcheckBox == True and SMAcheckBox_1 == True:
+      names += ["Ina (mm^4)", "Ila (mm^4)"]
+    if OrientationcheckBox == True and MODcheckBox_1 == True:
+      names += ["Zna (mm^3)", "Zla (mm^3)"]
+    if RcheckBox == True and OrientationcheckBox == True:
+      names += ["Rna (mm)", "Rla (mm)"]
+    if DoubecheckBox == True and CSAcheckBox == True:
+      names += ["CSA (LenNorm)"]
+    if DoubecheckBox == True and SMAcheckBox_1 == True:
+      names += ["Iminor (LenNorm)", "Imajor (LenNorm)"]
+    if DoubecheckBox == True and MODcheckBox_1 == True:
+      names += ["Zminor (LenNorm)", "Zmajor (LenNorm)"]
+    if DoubecheckBox == True and SMAcheckBox_1 == True and OrientationcheckBox == True:
+      names += ["Ina (LenNorm)", "Ila (LenNorm)"]
+    if DoubecheckBox == True and MODcheckBox_1 == True and OrientationcheckBox == True:
+      names += ["Zla (LenNorm)", "Zna (LenNorm)"]
+    if DoubecheckBox == True and JzcheckBox == True:
+      names += ["Jz (LenNorm)"]
+    if DoubecheckBox == True and ZpolcheckBox == True:
+      names += ["Zpol (LenNorm)"]
+    if SummerscheckBox == True and SMAcheckBox_1 == True:
+      names += ["Iminor (MatNorm)", "Imajor (MatNorm)"]
+    if SummerscheckBox == True and MODcheckBox_1 == True:
+      names += ["Zminor (MatNorm)", "Zmajor (MatNorm)"]
+    if SummerscheckBox == True and JzcheckBox == True:
+      names += ["Jz (MatNorm)"]
+    if SummerscheckBox == True and ZpolcheckBox == True:
+      names += ["Zpol (MatNorm)"]
+    if SummerscheckBox == True and SMAcheckBox_1 == True and OrientationcheckBox == True:
+      names += ["Ina (MatNorm)", "Ila (MatNorm)"]
+    if SummerscheckBox == True and MODcheckBox_1 == True and OrientationcheckBox == True:
+      names += ["Zna (MatNorm)", "Zla (MatNorm)"]
+
+    # only evaluate the metrics that the selected columns are derived from
+    if SMAcheckBox_1 == True or MODcheckBox_1 == True:
+      required = SectionMetrics.requiredMetrics(names + ["AspectRatio"])
+    else:
+      required = SectionMetrics.requiredMetrics(names)
+
+    report = Profiling.StageReport(traceMemory)
+    self.lastReport = report
+
     # do calculations
     try:
+      report.start()
       # Create temporary volume node
-      tempSegmentLabelmapVolumeNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLLabelMapVolumeNode', "SegmentGeometryTemp")
+      tempSegmentLabelmapVolumeNode = None
+      if sceneExport == True:
+        tempSegmentLabelmapVolumeNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLLabelMapVolumeNode', "SegmentGeometryTemp")
       # Create flag for the aspect ratio check
       FdiamMin = None
       eulerflag = 1  
 
       
-      #### CREATE ARRAYS FOR ALL COLUMNS ####
-      sliceNumberArray = vtk.vtkIntArray()
-      sliceNumberArray.SetName("Slice Index")
-          
-      SegmentNameArray = vtk.vtkStringArray()
-      SegmentNameArray.SetName("Segment")
-          
-      percentLengthArray = vtk.vtkFloatArray()
-      percentLengthArray.SetName("Percent (%)")
-
-      LengthArray = vtk.vtkFloatArray()
-      LengthArray.SetName("Length (mm)")
-        
-      areaArray = vtk.vtkFloatArray()
-      areaArray.SetName("CSA (mm^2)")
-      
-      meanIntensityArray = vtk.vtkFloatArray()
-      meanIntensityArray.SetName("Mean Brightness")
-      
-      CxArray = vtk.vtkFloatArray()
-      CxArray.SetName("Cx")
-      
-      CyArray = vtk.vtkFloatArray()
-      CyArray.SetName("Cy")
-      
-      JzArray = vtk.vtkFloatArray()
-      JzArray.SetName("Jz (mm^4)")
-              
-      ImajorArray = vtk.vtkFloatArray()
-      ImajorArray.SetName("Imajor (mm^4)")
-        
-      IminorArray = vtk.vtkFloatArray()
-      IminorArray.SetName("Iminor (mm^4)")
-                    
-      ThetaMinArray = vtk.vtkFloatArray()
-      ThetaMinArray.SetName("Theta (deg)")
-      
-      ThetaMaxArray = vtk.vtkFloatArray()
-      ThetaMaxArray.SetName("Theta major (deg)")
-      
-      ZmajorArray = vtk.vtkFloatArray()
-      ZmajorArray.SetName("Zmajor (mm^3)")
-        
-      ZminorArray = vtk.vtkFloatArray()
-      ZminorArray.SetName("Zminor (mm^3)")
-      
-      ZpolArray = vtk.vtkFloatArray()
-      ZpolArray.SetName("Zpol (mm^3)")
-                    
-      RmajorArray = vtk.vtkFloatArray()
-      RmajorArray.SetName("Rmajor (mm)")
-        
-      RminorArray = vtk.vtkFloatArray()
-      RminorArray.SetName("Rminor (mm)")
-      
-      RmaxArray = vtk.vtkFloatArray()
-      RmaxArray.SetName("Rmax (mm)")
-              
-      InaArray = vtk.vtkFloatArray()
-      InaArray.SetName("Ina (mm^4)")
-        
-      IlaArray = vtk.vtkFloatArray()
-      IlaArray.SetName("Ila (mm^4)")
-      
-      ZnaArray = vtk.vtkFloatArray()
-      ZnaArray.SetName("Zna (mm^3)")
-        
-      ZlaArray = vtk.vtkFloatArray()
-      ZlaArray.SetName("Zla (mm^3)")
-      
-      RnaArray = vtk.vtkFloatArray()
-      RnaArray.SetName("Rna (mm)")
-      
-      RlaArray = vtk.vtkFloatArray()
-      RlaArray.SetName("Rla (mm)")
-
-      FeretArray = vtk.vtkFloatArray()
-      FeretArray.SetName("Max Feret Diameter (mm)")
-      
-      MinFeretArray = vtk.vtkFloatArray()
-      MinFeretArray.SetName("Min Feret Diameter (mm)")
-      
-      PerimArray = vtk.vtkFloatArray()
-      PerimArray.SetName("Perimeter (mm)")
-      
-      TotalAreaArray = vtk.vtkFloatArray()
-      TotalAreaArray.SetName("TCSA (mm^2)")
-            
-      CompactnessArray = vtk.vtkFloatArray()
-      CompactnessArray.SetName("Compactness")
-      
-      CircularityArray = vtk.vtkFloatArray()
-      CircularityArray.SetName("Circularity")
-      
-      #create arrays for unitless metrics with Doube method
-      if DoubecheckBox == True:
-        areaArray_Doube = vtk.vtkFloatArray()
-        areaArray_Doube.SetName("CSA (LenNorm)")
-
-        ImajorArray_Doube = vtk.vtkFloatArray()
-        ImajorArray_Doube.SetName("Imajor (LenNorm)")
-        
-        IminorArray_Doube = vtk.vtkFloatArray()
-        IminorArray_Doube.SetName("Iminor (LenNorm)")
-
-        ZmajorArray_Doube = vtk.vtkFloatArray()
-        ZmajorArray_Doube.SetName("Zmajor (LenNorm)")
-        
-        ZminorArray_Doube = vtk.vtkFloatArray()
-        ZminorArray_Doube.SetName("Zminor (LenNorm)")
-                
-        InaArray_Doube = vtk.vtkFloatArray()
-        InaArray_Doube.SetName("Ina (LenNorm)")
-        
-        IlaArray_Doube = vtk.vtkFloatArray()
-        IlaArray_Doube.SetName("Ila (LenNorm)")
-        
-        ZnaArray_Doube = vtk.vtkFloatArray()
-        ZnaArray_Doube.SetName("Zna (LenNorm)")
-        
-        ZlaArray_Doube = vtk.vtkFloatArray()
-        ZlaArray_Doube.SetName("Zla (LenNorm)")
-        
-        JzArray_Doube = vtk.vtkFloatArray()
-        JzArray_Doube.SetName("Jz (LenNorm)")
-        
-        ZpolArray_Doube = vtk.vtkFloatArray()
-        ZpolArray_Doube.SetName("Zpol (LenNorm)")
-
-
-      if SummerscheckBox == True:
-        ImajorArray_Summers = vtk.vtkFloatArray()
-        ImajorArray_Summers.SetName("Imajor (MatNorm)")
-        
-        IminorArray_Summers = vtk.vtkFloatArray()
-        IminorArray_Summers.SetName("Iminor (MatNorm)")
-        
-        ZminorArray_Summers = vtk.vtkFloatArray()       
-        ZminorArray_Summers.SetName("Zminor (MatNorm)")
-        
-        ZmajorArray_Summers = vtk.vtkFloatArray()       
-        ZmajorArray_Summers.SetName("Zmajor (MatNorm)")
-        
-        InaArray_Summers = vtk.vtkFloatArray()
-        InaArray_Summers.SetName("Ina (MatNorm)")
-        
-        IlaArray_Summers = vtk.vtkFloatArray()
-        IlaArray_Summers.SetName("Ila (MatNorm)") 
-        
-        ZnaArray_Summers = vtk.vtkFloatArray()       
-        ZnaArray_Summers.SetName("Zna (MatNorm)")
-        
-        ZlaArray_Summers = vtk.vtkFloatArray()       
-        ZlaArray_Summers.SetName("Zla (MatNorm)")
-
-        JzArray_Summers = vtk.vtkFloatArray()
-        JzArray_Summers.SetName("Jz (MatNorm)")
-
-        ZpolArray_Summers = vtk.vtkFloatArray()
-        ZpolArray_Summers.SetName("Zpol (MatNorm)")
-              
       # leave in the capabilities to go back to multiple segments
       if CompactnesscheckBox == True:
         segmentindex = [segmentNode, areaSegmentID]
@@ -1493,808 +1402,117 @@ class SegmentGeometryLogic(ScriptedLoadableModuleLogic):
         segment = segmentationNode.GetSegmentation().GetSegment(segmentID)
         segName = segment.GetName()
 
-        segmentList = vtk.vtkStringArray()
-        segmentList.InsertNextValue(segmentID)
-        
-        volumesLogic = slicer.modules.volumes.logic()
-        if volumeNode != None:   
-          # Create volume for output
-          volumetransformNode = volumeNode.GetTransformNodeID()
-          volumeNode.SetAndObserveTransformNodeID(None)
-          outputVolume = slicer.util.getFirstNodeByName(segName + " SegmentGeometry Resampled Volume")
-          if outputVolume != None:
-            slicer.mrmlScene.RemoveNode(outputVolume) 
-          outputVolume = volumesLogic.CloneVolumeGeneric(slicer.mrmlScene, volumeNode, segName + " SegmentGeometry Resampled Volume")
-          outputVolume.SetName(segName + " SegmentGeometry Resampled Volume")
-          
-          
-          # resample volume if user is calculating mean pixel brightness and has a transformed segment
-          transformNode = segmentationNode.GetNodeReferenceID('transform')
-          if IntensitycheckBox == True and transformNode != None and segmentID == segmentNode:
-            parameters = {}
-            parameters["inputVolume"] = volumeNode
-            parameters["outputVolume"] = outputVolume
-            parameters["referenceVolume"] = volumeNode
-            parameters["transformationFile"] = transformNode
-            resampleScalarVectorDWI = slicer.modules.resamplescalarvectordwivolume
-            cliNode = slicer.cli.runSync(resampleScalarVectorDWI, None, parameters)
-            if cliNode.GetStatus() & cliNode.ErrorsMask:
-              # error
-              errorText = cliNode.GetErrorText()
-              slicer.mrmlScene.RemoveNode(cliNode)
-              raise ValueError("CLI execution failed: " + errorText)
-  
-            outputvolume = slicer.vtkSlicerVolumesLogic().CloneVolume(slicer.mrmlScene,outputVolume, segName + " Resampled Brightness Volume",True)
-            slicer.mrmlScene.RemoveNode(cliNode)
-            slicer.mrmlScene.RemoveNode(outputvolume)
-          volumeNodeformasking = outputVolume
-          volumeNode.SetAndObserveTransformNodeID(volumetransformNode)
-          
-        # Crop temporary volume to avoid computing on empty slices
-        maskExtent = [0] * 6
-        fillValue = 0
-        import SegmentEditorEffects
-        if not hasattr(SegmentEditorEffects,'SegmentEditorMaskVolumeEffect'):
-          # Slicer 4.11 and earlier - Mask volume is in an extension
-          import SegmentEditorMaskVolumeLib
-          maskVolumeWithSegment = SegmentEditorMaskVolumeLib.SegmentEditorEffect.maskVolumeWithSegment
-        else:        
-          maskVolumeWithSegment = SegmentEditorEffects.SegmentEditorMaskVolumeEffect.maskVolumeWithSegment
-        if IntensitycheckBox == True:
-          maskVolumeWithSegment(segmentationNode, segmentID, "FILL_OUTSIDE", [0], volumeNodeformasking, outputVolume, maskExtent) 
-        else: maskVolumeWithSegment(segmentationNode, segmentID, "FILL_INSIDE_AND_OUTSIDE", [1,0], volumeNodeformasking, outputVolume, maskExtent) 
-        extent = maskExtent 
-          
-        # Calculate the new origin
-        ijkToRas = vtk.vtkMatrix4x4()
-        outputVolume.GetIJKToRASMatrix(ijkToRas)
-        origin_IJK = [extent[0], extent[2], extent[4], 1]
-        origin_RAS = ijkToRas.MultiplyPoint(origin_IJK)
-          
-        # Pad and crop
-        padFilter = vtk.vtkImageConstantPad()
-        padFilter.SetInputData(outputVolume.GetImageData())
-        padFilter.SetOutputWholeExtent(extent)
-        padFilter.Update()
-        paddedImg = padFilter.GetOutput()
-
-        # Normalize output image
-        paddedImg.SetOrigin(0,0,0)
-        paddedImg.SetSpacing(1.0, 1.0, 1.0)
-        paddedImg.SetExtent(0, extent[1]-extent[0], 0, extent[3]-extent[2], 0, extent[5]-extent[4])
-        outputVolume.SetAndObserveImageData(paddedImg)
-        outputVolume.SetOrigin(origin_RAS[0], origin_RAS[1], origin_RAS[2])
-        
-            
-        if not slicer.modules.segmentations.logic().ExportSegmentsToLabelmapNode(segmentationNode, segmentList, tempSegmentLabelmapVolumeNode, outputVolume):
-          continue
-          
-        if volumeNode != None:  
-          # create array to calculate intensity
-          while True:
-            try:
-              voxelArray = slicer.util.arrayFromVolume(outputVolume)
-              break
-            except ValueError:
-              raise ValueError("The segment is outside of the volume's bounds!")   
-
-
-        # remove temporary output volume node if compactness is measured
-        if segmentID == areaSegmentID and areaSegmentID != segmentNode:
-          slicer.mrmlScene.RemoveNode(outputVolume)
-        
-        if volumeNode == None:
-          slicer.mrmlScene.RemoveNode(volumeNodeformasking)
-
-
-        # volumeExtents so first and last number of images in XYZ directions. Starts with 0 not 1	
-        volumeExtents = tempSegmentLabelmapVolumeNode.GetImageData().GetExtent()
-        numSlices = volumeExtents[axisIndex*2+1] - volumeExtents[axisIndex*2] + 1
+        # reuse the arrays of an earlier run if the segment, the volume and their transforms did not change
+        with report.stage("labelmap", segment=segName):
+          cacheEntry = self.labelmapCache.get(cacheKeys[segmentID])
+          if cacheEntry is None:
+            if sceneExport == True:
+              cacheEntry = self.exportSegmentArrays(segmentationNode, segmentID, volumeNode, tempSegmentLabelmapVolumeNode,
+                                                    IntensitycheckBox == True and segmentID == segmentNode, segmentID == segmentNode)
+            else:
+              cacheEntry = self.segmentArrays(segmentationNode, segmentID, volumeNode, IntensitycheckBox == True and segmentID == segmentNode)
+            if cacheEntry is None:
+              continue
+            self.labelmapCache.put(cacheKeys[segmentID], cacheEntry)
+        narray = cacheEntry["labelArray"]
+        spacing = cacheEntry["spacing"]
+        voxelArray = cacheEntry["voxelArray"]
+
+        numSlices = narray.shape[2-axisIndex]
         
         # determine how many and which slices to calculate statistics for
-        if interval > 0:
-          resample = np.arange(interval, stop = 101, step = interval)
-          sampleSlices = numSlices * (resample / 100)
-          sampleSlices = sampleSlices - 1
-          sampleSlices = np.rint(sampleSlices)
-          sampleSlices = sampleSlices.astype(int)
-          if numSlices < 100:
-            resample = numSlices
-            sampleSlices = np.asarray(list(range(0,numSlices)))
-
-        elif interval == 0:
-          resample = numSlices
-          sampleSlices = np.asarray(list(range(0,numSlices)))
-        percentLength = np.around((sampleSlices+1) / numSlices * 100,1)
-          
-        # determine centroid of the first and last slice. Identical if only one slice
-        startPosition_Ijk = [
-          (volumeExtents[0]+volumeExtents[1])/2.0 if axisIndex!=0 else volumeExtents[0],
-          (volumeExtents[2]+volumeExtents[3])/2.0 if axisIndex!=1 else volumeExtents[2],
-          (volumeExtents[4]+volumeExtents[5])/2.0 if axisIndex!=2 else volumeExtents[4],
-          1
-        ]
-        endPosition_Ijk = [
-          (volumeExtents[0]+volumeExtents[1])/2.0 if axisIndex!=0 else volumeExtents[1],
-          (volumeExtents[2]+volumeExtents[3])/2.0 if axisIndex!=1 else volumeExtents[3],
-          (volumeExtents[4]+volumeExtents[5])/2.0 if axisIndex!=2 else volumeExtents[5],
-          1
-        ]
-        # Get physical coordinates from voxel coordinates
-        volumeIjkToRas = vtk.vtkMatrix4x4()
-        tempSegmentLabelmapVolumeNode.GetIJKToRASMatrix(volumeIjkToRas)
-        startPosition_Ras = np.array([0.0,0.0,0.0,1.0])
-        volumeIjkToRas.MultiplyPoint(startPosition_Ijk, startPosition_Ras)
-        endPosition_Ras = np.array([0.0,0.0,0.0,1.0])
-        volumeIjkToRas.MultiplyPoint(endPosition_Ijk, endPosition_Ras)
-        volumePositionIncrement_Ras = np.array([0,0,0,1])
-        if numSlices > 1:
-          volumePositionIncrement_Ras = (endPosition_Ras - startPosition_Ras) / (numSlices - 1.0)
-
-        # If volume node is transformed, apply that transform to get volume's RAS coordinates
-        transformVolumeRasToRas = vtk.vtkGeneralTransform()
-        slicer.vtkMRMLTransformNode.GetTransformBetweenNodes(tempSegmentLabelmapVolumeNode.GetParentTransformNode(), None, transformVolumeRasToRas)
-
-        if segmentID == segmentNode:
-          if interval > 0:
-            for i in range(len(sampleSlices)):
-              sliceNumberArray.InsertNextValue(sampleSlices[i]) # adds slice number to the array
-              SegmentNameArray.InsertNextValue(segName)
-              percentLengthArray.InsertNextValue(percentLength[i])
-              
-          else:
-            for i in range(numSlices):
-              sliceNumberArray.InsertNextValue(sampleSlices[i]) # adds slice number to the array
-              SegmentNameArray.InsertNextValue(segName)
-              percentLengthArray.InsertNextValue(percentLength[i])
-
+        sampleSlices, percentLength = SegmentBatch.sampleSliceIndices(numSlices, interval)
 
         ###### DO CALCULATIONS ######
-        spacing = tempSegmentLabelmapVolumeNode.GetSpacing()
-        narray = slicer.util.arrayFromVolume(tempSegmentLabelmapVolumeNode)
         #if spacing[0] != spacing[1] or spacing[0] != spacing[2] or spacing[1] != spacing[2]:
         #  raise ValueError("Voxels are anisotropic! Resample the volume")            
   
-        if axisIndex == 0:
-          PixelDepthMm = spacing[0] # get mm for length
-          PixelHeightMm = spacing[2]
-          PixelWidthMm = spacing[1]
-          areaOfPixelMm2 = PixelHeightMm * PixelWidthMm
-          unitOfPixelMm4 = PixelHeightMm**2 * PixelWidthMm**2
-        elif axisIndex == 1:
-          PixelDepthMm = spacing[1] # get mm for length
-          PixelHeightMm = spacing[2]
-          PixelWidthMm = spacing[0]
-          areaOfPixelMm2 = PixelHeightMm * PixelWidthMm
-          unitOfPixelMm4 = PixelHeightMm**2 * PixelWidthMm**2
-        elif axisIndex == 2:
-          PixelDepthMm = spacing[2] # get mm for length
-          PixelHeightMm = spacing[1]
-          PixelWidthMm = spacing[0]
-          areaOfPixelMm2 = PixelHeightMm * PixelWidthMm
-          unitOfPixelMm4 = PixelHeightMm**2 * PixelWidthMm**2
-
-        for i in sampleSlices:
-          if axisIndex == 0:
-            slicetemp = narray[:, :, i] # get the ijk coordinates for all voxels in the label map
-            CSA = np.count_nonzero(narray[:,:,i])
-            if volumeNode != None and IntensitycheckBox == True:
-              meanIntensity = np.mean(voxelArray[:,:,i][np.where(voxelArray[:,:,i])]) 
-          elif axisIndex == 1:
-            slicetemp = narray[:, i, :] # get the ijk coordinates for all voxels in the label map     
-            CSA = np.count_nonzero(narray[:, i, :])
-            if volumeNode != None and IntensitycheckBox == True:
-              meanIntensity = np.mean(voxelArray[:,i,:][np.where(voxelArray[:,i,:])]) 
-          elif axisIndex == 2:
-            slicetemp = narray[i, :, :] # get the ijk coordinates for all voxels in the label map
-            CSA = np.count_nonzero(narray[i, :, :])
-            if volumeNode != None and IntensitycheckBox == True:
-              meanIntensity = np.mean(voxelArray[i,:,:][np.where(voxelArray[i, :, :])]) 
-
-          if segmentID == segmentNode:
-          # add values to calculations 
-            LengthArray.InsertNextValue((numSlices * PixelDepthMm))         
-            Length = (numSlices * PixelDepthMm)
-            areaArray.InsertNextValue((CSA * areaOfPixelMm2))
-            if volumeNode != None and IntensitycheckBox == True:
-              meanIntensityArray.InsertNextValue((meanIntensity)) 
-            # do size correction
-            if DoubecheckBox == True:
-              areaArray_Doube.InsertNextValue((np.sqrt(CSA) / numSlices))
-              
-          if segmentID == areaSegmentID:
-            TotalAreaArray.InsertNextValue((CSA * areaOfPixelMm2))    
-           
-          coords_Kji = np.where(slicetemp > 0)
-          coords_Ijk = [coords_Kji[1], coords_Kji[0]]
-
-          if np.count_nonzero(slicetemp) == 0 and PerimcheckBox == True:
-            PerimArray.InsertNextValue(0)
-            CircularityArray.InsertNextValue(0)
-           
-          # calculate perimeter
-          elif segmentID == segmentNode and PerimcheckBox == True:
-            startx = min(coords_Ijk[0])  
-            starty = max(coords_Ijk[1][coords_Ijk[0] == startx])
-            perimx = startx
-            perimy = starty
-            prevx = startx
-            prevy = starty
-            dire = "N"
-          
-            while True:
-            
-              if dire == "N":
-                quad = "Q1"
-              elif dire == "NE" or dire == "E":
-                quad = "Q2"
-              elif dire == "SE" or dire == "S":
-                quad = "Q3"
-              elif dire == "SW":
-                quad = "Q4"
-              elif dire == "W" or dire == "NW":
-                quad = "Q5"
-              
-              right = coords_Ijk[1][coords_Ijk[0]==prevx+1]        
-              vert = coords_Ijk[1][coords_Ijk[0]==prevx] 
-              left = coords_Ijk[1][coords_Ijk[0]==prevx-1]   
-                        
-              if quad == "Q1":
-                if any(left == prevy):
-                  dire = "W"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy)
-                  prevx = prevx-1
-                  prevy = prevy               
-                elif any(left == prevy+1):
-                  dire = "NW"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx-1
-                  prevy = prevy+1   
-                elif any(vert == prevy+1):
-                  dire = "N"
-                  perimx = np.append(perimx,prevx)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx
-                  prevy = prevy+1 
-                elif any(right == prevy+1):
-                  dire = "NE"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx+1
-                  prevy = prevy+1  
-                elif any(right == prevy):
-                  dire = "E"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy)
-                  prevx = prevx+1
-                  prevy = prevy 
-                elif any(right == prevy-1):
-                  dire = "SE"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx+1
-                  prevy = prevy-1 
-                elif any(vert == prevy-1):
-                  dire = "S"
-                  perimx = np.append(perimx,prevx)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx
-                  prevy = prevy-1 
-                elif any(left == prevy -1):
-                  dire = "SW"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx-1
-                  prevy = prevy-1 
-
-              if quad == "Q2":
-                if any(left == prevy+1):
-                  dire = "NW"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx-1
-                  prevy = prevy+1   
-                elif any(vert == prevy+1):
-                  dire = "N"
-                  perimx = np.append(perimx,prevx)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx
-                  prevy = prevy+1 
-                elif any(right == prevy+1):
-                  dire = "NE"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx+1
-                  prevy = prevy+1  
-                elif any(right == prevy):
-                  dire = "E"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy)
-                  prevx = prevx+1
-                  prevy = prevy 
-                elif any(right == prevy-1):
-                  dire = "SE"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx+1
-                  prevy = prevy-1 
-                elif any(vert == prevy-1):
-                  dire = "S"
-                  perimx = np.append(perimx,prevx)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx
-                  prevy = prevy-1 
-                elif any(left == prevy -1):
-                  dire = "SW"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx-1
-                  prevy = prevy-1 
-                elif any(left == prevy):
-                  dire = "W"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy)
-                  prevx = prevx-1
-                  prevy = prevy 
-                
-                
-              if quad == "Q3":
-                if any(right == prevy+1):
-                  dire = "NE"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx+1
-                  prevy = prevy+1  
-                elif any(right == prevy):
-                  dire = "E"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy)
-                  prevx = prevx+1
-                  prevy = prevy 
-                elif any(right == prevy-1):
-                  dire = "SE"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx+1
-                  prevy = prevy-1 
-                elif any(vert == prevy-1):
-                  dire = "S"
-                  perimx = np.append(perimx,prevx)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx
-                  prevy = prevy-1 
-                elif any(left == prevy -1):
-                  dire = "SW"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx-1
-                  prevy = prevy-1 
-                elif any(left == prevy):
-                  dire = "W"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy)
-                  prevx = prevx-1
-                  prevy = prevy              
-                elif any(left == prevy +1):
-                  dire = "NW"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx-1
-                  prevy = prevy+1   
-                elif any(vert == prevy+1):
-                  dire = "N"
-                  perimx = np.append(perimx,prevx)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx
-                  prevy = prevy+1 
-
-              if quad == "Q4":
-                if any(right == prevy-1):
-                  dire = "SE"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx+1
-                  prevy = prevy-1 
-                elif any(vert == prevy-1):
-                  dire = "S"
-                  perimx = np.append(perimx,prevx)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx
-                  prevy = prevy-1 
-                elif any(left == prevy -1):
-                  dire = "SW"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx-1
-                  prevy = prevy-1 
-                elif any(left == prevy):
-                  dire = "W"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy)
-                  prevx = prevx-1
-                  prevy = prevy               
-                elif any(left == prevy +1):
-                  dire = "NW"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx-1
-                  prevy = prevy+1   
-                elif any(vert == prevy+1):
-                  dire = "N"
-                  perimx = np.append(perimx,prevx)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx
-                  prevy = prevy+1 
-                elif any(right == prevy+1):
-                  dire = "NE"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx+1
-                  prevy = prevy+1  
-                elif any(right == prevy):
-                  dire = "E"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy)
-                  prevx = prevx+1
-                  prevy = prevy 
-
-              if quad == "Q5":
-                if any(left == prevy -1):
-                  dire = "SW"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx-1
-                  prevy = prevy-1 
-                elif any(left == prevy):
-                  dire = "W"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy)
-                  prevx = prevx-1
-                  prevy = prevy               
-                elif any(left == prevy +1):
-                  dire = "NW"
-                  perimx = np.append(perimx,prevx-1)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx-1
-                  prevy = prevy+1   
-                elif any(vert == prevy+1):
-                  dire = "N"
-                  perimx = np.append(perimx,prevx)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx
-                  prevy = prevy+1              
-                elif any(right == prevy+1):
-                  dire = "NE"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy+1)
-                  prevx = prevx+1
-                  prevy = prevy+1  
-                elif any(right == prevy):
-                  dire = "E"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy)
-                  prevx = prevx+1
-                  prevy = prevy 
-                elif any(right == prevy-1):
-                  dire = "SE"
-                  perimx = np.append(perimx,prevx+1)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx+1
-                  prevy = prevy-1 
-                elif any(vert == prevy-1):
-                  dire = "S"
-                  perimx = np.append(perimx,prevx)
-                  perimy = np.append(perimy,prevy-1)
-                  prevx = prevx
-                  prevy = prevy-1 
-                
-              if prevx == startx and prevy == starty:
-                break
-               
-            perimeter = 0
-            if isinstance(perimx,np.int64):
-              perimeter = 4
-            else:
-              for p in range(len(perimx)-1):
-                perimeter = perimeter +  np.sqrt((perimx[p+1]-perimx[p])**2+(perimy[p+1]-perimy[p])**2)
-              perimeter = perimeter + np.sqrt((perimx[0]-perimx[len(perimx)-1])**2+(perimy[0]-perimy[len(perimy)-1])**2)
-            PerimArray.InsertNextValue(perimeter * PixelWidthMm)
-            Circularity = 4*np.pi*CSA*areaOfPixelMm2/(perimeter*PixelWidthMm)**2
-            CircularityArray.InsertNextValue(Circularity)
-          
-          # calculate maximum diameter manually using all points
-          # TODO: calculate convex hull without python packages
-          #if segmentID == segmentNode:
-          #  Fdiam = 0
-          #  if np.count_nonzero(slicetemp) == 0:
-          #    Fdiam = 0
-          #  elif isinstance(coords_Ijk[0],np.int64):
-          #    Fdiam = 1
-          #  elif len(coords_Ijk[0]) == 2:
-          #    Fdiam = 2
-          #  elif len(coords_Ijk[0]) >= 3: 
-          #    for h in range(len(coords_Ijk[0])):
-          #      x1 = coords_Ijk[0][h]
-          #      y1 = coords_Ijk[1][h]
-          #      for j in range(len(coords_Ijk[0])):
-          #        x2 = coords_Ijk[0][j]
-          #        y2 = coords_Ijk[1][j]
-          #        Fdiam = max(Fdiam, np.sqrt((x2-x1)**2 +(y2-y1)**2) * PixelWidthMm)
-          
-          # function to calculate minimum feret diameter
-          def min_feret(hull_pts):
-            n = len(hull_pts)
-            min_width = np.inf
-
-            for i in range(n):
-              p1 = hull_pts[i]
-              p2 = hull_pts[(i+1) % n]
-
-              edge = p2 - p1
-              edge = edge / np.linalg.norm(edge)
+        # the in-plane pixel sizes, the width along the first of the other two axes
+        PixelWidthMm, PixelHeightMm = [spacing[i] for i in range(3) if i != axisIndex]
+        PixelDepthMm = spacing[axisIndex] # get mm for length
+        areaOfPixelMm2 = PixelHeightMm * PixelWidthMm
 
-              normal = np.array([-edge[1], edge[0]])
-
-              projections = hull_pts @ normal
-              width = projections.max() - projections.min()
-
-              if width < min_width:
-                min_width = width
-
-            return min_width
-          
-          # calculate maximum diameter from convex hull
-          if segmentID == segmentNode:
-            from scipy.spatial.qhull import ConvexHull
-            #from scipy.spatial.distance import euclidean
-            Fdiam = 0
-            MinFdiam = 0
-            if np.count_nonzero(slicetemp) == 0:
-              Fdiam = 0
-              MinFdiam = 0
-            elif isinstance(coords_Ijk[0],np.int64):
-              Fdiam = 1
-              MinFdiam = 1
-            elif len(coords_Ijk[0]) == 2:
-              Fdiam = 2
-              MinFdiam = 1
-            elif len(coords_Ijk[0]) >= 3 and len(set(coords_Ijk[0])) > 1  and len(set(coords_Ijk[1])) > 1: 
-              points = np.concatenate((coords_Ijk[0][:,None],coords_Ijk[1][:,None]),axis = 1)
-              hull = ConvexHull(points)
-              pts2d = points[:, :2] 
-              hull_pts = pts2d[hull.vertices]
-              from scipy.spatial.distance import pdist
-              Fdiam = pdist(hull_pts).max() * PixelWidthMm
-              MinFdiam = min_feret(hull_pts) * PixelWidthMm
-            elif len(coords_Ijk[0]) >= 3 and len(set(coords_Ijk[0])) == 1:  
-              Fdiam = max(coords_Ijk[1]) - min(coords_Ijk[1])
-            elif len(coords_Ijk[1]) >= 3 and len(set(coords_Ijk[1])) == 1:  
-              Fdiam = max(coords_Ijk[0]) - min(coords_Ijk[0])
-        
-              
-            FeretArray.InsertNextValue(Fdiam)
-            MinFeretArray.InsertNextValue(MinFdiam)
-            # find smallest, largest diameter to calculate aspect ratio
+        if segmentID == segmentNode:
+          # pixels that are not square are weighted on the native grid, in units of the pixel width
+          aspect = PixelHeightMm / PixelWidthMm
+
+          # compute the moment based properties of every sampled slice in one pass over the labelmap,
+          # without the moments if only the area is needed and without the hulls if no distance is
+          with report.stage("moments", slices=len(sampleSlices)):
+            sectionTensors = None
+            if "Tensors" not in required:
+              stackProps = SliceChunks.mapSliceChunks(SectionMoments.stackProperties, narray, axisIndex, sampleSlices, workers, None, aspect, required)
+            elif wholeStack == True:
+              sectionTensors = SliceChunks.mapSliceChunks(SectionMoments.stackSectionTensors, narray, axisIndex, sampleSlices, workers, aspect, "Hulls" in required)
+              if OrientationcheckBox == True:
+                stackProps = SectionMoments.tensorProperties(sectionTensors, angle)
+              else:
+                stackProps = SectionMoments.tensorProperties(sectionTensors)
+            elif OrientationcheckBox == True:
+              stackProps = SectionMoments.sliceBySliceProperties(narray, axisIndex, sampleSlices, angle, aspect)
+            else:
+              stackProps = SectionMoments.sliceBySliceProperties(narray, axisIndex, sampleSlices, None, aspect)
+
+            # keep the moment tensors to update the neutral axis columns when the angle changes
+            if OrientationcheckBox == True and "Tensors" in required:
+              if sectionTensors is None:
+                sectionTensors = SliceChunks.mapSliceChunks(SectionMoments.stackSectionTensors, narray, axisIndex, sampleSlices, workers, aspect, "Hulls" in required)
+              self.orientationState = {"tensors": sectionTensors, "tableNode": tableNode, "numSlices": numSlices,
+                                       "pixelWidth": PixelWidthMm, "pixelDepth": PixelDepthMm,
+                                       "doube": DoubecheckBox, "summers": SummerscheckBox}
+
+          # measure the perimeter of every sampled slice
+          with report.stage("perimeter"):
+            stackPerimeters = None
+            if "Perimeter" in required and perimeterMethod == "tracer":
+              stackPerimeters = SectionPerimeter.tracerStackPerimeter(narray, axisIndex, sampleSlices, 1.0, aspect)
+            elif "Perimeter" in required:
+              stackPerimeters = SliceChunks.mapSliceChunks(SectionPerimeter.stackPerimeter, narray, axisIndex, sampleSlices, workers, 1.0, aspect)
+
+          # measure the feret diameters of every sampled slice at once with rotating calipers
+          with report.stage("feret"):
+            stackFerets = None
+            needFeret = "Feret" in required
+            if needFeret == True:
+              stackFerets = SliceChunks.mapSliceChunks(SectionFeret.stackFeret, narray, axisIndex, sampleSlices, workers, 1.0, aspect)
+
+          # scale the results to mm, the normalized columns are only derived as they are added to the table
+          with report.stage("columns"):
+            columns = SectionTable.sectionColumns(stackProps, numSlices, PixelWidthMm, PixelDepthMm,
+                                                  stackPerimeters, stackFerets, feretAngles)
+            columns["Segment"] = np.full(len(sampleSlices), segName, dtype=object)
+            columns["Slice Index"] = sampleSlices
+            columns["Percent (%)"] = percentLength
+          with report.stage("brightness"):
+            if "Intensity" in required:
+              columns["Mean Brightness"] = SliceChunks.mapSliceChunks(SectionMoments.stackMeanIntensity, voxelArray, axisIndex, sampleSlices, workers, narray)
+            if "Percentiles" in required:
+              percentiles = SliceChunks.mapSliceChunks(SectionMoments.stackIntensityPercentiles, voxelArray, axisIndex, sampleSlices, workers, narray, brightnessPercentiles)
+              columns.update(SectionTable.percentileColumns(percentiles, brightnessPercentiles))
+            if "Weighted" in required:
+              weightedProps = SliceChunks.mapSliceChunks(SectionMoments.stackWeightedProperties, voxelArray, axisIndex, sampleSlices, workers, narray, aspect)
+              columns.update(SectionTable.weightedColumns(weightedProps, PixelWidthMm))
+
+          # find smallest diameter away from the ends to calculate aspect ratio
+          if needFeret == True:
+            Length = numSlices * PixelDepthMm
+            Fdiam = columns["Max Feret Diameter (mm)"]
             sampleMin = int(max(sampleSlices)*.05)
             sampleMax = int(max(sampleSlices)*.95)
-            if i >= sampleMin and i <= sampleMax:
-              if FdiamMin == None and Fdiam > 0:
-                FdiamMin = (numSlices * PixelDepthMm)
-              if FdiamMin != None and Fdiam > 0:
-                FdiamMin = min(FdiamMin,Fdiam)
-                AR = (numSlices * PixelDepthMm)/FdiamMin
-                if AR > 10:
-                  eulerflag = 0     
-                            
-          # set up variables for calculations
-          Sn = np.count_nonzero(slicetemp)
-          Sx = sum(coords_Ijk[0])
-          Sy = sum(coords_Ijk[1])
-          
-          if Sn == 0:
-            if segmentID == segmentNode:
-              CxArray.InsertNextValue(0)
-              CyArray.InsertNextValue(0)
-              JzArray.InsertNextValue(0)
-              ZpolArray.InsertNextValue(0)
-                            
-              ThetaMinArray.InsertNextValue(0)       
-              ThetaMaxArray.InsertNextValue(0)       
-              ImajorArray.InsertNextValue(0)
-              IminorArray.InsertNextValue(0)
-              RmajorArray.InsertNextValue(0)
-              RminorArray.InsertNextValue(0)
-              RmaxArray.InsertNextValue(0)
-              ZmajorArray.InsertNextValue(0)
-              ZminorArray.InsertNextValue(0)
-              if SummerscheckBox == True:
-                ImajorArray_Summers.InsertNextValue(0)
-                IminorArray_Summers.InsertNextValue(0)
-                ZmajorArray_Summers.InsertNextValue(0)
-                ZminorArray_Summers.InsertNextValue(0)
-                JzArray_Summers.InsertNextValue(0)
-                ZpolArray_Summers.InsertNextValue(0)
-              if DoubecheckBox == True:
-                ImajorArray_Doube.InsertNextValue(0)
-                IminorArray_Doube.InsertNextValue(0)
-                ZmajorArray_Doube.InsertNextValue(0)
-                ZminorArray_Doube.InsertNextValue(0)
-                JzArray_Doube.InsertNextValue(0)
-                ZpolArray_Doube.InsertNextValue(0)
-              if OrientationcheckBox == True: 
-                IlaArray.InsertNextValue(0)
-                InaArray.InsertNextValue(0)
-                ZnaArray.InsertNextValue(0)
-                ZlaArray.InsertNextValue(0)
-                RnaArray.InsertNextValue(0)
-                RlaArray.InsertNextValue(0)
-                if DoubecheckBox == True:
-                  InaArray_Doube.InsertNextValue(0)
-                  IlaArray_Doube.InsertNextValue(0)
-                  ZnaArray_Doube.InsertNextValue(0)
-                  ZlaArray_Doube.InsertNextValue(0)
-                if SummerscheckBox == True:
-                  InaArray_Summers.InsertNextValue(0)
-                  IlaArray_Summers.InsertNextValue(0)
-                  ZnaArray_Summers.InsertNextValue(0)
-                  ZlaArray_Summers.InsertNextValue(0)
-
-          elif Sn > 0:
-            # calculate centroid coordinates
-            Cx = Sx / Sn
-            Cy = Sy / Sn 
-            if segmentID == segmentNode:
-            # add values to calculations                       
-              CxArray.InsertNextValue((Cx))
-              CyArray.InsertNextValue((Cy))
-            
-            # calculate second moment of area along horizontal and vertical axes
-            Ix = 0
-            for  s in range(Sn):
-              Ix = Ix + 1/12 + (Cy - coords_Ijk[1][s])**2
-               
-            Iy = 0
-            for  s in range(Sn):
-              Iy = Iy + 1/12 + (Cx - coords_Ijk[0][s])**2
-              
-            # calculated polar moment of inertia
-            Jz = 0
-            for s in range(Sn):
-              Jz = Jz + ((Cx - coords_Ijk[0][s])**2 + (Cy - coords_Ijk[1][s])**2)
-
-            # determine how far the major principal axis is from the horizontal 
-            Ixy = 0
-            for s in range(Sn):
-              Ixy = Ixy + (Cx - coords_Ijk[0][s]) * (Cy - coords_Ijk[1][s])
-
-            if Ixy == 0:
-              Theta = 0
-            else:
-              Theta = np.arctan((Ix - Iy + np.sqrt((Ix - Iy) * (Ix - Iy) + 4 * Ixy * Ixy)) / (2 * Ixy))
-                     
-            #major axis
-            Imajor = 0
-            Rmajor = 0
-            for s in range(Sn): 
-              rad = ((coords_Ijk[1][s]-Cy)*np.cos(Theta) - (coords_Ijk[0][s]-Cx)*np.sin(Theta))**2
-              Imajor = Imajor+ (rad + 1/12)
-              Rmajor = max(Rmajor,np.sqrt(rad))
-            if Rmajor == 0:
-              Zmajor = Imajor
-            else:    
-              Zmajor = Imajor/Rmajor
-             
-            # minor axis
-            Iminor = 0
-            Rminor = 0
-            for s in range(Sn):
-              rad = ((coords_Ijk[0][s]-Cx)*np.cos(Theta) + (coords_Ijk[1][s]-Cy)*np.sin(Theta))**2
-              Iminor = Iminor + (rad + 1/12)
-              Rminor = max(Rminor,np.sqrt(rad))
-            if Rminor == 0:
-              Zminor = Iminor
-            else:    
-              Zminor = Iminor/Rminor 
-              
-            Zpol = 0
-            Maxrad = 0
-            for s in range(Sn):
-              Maxrad = max(Maxrad, np.sqrt((coords_Ijk[0][s]-Cx)**2 + (coords_Ijk[1][s]-Cy)**2))
-            Zpol = Jz/Maxrad     
-                                  
-            if segmentID == segmentNode:
-            # add values to calculations                       
-              ThetaMinArray.InsertNextValue((Theta + np.pi/2)*180/np.pi)       
-              ThetaMaxArray.InsertNextValue(Theta*180/np.pi)
-              JzArray.InsertNextValue(Jz * unitOfPixelMm4)   
-              ImajorArray.InsertNextValue(Imajor * unitOfPixelMm4)
-              IminorArray.InsertNextValue(Iminor * unitOfPixelMm4)
-              RmajorArray.InsertNextValue(Rmajor * PixelWidthMm)
-              RminorArray.InsertNextValue(Rminor * PixelWidthMm)
-              ZmajorArray.InsertNextValue(Zmajor * unitOfPixelMm4 / PixelWidthMm)
-              ZminorArray.InsertNextValue(Zminor * unitOfPixelMm4 / PixelWidthMm)
-              ZpolArray.InsertNextValue(Zpol * unitOfPixelMm4 / PixelWidthMm)
-              RmaxArray.InsertNextValue(Maxrad * PixelWidthMm)
-            
-              # do material normalization          
-              if SummerscheckBox == True:
-                ImajorArray_Summers.InsertNextValue(Imajor/((np.pi * (np.sqrt(CSA/np.pi))**4) / 4))
-                IminorArray_Summers.InsertNextValue(Iminor/((np.pi * (np.sqrt(CSA/np.pi))**4) / 4))
-                ZmajorArray_Summers.InsertNextValue(Zmajor/((np.pi * (np.sqrt(CSA/np.pi))**3) / 4))
-                ZminorArray_Summers.InsertNextValue(Zminor/((np.pi * (np.sqrt(CSA/np.pi))**3) / 4))
-                JzArray_Summers.InsertNextValue(Jz/((np.pi * (np.sqrt(CSA/np.pi))**4) / 2))
-                ZpolArray_Summers.InsertNextValue(Zpol/((np.pi * (np.sqrt(CSA/np.pi))**3) / 16))
-              
-              # do size correction
-              if DoubecheckBox == True:
-                ImajorArray_Doube.InsertNextValue(Imajor**(1/4) / numSlices)
-                IminorArray_Doube.InsertNextValue(Iminor**(1/4) / numSlices)
-                ZmajorArray_Doube.InsertNextValue(Zmajor**(1/3) / numSlices)
-                ZminorArray_Doube.InsertNextValue(Zminor**(1/3) / numSlices)
-                JzArray_Doube.InsertNextValue(Jz**(1/4) / numSlices)
-                ZpolArray_Doube.InsertNextValue(Zpol**(1/3) / numSlices)
-           
-              # use custom neutral axis  
-              if OrientationcheckBox == True: 
-                Theta = angle * np.pi/180  
-
-                #neutral axis
-                Ina = 0
-                Rna = 0
-                for s in range(Sn): 
-                  rad = ((coords_Ijk[1][s]-Cy)*np.cos(Theta) - (coords_Ijk[0][s]-Cx)*np.sin(Theta))**2
-                  Ina = Ina +(rad + 1/12)
-                  Rna = max(Rna,np.sqrt(rad))
-                if Rna == 0:
-                  Zna = Ina
-                else:  
-                  Zna = Ina/Rna
-            
-            
-                #loading axis
-                Ila = 0
-                Rla = 0
-                for s in range(Sn):
-                  rad = ((coords_Ijk[0][s]-Cx)*np.cos(Theta) + (coords_Ijk[1][s]-Cy)*np.sin(Theta))**2
-                  Ila = Ila+ (rad + 1/12)
-                  Rla = max(Rla,np.sqrt(rad))
-                if Rla == 0:
-                  Zla = Ila  
-                else:  
-                  Zla = Ila/Rla
-            
+            central = (sampleSlices >= sampleMin) & (sampleSlices <= sampleMax) & (Fdiam > 0)
+            if central.any():
+              FdiamMin = min(Length, Fdiam[central].min())
+              AR = Length/FdiamMin
+              if AR > 10:
+                eulerflag = 0
 
-                if segmentID == segmentNode:
-                  # add values to orientation calculations 
-                  IlaArray.InsertNextValue(Ila * unitOfPixelMm4)
-                  InaArray.InsertNextValue(Ina * unitOfPixelMm4)
-                  ZnaArray.InsertNextValue(Zna * unitOfPixelMm4/PixelWidthMm)
-                  ZlaArray.InsertNextValue(Zla * unitOfPixelMm4/PixelWidthMm)
-                  RnaArray.InsertNextValue(Rna * PixelWidthMm)
-                  RlaArray.InsertNextValue(Rla * PixelWidthMm)
-
-                  # do Doube size correction
-                  if DoubecheckBox == True:
-                    InaArray_Doube.InsertNextValue(Ina**(1/4) / numSlices)
-                    IlaArray_Doube.InsertNextValue(Ila**(1/4) / numSlices)
-                    ZnaArray_Doube.InsertNextValue(Zna**(1/3) / numSlices)
-                    ZlaArray_Doube.InsertNextValue(Zla**(1/3) / numSlices)
-              
-                  if SummerscheckBox == True:
-                    InaArray_Summers.InsertNextValue(Ina/((np.pi * (np.sqrt(CSA/np.pi))**4) / 4))
-                    IlaArray_Summers.InsertNextValue(Ila/((np.pi * (np.sqrt(CSA/np.pi))**4) / 4))
-                    ZnaArray_Summers.InsertNextValue(Zna/((np.pi * (np.sqrt(CSA/np.pi))**3) / 4))
-                    ZlaArray_Summers.InsertNextValue(Zla/((np.pi * (np.sqrt(CSA/np.pi))**3) / 4))
+        if segmentID == areaSegmentID:
+          rows, mask = SectionMoments.sliceStack(narray, axisIndex, sampleSlices)
+          TotalArea = np.count_nonzero(mask, axis=(1, 2))[np.searchsorted(rows, sampleSlices)] * areaOfPixelMm2
 
       if CompactnesscheckBox == True:
-       for s in range(TotalAreaArray.GetNumberOfTuples()):
-         compactness = float(areaArray.GetTuple(s)[0])/float(TotalAreaArray.GetTuple(s)[0])
-         if compactness > 1:
-           CompactnessArray.InsertNextValue(float(1))
-         else:
-           CompactnessArray.InsertNextValue(float(areaArray.GetTuple(s)[0])/float(TotalAreaArray.GetTuple(s)[0]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+          columns["Compactness"] = np.minimum(columns["CSA (mm^2)"][:len(TotalArea)] / TotalArea, 1)
 
       
       try:
@@ -2316,283 +1534,63 @@ class SegmentGeometryLogic(ScriptedLoadableModuleLogic):
       except AttributeError:
         pass
         
-      # adds table column for various arrays
-      tableNode.AddColumn(SegmentNameArray)
-      tableNode.SetColumnDescription(SegmentNameArray.GetName(), "Segment name")  
-      
-      tableNode.AddColumn(sliceNumberArray)
-      tableNode.SetColumnDescription(sliceNumberArray.GetName(), "Corresponding slice index on the resampled volume")
-      
-      tableNode.AddColumn(percentLengthArray)
-      tableNode.SetColumnUnitLabel(percentLengthArray.GetName(), "%")  # TODO: use length unit
-      tableNode.SetColumnDescription(percentLengthArray.GetName(), "Percent of the segment length")  
-      
-      if LengthcheckBox == True:
-        tableNode.AddColumn(LengthArray)
-        tableNode.SetColumnUnitLabel(LengthArray.GetName(), "mm")  # TODO: use length unit
-        tableNode.SetColumnDescription(LengthArray.GetName(), "Segment Length")  
-      
-      if FeretcheckBox == True:
-        tableNode.AddColumn(FeretArray)
-        tableNode.SetColumnUnitLabel(FeretArray.GetName(), "mm")  # TODO: use length unit
-        tableNode.SetColumnDescription(FeretArray.GetName(), "Maximum feret diameter") 
-        
-        tableNode.AddColumn(MinFeretArray)
-        tableNode.SetColumnUnitLabel(FeretArray.GetName(), "mm")  # TODO: use length unit
-        tableNode.SetColumnDescription(FeretArray.GetName(), "Minimum feret diameter")    
-      
-      if PerimcheckBox == True:
-        tableNode.AddColumn(PerimArray)
-        tableNode.SetColumnUnitLabel(PerimArray.GetName(), "mm")  # TODO: use length unit
-        tableNode.SetColumnDescription(PerimArray.GetName(), "Perimeter of the section")  
-
-      if volumeNode != None and IntensitycheckBox == True:
-        tableNode.AddColumn(meanIntensityArray)
-        tableNode.SetColumnDescription(LengthArray.GetName(), "Mean pixel brightness") 
-
-      if CSAcheckBox == True:    
-        tableNode.AddColumn(areaArray)
-        tableNode.SetColumnUnitLabel(areaArray.GetName(), "mm^2")  # TODO: use length unit
-        tableNode.SetColumnDescription(areaArray.GetName(), "Cross-sectional area")  
-
-      if CompactnesscheckBox == True:    
-        tableNode.AddColumn(CompactnessArray)
-        tableNode.SetColumnDescription(CompactnessArray.GetName(), "Compactness calculated as CSA/TCSA")    
-
-      if CentroidcheckBox == True:    
-        tableNode.AddColumn(CxArray)
-        tableNode.SetColumnUnitLabel(CxArray.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(CxArray.GetName(), "x-coordinate of the centroid in IJK format on the resampled volume")  
-        
-        tableNode.AddColumn(CyArray)
-        tableNode.SetColumnUnitLabel(CyArray.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(CyArray.GetName(), "y-coordinate of the centroid in IJK format on the resampled volume")         
-                
-      if ThetacheckBox == True:    
-        tableNode.AddColumn(ThetaMinArray)
-        tableNode.SetColumnUnitLabel(ThetaMinArray.GetName(), "degrees")  # TODO: use length unit
-        tableNode.SetColumnDescription(ThetaMinArray.GetName(), "Angle between the minor principal axis and the horizontal (right side), in a clockwise direction")  
-        
-        #tableNode.AddColumn(ThetaMaxArray)
-        #tableNode.SetColumnUnitLabel(ThetaMaxArray.GetName(), "degrees")  # TODO: use length unit
-        #tableNode.SetColumnDescription(ThetaMaxArray.GetName(), "Angle of the major principal axis")  
-      
-      if SMAcheckBox_1 == True:  
-        tableNode.AddColumn(IminorArray)
-        tableNode.SetColumnUnitLabel(IminorArray.GetName(), "mm^4")  # TODO: use length unit
-        tableNode.SetColumnDescription(IminorArray.GetName(), "Second moment of area around the minor principal axis (larger I)")
-       
-        tableNode.AddColumn(ImajorArray)
-        tableNode.SetColumnUnitLabel(ImajorArray.GetName(), "mm^4")  # TODO: use length unit
-        tableNode.SetColumnDescription(ImajorArray.GetName(), "Second moment of area around the major principal axis (smaller I)")
-
-      if MODcheckBox_1 == True:
-        tableNode.AddColumn(ZminorArray)
-        tableNode.SetColumnUnitLabel(ZminorArray.GetName(), "mm^3")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZminorArray.GetName(), "Section modulus around the minor principal axis (larger Z)")
-      
-        tableNode.AddColumn(ZmajorArray)
-        tableNode.SetColumnUnitLabel(ZmajorArray.GetName(), "mm^3")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZmajorArray.GetName(), "Section modulus around the major principal axis (smaller Z)")
-
-      if RcheckBox == True:  
-        tableNode.AddColumn(RminorArray)
-        tableNode.SetColumnUnitLabel(RminorArray.GetName(), "mm")  # TODO: use length unit
-        tableNode.SetColumnDescription(RminorArray.GetName(), "Max distance from the minor principal axis") 
-         
-        tableNode.AddColumn(RmajorArray)
-        tableNode.SetColumnUnitLabel(RmajorArray.GetName(), "mm")  # TODO: use length unit
-        tableNode.SetColumnDescription(RmajorArray.GetName(), "Max distance from the major principal axis") 
-
-      if JzcheckBox == True:
-        tableNode.AddColumn(JzArray)
-        tableNode.SetColumnUnitLabel(JzArray.GetName(), "mm^4")  # TODO: use length unit
-        tableNode.SetColumnDescription(JzArray.GetName(), "Polar moment of inertia")
-
-      if ZpolcheckBox == True:
-        tableNode.AddColumn(ZpolArray)
-        tableNode.SetColumnUnitLabel(ZpolArray.GetName(), "mm^3")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZpolArray.GetName(), "Polar section modulus")
-
-      if RcheckBox == True and ZpolcheckBox == True:  
-        tableNode.AddColumn(RmaxArray)
-        tableNode.SetColumnUnitLabel(RmaxArray.GetName(), "mm")  # TODO: use length unit
-        tableNode.SetColumnDescription(RmaxArray.GetName(), "Max radius from the centroid") 
-
-      if OrientationcheckBox == True and SMAcheckBox_1 == True:  
-        tableNode.AddColumn(InaArray)
-        tableNode.SetColumnUnitLabel(InaArray.GetName(), "mm^4")  # TODO: use length unit
-        tableNode.SetColumnDescription(InaArray.GetName(), "Second moment of area around the neutral axis")
-        
-        tableNode.AddColumn(IlaArray)
-        tableNode.SetColumnUnitLabel(IlaArray.GetName(), "mm^4")  # TODO: use length unit
-        tableNode.SetColumnDescription(IlaArray.GetName(), "Second moment of area around the loading axis")
-              
-      if OrientationcheckBox == True and MODcheckBox_1 == True:
-        tableNode.AddColumn(ZnaArray)
-        tableNode.SetColumnUnitLabel(ZnaArray.GetName(), "mm^3")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZnaArray.GetName(), "Section modulus around the neutral axis")
-        
-        tableNode.AddColumn(ZlaArray)
-        tableNode.SetColumnUnitLabel(ZlaArray.GetName(), "mm^3")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZlaArray.GetName(), "Section modulus around the loading axis")
-        
-      if RcheckBox == True and OrientationcheckBox == True:
-        tableNode.AddColumn(RnaArray)
-        tableNode.SetColumnUnitLabel(RnaArray.GetName(), "mm")  # TODO: use length unit
-        tableNode.SetColumnDescription(RnaArray.GetName(), "Max distance from the neutral axis") 
-      
-        tableNode.AddColumn(RlaArray)
-        tableNode.SetColumnUnitLabel(RlaArray.GetName(), "mm")  # TODO: use length unit
-        tableNode.SetColumnDescription(RlaArray.GetName(), "Max distance from the loading axis") 
-
-      if DoubecheckBox == True and CSAcheckBox == True:
-        tableNode.AddColumn(areaArray_Doube)
-        tableNode.SetColumnUnitLabel(areaArray_Doube.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(areaArray_Doube.GetName(), "CSA^(1/2)/Length")
-        
-      if DoubecheckBox == True and SMAcheckBox_1 == True:
-        tableNode.AddColumn(IminorArray_Doube)
-        tableNode.SetColumnUnitLabel(IminorArray_Doube.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(IminorArray_Doube.GetName(), "Iminor^(1/4)/Length")
-        
-        tableNode.AddColumn(ImajorArray_Doube)
-        tableNode.SetColumnUnitLabel(ImajorArray_Doube.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(ImajorArray_Doube.GetName(), "Imajor^(1/4)/Length")
-      
-      if DoubecheckBox == True and MODcheckBox_1 == True:
-        tableNode.AddColumn(ZminorArray_Doube)
-        tableNode.SetColumnUnitLabel(ZminorArray_Doube.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZminorArray_Doube.GetName(), "Zminor^(1/3)/Length") 
-  
-        tableNode.AddColumn(ZmajorArray_Doube)
-        tableNode.SetColumnUnitLabel(ZmajorArray_Doube.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZmajorArray_Doube.GetName(), "Zmajor^(1/3)/Length")
-      
-      if DoubecheckBox == True and SMAcheckBox_1 == True and OrientationcheckBox == True:
-        tableNode.AddColumn(InaArray_Doube)
-        tableNode.SetColumnUnitLabel(InaArray_Doube.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(InaArray_Doube.GetName(), "Ina^(1/4)/Length")
-        
-        tableNode.AddColumn(IlaArray_Doube)
-        tableNode.SetColumnUnitLabel(IlaArray_Doube.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(IlaArray_Doube.GetName(), "Ila^(1/4)/Length")
-
-      if DoubecheckBox == True and MODcheckBox_1 == True and OrientationcheckBox == True:
-        tableNode.AddColumn(ZlaArray_Doube)
-        tableNode.SetColumnUnitLabel(ZlaArray_Doube.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZlaArray_Doube.GetName(), "Zla^(1/3)/Length")  
-        
-        tableNode.AddColumn(ZnaArray_Doube)
-        tableNode.SetColumnUnitLabel(ZnaArray_Doube.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZnaArray_Doube.GetName(), "Zna^(1/3)/Length")
-
-      if DoubecheckBox == True and JzcheckBox == True:
-        tableNode.AddColumn(JzArray_Doube)
-        tableNode.SetColumnUnitLabel(JzArray_Doube.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(JzArray_Doube.GetName(), "Jz^(1/4)/Length")
-   
-      if DoubecheckBox == True and ZpolcheckBox == True:
-        tableNode.AddColumn(ZpolArray_Doube)
-        tableNode.SetColumnUnitLabel(ZpolArray_Doube.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZpolArray_Doube.GetName(), "Zpol^(1/3)/Length")  
-
-      if SummerscheckBox == True and SMAcheckBox_1 == True:
-        tableNode.AddColumn(IminorArray_Summers)
-        tableNode.SetColumnUnitLabel(IminorArray_Summers.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(IminorArray_Summers.GetName(), "Iminor divided by the second moment of area of a solid circle with the same cross-sectional area") 
-        
-        tableNode.AddColumn(ImajorArray_Summers)
-        tableNode.SetColumnUnitLabel(ImajorArray_Summers.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(ImajorArray_Summers.GetName(), "Imajor divided by the second moment of area of a solid circle with the same cross-sectional area")        
-        
-      if SummerscheckBox == True and MODcheckBox_1 == True:
-        tableNode.AddColumn(ZminorArray_Summers)
-        tableNode.SetColumnUnitLabel(ZminorArray_Summers.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZminorArray_Summers.GetName(), "Zminor divided by the section modulus of a solid circle with the same cross-sectional area")
-        
-        tableNode.AddColumn(ZmajorArray_Summers)
-        tableNode.SetColumnUnitLabel(ZmajorArray_Summers.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZmajorArray_Summers.GetName(), "Zmajor divided by the section modulus of a solid circle with the same cross-sectional area")    
-
-      if SummerscheckBox == True and JzcheckBox == True:
-        tableNode.AddColumn(JzArray_Summers)
-        tableNode.SetColumnUnitLabel(JzArray_Summers.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(JzArray_Summers.GetName(), "Jz divided by the polar moment of inertia of a solid circle with the same cross-sectional area") 
-
-      if SummerscheckBox == True and ZpolcheckBox == True:
-        tableNode.AddColumn(ZpolArray_Summers)
-        tableNode.SetColumnUnitLabel(ZpolArray_Summers.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZpolArray_Summers.GetName(), "Zpol divided by the polar section modulus of a solid circle with the same cross-sectional area")    
-        
-      if SummerscheckBox == True and SMAcheckBox_1 == True and OrientationcheckBox == True:
-        tableNode.AddColumn(InaArray_Summers)
-        tableNode.SetColumnUnitLabel(InaArray_Summers.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(InaArray_Summers.GetName(), "Ina divided by the second moment of area of a solid circle with the same cross-sectional area")
-        
-        tableNode.AddColumn(IlaArray_Summers)
-        tableNode.SetColumnUnitLabel(IlaArray_Summers.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(IlaArray_Summers.GetName(), "Ila divided by the second moment of area of a solid circle with the same cross-sectional area") 
-        
-      if SummerscheckBox == True and MODcheckBox_1 == True and OrientationcheckBox == True:
-        tableNode.AddColumn(ZnaArray_Summers)
-        tableNode.SetColumnUnitLabel(ZnaArray_Summers.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZnaArray_Summers.GetName(), "Zna divided by the section modulus of a solid circle with the same cross-sectional area")
-        
-        tableNode.AddColumn(ZlaArray_Summers)
-        tableNode.SetColumnUnitLabel(ZlaArray_Summers.GetName(), "none")  # TODO: use length unit
-        tableNode.SetColumnDescription(ZlaArray_Summers.GetName(), "Zla divided by the section modulus of a solid circle with the same cross-sectional area")         
+      # adds table columns for the selected properties
+      with report.stage("table"):
+        self.addTableColumns(tableNode, columns, names)
+      # keep the columns in mm to switch the normalized columns without measuring again
+      self.normalizationState = {"columns": columns, "tableNode": tableNode, "names": names}
 
       
-      # Make a plot series node for this column.
-      segment = segmentationNode.GetSegmentation().GetSegment(segmentNode)
-      segName = segment.GetName()
-      if SMAcheckBox_1 == True: 
-        if slicer.mrmlScene.GetFirstNodeByName(segName + " Iminor (mm^4)") != None and plotChartNode.GetPlotSeriesNodeID() != None:
-          plotSeriesNode = slicer.mrmlScene.GetFirstNodeByName(segName + " Iminor (mm^4)")
-        else:
-          plotSeriesNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLPlotSeriesNode", segName + " Iminor (mm^4)")
-          plotSeriesNode.SetPlotType(plotSeriesNode.PlotTypeScatter)
-          plotSeriesNode.SetAndObserveTableNodeID(tableNode.GetID())
-          plotSeriesNode.SetYColumnName("Iminor (mm^4)")
-          plotSeriesNode.SetXColumnName("Percent (%)")
-          plotSeriesNode.SetUniqueColor()
-
-          # Add this series to the plot chart node created above.
-          plotChartNode.AddAndObservePlotSeriesNodeID(plotSeriesNode.GetID())
+      with report.stage("plot"):
+        # Make a plot series node for this column.
+        segment = segmentationNode.GetSegmentation().GetSegment(segmentNode)
+        segName = segment.GetName()
+        if SMAcheckBox_1 == True: 
+          if slicer.mrmlScene.GetFirstNodeByName(segName + " Iminor (mm^4)") != None and plotChartNode.GetPlotSeriesNodeID() != None:
+            plotSeriesNode = slicer.mrmlScene.GetFirstNodeByName(segName + " Iminor (mm^4)")
+          else:
+            plotSeriesNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLPlotSeriesNode", segName + " Iminor (mm^4)")
+            plotSeriesNode.SetPlotType(plotSeriesNode.PlotTypeScatter)
+            plotSeriesNode.SetAndObserveTableNodeID(tableNode.GetID())
+            plotSeriesNode.SetYColumnName("Iminor (mm^4)")
+            plotSeriesNode.SetXColumnName("Percent (%)")
+            plotSeriesNode.SetUniqueColor()
+
+            # Add this series to the plot chart node created above.
+            plotChartNode.AddAndObservePlotSeriesNodeID(plotSeriesNode.GetID())
       
-      #plotChartNode.SetXAxisTitle("Percent of Length")
-      if OrientationcheckBox == True and SMAcheckBox_1 == True: 
-        if slicer.mrmlScene.GetFirstNodeByName(segName + " Ina (mm^4)") != None and plotChartNode.GetPlotSeriesNodeID() != None:
-          plotSeriesNode2 = slicer.mrmlScene.GetFirstNodeByName(segName + " Ina (mm^4)")
-        else:
-          plotSeriesNode2 = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLPlotSeriesNode", segName + " Ina (mm^4)")
-          plotSeriesNode2.SetPlotType(plotSeriesNode2.PlotTypeScatter)
-          plotSeriesNode2.SetAndObserveTableNodeID(tableNode.GetID())
-          plotSeriesNode2.SetYColumnName("Ina (mm^4)")
-          plotSeriesNode2.SetXColumnName("Percent (%)")
-          plotSeriesNode2.SetUniqueColor()
+        #plotChartNode.SetXAxisTitle("Percent of Length")
+        if OrientationcheckBox == True and SMAcheckBox_1 == True: 
+          if slicer.mrmlScene.GetFirstNodeByName(segName + " Ina (mm^4)") != None and plotChartNode.GetPlotSeriesNodeID() != None:
+            plotSeriesNode2 = slicer.mrmlScene.GetFirstNodeByName(segName + " Ina (mm^4)")
+          else:
+            plotSeriesNode2 = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLPlotSeriesNode", segName + " Ina (mm^4)")
+            plotSeriesNode2.SetPlotType(plotSeriesNode2.PlotTypeScatter)
+            plotSeriesNode2.SetAndObserveTableNodeID(tableNode.GetID())
+            plotSeriesNode2.SetYColumnName("Ina (mm^4)")
+            plotSeriesNode2.SetXColumnName("Percent (%)")
+            plotSeriesNode2.SetUniqueColor()
         
-          # Add this series to the plot chart node created above.
-          plotChartNode.AddAndObservePlotSeriesNodeID(plotSeriesNode2.GetID())
+            # Add this series to the plot chart node created above.
+            plotChartNode.AddAndObservePlotSeriesNodeID(plotSeriesNode2.GetID())
           
-      if OrientationcheckBox == False and SMAcheckBox_1 == False and CSAcheckBox == True: 
-        plotChartNode.SetYAxisTitle('Cross-Sectional Area (mm^2)') 
-        if slicer.mrmlScene.GetFirstNodeByName(segName + " CSA (mm^2)") != None and plotChartNode.GetPlotSeriesNodeID() != None:
-          plotSeriesNode3 = slicer.mrmlScene.GetFirstNodeByName(segName + " CSA (mm^2)")
-        else:
-          plotSeriesNode3 = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLPlotSeriesNode", segName + " CSA (mm^2)")
-          plotSeriesNode3.SetPlotType(plotSeriesNode3.PlotTypeScatter)
-          plotSeriesNode3.SetAndObserveTableNodeID(tableNode.GetID())
-          plotSeriesNode3.SetYColumnName("CSA (mm^2)")
-          plotSeriesNode3.SetXColumnName("Percent (%)")
-          plotSeriesNode3.SetUniqueColor()
+        if OrientationcheckBox == False and SMAcheckBox_1 == False and CSAcheckBox == True: 
+          plotChartNode.SetYAxisTitle('Cross-Sectional Area (mm^2)') 
+          if slicer.mrmlScene.GetFirstNodeByName(segName + " CSA (mm^2)") != None and plotChartNode.GetPlotSeriesNodeID() != None:
+            plotSeriesNode3 = slicer.mrmlScene.GetFirstNodeByName(segName + " CSA (mm^2)")
+          else:
+            plotSeriesNode3 = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLPlotSeriesNode", segName + " CSA (mm^2)")
+            plotSeriesNode3.SetPlotType(plotSeriesNode3.PlotTypeScatter)
+            plotSeriesNode3.SetAndObserveTableNodeID(tableNode.GetID())
+            plotSeriesNode3.SetYColumnName("CSA (mm^2)")
+            plotSeriesNode3.SetXColumnName("Percent (%)")
+            plotSeriesNode3.SetUniqueColor()
         
-          # Add this series to the plot chart node created above.
-          plotChartNode.AddAndObservePlotSeriesNodeID(plotSeriesNode3.GetID())
-         
+            # Add this series to the plot chart node created above.
+            plotChartNode.AddAndObservePlotSeriesNodeID(plotSeriesNode3.GetID())
        
     finally:
+      report.stop()
       # Remove temporary volume node
       slicer.mrmlScene.RemoveNode(tempSegmentLabelmapVolumeNode)
       slicer.mrmlScene.RemoveNode(slicer.mrmlScene.GetFirstNodeByName("SegmentGeometryTemp_ColorTable"))
@@ -2602,7 +1600,7 @@ class SegmentGeometryLogic(ScriptedLoadableModuleLogic):
       slicer.mrmlScene.RemoveNode(slicer.mrmlScene.GetFirstNodeByName("TempMarkupsROI"))
 
       # move segment back to where it was originally
-      if trans != None:
+      if trans != None and sceneExport == True:
         trans_new = slicer.mrmlScene.GetNodeByID(segmentationNode.GetTransformNodeID())
         trans_new.SetMatrixTransformToParent(og_matrix) 
       
@@ -2618,51 +1616,771 @@ class SegmentGeometryLogic(ScriptedLoadableModuleLogic):
       tableWidget.tableView().setMRMLTableNode(tableNode)
 
     logging.info('Processing completed')
+    logging.info(report.summary())
     end = time.time()
     TotalTime = np.round(end - start,2)
     print("Total time elapsed:", TotalTime, "seconds")
+    return report
 
+  def runBatch(self, segmentationNode, segmentIDs, volumeNode, axis, interval, tableNode, angle=None, workers=None):
+    """
+    Compute the section properties of several segments at once (see computeBatch) and write
+    the rows of all segments to tableNode, with the segment name in the "Segment" column.
+    Returns the Profiling.StageReport of the run, as run does.
+    """
 
-#
-# SegmentCrossSectionAreaTest
-#
+    import numpy as np
+    import time
+    from SegmentGeometryLib import Profiling
 
-class SegmentGeometryTest(ScriptedLoadableModuleTest):
-  """
-  This is the test case for your scripted module.
-  Uses ScriptedLoadableModuleTest base class, available at:
-  https://github.com/Slicer/Slicer/blob/master/Base/Python/slicer/ScriptedLoadableModule.py
-  """
-  
-  def setUp(self):
-    """ Do whatever is needed to reset the state - typically a scene clear will be enough.
-    """
-    slicer.mrmlScene.Clear(0)
+    start = time.time()
+    logging.info('Batch processing started')
 
-  def runTest(self):
-    """Run as few or as many tests as needed here.
+    report = Profiling.StageReport()
+    self.lastReport = report
+    report.start()
+    try:
+      columns = self.computeBatch(segmentationNode, segmentIDs, volumeNode, axis, interval, angle, workers)
+
+      with report.stage("table"):
+        tableNode.RemoveAllColumns()
+        self.addTableColumns(tableNode, columns, list(columns))
+    finally:
+      report.stop()
+
+    logging.info('Batch processing completed')
+    logging.info(report.summary())
+    end = time.time()
+    TotalTime = np.round(end - start,2)
+    print("Total time elapsed:", TotalTime, "seconds")
+    return report
+
+  def labelmapCacheKey(self, segmentationNode, segmentID, volumeNode, intensity=False, sceneExport=True):
+    """
+    Key of the exported arrays of a segment in labelmapCache. It changes when the segment or the
+    segmentation is edited, when the voxels or the geometry of the volume change and when
+    either node is transformed. The node modified times are not used as run itself modifies the
+    transforms of both nodes and restores them afterwards.
     """
-    self.setUp()
-    self.test_SegmentGeometry1()
 
-  def test_SegmentGeometry1(self):
-    """ Ideally you should have several levels of tests.  At the lowest level
-    tests should exercise the functionality of the logic with different inputs
-    (both valid and invalid).  At higher levels your tests should emulate the
-    way the user would interact with your code and confirm that it still works
-    the way you intended.
-    One of the most important features of the tests is that it should alert other
-    developers when their changes will have an impact on the behavior of your
-    module.  For example, if a developer removes a feature that you depend on,
-    your test should break so they know that the feature is needed.
+    segmentation = segmentationNode.GetSegmentation()
+    labelmap = segmentation.GetSegment(segmentID).GetRepresentation(slicer.vtkSegmentationConverter.GetSegmentationBinaryLabelmapRepresentationName())
+    matrices = []
+    for node in (segmentationNode, volumeNode):
+      matrix = vtk.vtkMatrix4x4()
+      slicer.vtkMRMLTransformNode.GetMatrixTransformBetweenNodes(node.GetParentTransformNode(), None, matrix)
+      matrices.append(matrix)
+    volumeIjkToRas = vtk.vtkMatrix4x4()
+    volumeNode.GetIJKToRASMatrix(volumeIjkToRas)
+    matrices.append(volumeIjkToRas)
+    matrixElements = tuple(matrix.GetElement(row, column) for matrix in matrices for row in range(4) for column in range(4))
+    return (segmentationNode.GetID(), segmentID, segmentation.GetMTime(), labelmap.GetMTime() if labelmap else None,
+            volumeNode.GetID(), volumeNode.GetImageData().GetMTime(), tuple(volumeNode.GetImageData().GetDimensions()),
+            matrixElements, intensity, sceneExport)
+
+  def exportSegmentArrays(self, segmentationNode, segmentID, volumeNode, tempSegmentLabelmapVolumeNode, intensity=False, keepOutputVolume=True):
+    """
+    Export a segment to tempSegmentLabelmapVolumeNode, cropped to the segment, in the geometry of volumeNode.
+    If intensity is True the volume is masked with the segment to measure the brightness.
+    Returns the labelmap as a boolean array, the spacing and a copy of the masked volume array
+    (None if intensity is False), or None if the export failed.
     """
 
-    self.delayDisplay("Starting the test")
+    from SegmentGeometryLib import Profiling
 
-    # Load master volume
-    import SampleData
-    sampleDataLogic = SampleData.SampleDataLogic()
-    masterVolumeNode = sampleDataLogic.downloadMRBrainTumor1()
+    segName = segmentationNode.GetSegmentation().GetSegment(segmentID).GetName()
+    segmentList = vtk.vtkStringArray()
+    segmentList.InsertNextValue(segmentID)
+    
+    with Profiling.activeStage("export"):
+      volumesLogic = slicer.modules.volumes.logic()
+      if volumeNode != None:   
+        # Create volume for output
+        volumetransformNode = volumeNode.GetTransformNodeID()
+        volumeNode.SetAndObserveTransformNodeID(None)
+        outputVolume = slicer.util.getFirstNodeByName(segName + " SegmentGeometry Resampled Volume")
+        if outputVolume != None:
+          slicer.mrmlScene.RemoveNode(outputVolume) 
+        outputVolume = volumesLogic.CloneVolumeGeneric(slicer.mrmlScene, volumeNode, segName + " SegmentGeometry Resampled Volume")
+        outputVolume.SetName(segName + " SegmentGeometry Resampled Volume")
+      
+      
+        # resample volume if user is calculating mean pixel brightness and has a transformed segment
+        transformNode = segmentationNode.GetNodeReferenceID('transform')
+        if intensity == True and transformNode != None:
+          parameters = {}
+          parameters["inputVolume"] = volumeNode
+          parameters["outputVolume"] = outputVolume
+          parameters["referenceVolume"] = volumeNode
+          parameters["transformationFile"] = transformNode
+          resampleScalarVectorDWI = slicer.modules.resamplescalarvectordwivolume
+          cliNode = slicer.cli.runSync(resampleScalarVectorDWI, None, parameters)
+          if cliNode.GetStatus() & cliNode.ErrorsMask:
+            # error
+            errorText = cliNode.GetErrorText()
+            slicer.mrmlScene.RemoveNode(cliNode)
+            raise ValueError("CLI execution failed: " + errorText)
+
+          outputvolume = slicer.vtkSlicerVolumesLogic().CloneVolume(slicer.mrmlScene,outputVolume, segName + " Resampled Brightness Volume",True)
+          slicer.mrmlScene.RemoveNode(cliNode)
+          slicer.mrmlScene.RemoveNode(outputvolume)
+        volumeNodeformasking = outputVolume
+        volumeNode.SetAndObserveTransformNodeID(volumetransformNode)
+      
+    with Profiling.activeStage("crop"):
+      # Crop temporary volume to avoid computing on empty slices
+      maskExtent = [0] * 6
+      fillValue = 0
+      import SegmentEditorEffects
+      if not hasattr(SegmentEditorEffects,'SegmentEditorMaskVolumeEffect'):
+        # Slicer 4.11 and earlier - Mask volume is in an extension
+        import SegmentEditorMaskVolumeLib
+        maskVolumeWithSegment = SegmentEditorMaskVolumeLib.SegmentEditorEffect.maskVolumeWithSegment
+      else:        
+        maskVolumeWithSegment = SegmentEditorEffects.SegmentEditorMaskVolumeEffect.maskVolumeWithSegment
+      if intensity == True:
+        maskVolumeWithSegment(segmentationNode, segmentID, "FILL_OUTSIDE", [0], volumeNodeformasking, outputVolume, maskExtent) 
+      else: maskVolumeWithSegment(segmentationNode, segmentID, "FILL_INSIDE_AND_OUTSIDE", [1,0], volumeNodeformasking, outputVolume, maskExtent) 
+      extent = maskExtent 
+      
+      # Calculate the new origin
+      ijkToRas = vtk.vtkMatrix4x4()
+      outputVolume.GetIJKToRASMatrix(ijkToRas)
+      origin_IJK = [extent[0], extent[2], extent[4], 1]
+      origin_RAS = ijkToRas.MultiplyPoint(origin_IJK)
+      
+      # Pad and crop
+      padFilter = vtk.vtkImageConstantPad()
+      padFilter.SetInputData(outputVolume.GetImageData())
+      padFilter.SetOutputWholeExtent(extent)
+      padFilter.Update()
+      paddedImg = padFilter.GetOutput()
+
+      # Normalize output image
+      paddedImg.SetOrigin(0,0,0)
+      paddedImg.SetSpacing(1.0, 1.0, 1.0)
+      paddedImg.SetExtent(0, extent[1]-extent[0], 0, extent[3]-extent[2], 0, extent[5]-extent[4])
+      outputVolume.SetAndObserveImageData(paddedImg)
+      outputVolume.SetOrigin(origin_RAS[0], origin_RAS[1], origin_RAS[2])
+    
+        
+    with Profiling.activeStage("export"):
+      if not slicer.modules.segmentations.logic().ExportSegmentsToLabelmapNode(segmentationNode, segmentList, tempSegmentLabelmapVolumeNode, outputVolume):
+        return None
+      
+    with Profiling.activeStage("fetch"):
+      voxelArray = None
+      if volumeNode != None:  
+        # create array to calculate intensity
+        while True:
+          try:
+            voxelArray = slicer.util.arrayFromVolume(outputVolume)
+            break
+          except ValueError:
+            raise ValueError("The segment is outside of the volume's bounds!")   
+        voxelArray = voxelArray.copy() if intensity == True else None
+
+
+    # remove temporary output volume node if compactness is measured
+    if keepOutputVolume == False:
+      slicer.mrmlScene.RemoveNode(outputVolume)
+    
+    if volumeNode == None:
+      slicer.mrmlScene.RemoveNode(volumeNodeformasking)
+
+    with Profiling.activeStage("mask"):
+      labelArray = slicer.util.arrayFromVolume(tempSegmentLabelmapVolumeNode) != 0
+    return {"labelArray": labelArray,
+            "spacing": tuple(tempSegmentLabelmapVolumeNode.GetSpacing()),
+            "voxelArray": voxelArray}
+
+  def segmentArrays(self, segmentationNode, segmentID, volumeNode, intensity=False):
+    """
+    Get the binary labelmap of a segment (with its parent transform applied) straight from the
+    segmentation, on the voxel grid of volumeNode grown to hold the whole segment, and crop it
+    to the segment. No node is added to the scene. If the internal labelmap of the segmentation
+    is on the grid of the volume, which is the case when the segmentation was made on it, its
+    shared layer is read in place and only the voxels of the segment's label value inside its
+    bounding box are copied. Otherwise the segment is resampled to the grid of the volume first.
+    Returns the same entry as exportSegmentArrays, where the volume array is not masked, plus
+    the IJK index of the first voxel of the crop on the volume grid ("ijkOrigin").
+    """
+
+    from vtk.util import numpy_support
+    from SegmentGeometryLib import Profiling, SegmentBatch
+
+    # the untransformed volume geometry, as in exportSegmentArrays
+    volumeIjkToRas = vtk.vtkMatrix4x4()
+    volumeNode.GetIJKToRASMatrix(volumeIjkToRas)
+    volumeExtent = volumeNode.GetImageData().GetExtent()
+
+    # the internal labelmap can be used as it is if a linear parent transform keeps it on the volume grid
+    segment = segmentationNode.GetSegmentation().GetSegment(segmentID)
+    layer = segment.GetRepresentation(slicer.vtkSegmentationConverter.GetSegmentationBinaryLabelmapRepresentationName())
+    transformNode = segmentationNode.GetParentTransformNode()
+    offset = None
+    if (isinstance(layer, slicer.vtkOrientedImageData) and layer.GetPointData().GetScalars() is not None
+        and (transformNode is None or transformNode.IsTransformToWorldLinear())):
+      layerToWorld = vtk.vtkMatrix4x4()
+      layer.GetImageToWorldMatrix(layerToWorld)
+      transformToWorld = vtk.vtkMatrix4x4()
+      slicer.vtkMRMLTransformNode.GetMatrixTransformBetweenNodes(transformNode, None, transformToWorld)
+      vtk.vtkMatrix4x4.Multiply4x4(transformToWorld, layerToWorld, layerToWorld)
+      offset = SegmentBatch.gridOffset(slicer.util.arrayFromVTKMatrix(layerToWorld), slicer.util.arrayFromVTKMatrix(volumeIjkToRas))
+
+    if offset is not None:
+      labelmap = layer
+      labelValue = segment.GetLabelValue()
+    else:
+      with Profiling.activeStage("export"):
+        labelmap = slicer.vtkOrientedImageData()
+        slicer.vtkSlicerSegmentationsModuleLogic.GetSegmentBinaryLabelmapRepresentation(segmentationNode, segmentID, labelmap)
+        referenceGeometry = slicer.vtkOrientedImageData()
+        referenceGeometry.SetImageToWorldMatrix(volumeIjkToRas)
+        referenceGeometry.SetExtent(volumeExtent)
+        resampled = slicer.vtkOrientedImageData()
+        slicer.vtkOrientedImageDataResample.ResampleOrientedImageToReferenceOrientedImage(labelmap, referenceGeometry, resampled, False, True)
+      if resampled.GetPointData().GetScalars() is None:
+        return None
+      labelmap = resampled
+      offset = (0, 0, 0)
+      labelValue = None
+    labelExtent = labelmap.GetExtent()
+    with Profiling.activeStage("fetch"):
+      labelArray = numpy_support.vtk_to_numpy(labelmap.GetPointData().GetScalars()).reshape(
+        labelExtent[5]-labelExtent[4]+1, labelExtent[3]-labelExtent[2]+1, labelExtent[1]-labelExtent[0]+1)
+    # extent of the labelmap on the grid of the volume
+    labelExtent = [labelExtent[index] + offset[index // 2] for index in range(6)]
+
+    with Profiling.activeStage("crop"):
+      if labelValue is None:
+        box = SegmentBatch.foregroundBox(labelArray)
+      else:
+        box = SegmentBatch.labelBox(labelArray, labelValue)
+    if box is None:
+      return None
+    # only the bounding box of the segment is copied, as a boolean mask that the kernels use as it is
+    with Profiling.activeStage("mask"):
+      if labelValue is None:
+        segmentArray = labelArray[box] != 0
+      else:
+        segmentArray = labelArray[box] == labelValue
+    voxelArray = None
+    if intensity == True:
+      with Profiling.activeStage("fetch"):
+        # the same block of the volume, padded with zeros where the segment is outside of it
+        offset = [labelExtent[4]-volumeExtent[4], labelExtent[2]-volumeExtent[2], labelExtent[0]-volumeExtent[0]]
+        voxelArray = SegmentBatch.cropBlock(slicer.util.arrayFromVolume(volumeNode), [slice(b.start+o, b.stop+o) for b, o in zip(box, offset)])
+    # IJK index of the first voxel of the cropped arrays on the grid of the volume
+    ijkOrigin = (labelExtent[0]+box[2].start, labelExtent[2]+box[1].start, labelExtent[4]+box[0].start)
+    return {"labelArray": segmentArray, "spacing": tuple(volumeNode.GetSpacing()), "voxelArray": voxelArray,
+            "ijkOrigin": ijkOrigin}
+
+  def cachedSegmentArrays(self, segmentationNode, segmentID, volumeNode):
+    """
+    The arrays of segmentArrays (without the brightness) of a segment, reused from the labelmap
+    cache if the segment, the volume and their transforms did not change since they were made.
+    Raises ValueError if the segment is empty.
+    """
+    cacheKey = self.labelmapCacheKey(segmentationNode, segmentID, volumeNode, False, False)
+    cacheEntry = self.labelmapCache.get(cacheKey)
+    if cacheEntry is None:
+      cacheEntry = self.segmentArrays(segmentationNode, segmentID, volumeNode)
+      if cacheEntry is None:
+        raise ValueError("Segment {} is empty".format(segmentationNode.GetSegmentation().GetSegment(segmentID).GetName()))
+      self.labelmapCache.put(cacheKey, cacheEntry)
+    return cacheEntry
+
+  def segmentLabelmapArray(self, segmentationNode, segmentID):
+    """
+    Binary labelmap of a segment as a NumPy array in KJI order, without copying the internal
+    labelmap of the segmentation, with the 4x4 matrix from its indices to RAS (without the
+    parent transform of the segmentation) and the label value of the segment in the array
+    (None if the array was converted for this segment only, where it is the non-zero voxels).
+    Returns None if the segment is empty.
+    """
+
+    from vtk.util import numpy_support
+
+    segment = segmentationNode.GetSegmentation().GetSegment(segmentID)
+    labelmap = segment.GetRepresentation(slicer.vtkSegmentationConverter.GetSegmentationBinaryLabelmapRepresentationName())
+    if isinstance(labelmap, slicer.vtkOrientedImageData) and labelmap.GetPointData().GetScalars() is not None:
+      labelValue = segment.GetLabelValue()
+    else:
+      labelmap = slicer.vtkOrientedImageData()
+      slicer.vtkSlicerSegmentationsModuleLogic.GetSegmentBinaryLabelmapRepresentation(segmentationNode, segmentID, labelmap)
+      if labelmap.GetPointData().GetScalars() is None:
+        return None
+      labelValue = None
+    extent = labelmap.GetExtent()
+    labelArray = numpy_support.vtk_to_numpy(labelmap.GetPointData().GetScalars()).reshape(
+      extent[5]-extent[4]+1, extent[3]-extent[2]+1, extent[1]-extent[0]+1)
+    imageToWorld = vtk.vtkMatrix4x4()
+    labelmap.GetImageToWorldMatrix(imageToWorld)
+    ijkToRas = slicer.util.arrayFromVTKMatrix(imageToWorld)
+    # the array starts at the first voxel of the extent
+    ijkToRas[:3, 3] += ijkToRas[:3, :3] @ [extent[0], extent[2], extent[4]]
+    return labelArray, ijkToRas, labelValue
+
+  def segmentPrincipalAxes(self, segmentationNode, segmentID, maxVoxels=None):
+    """
+    Centroid and principal axes in RAS of a segment, without the parent transform of the
+    segmentation, from the voxels of its binary labelmap (see SegmentAxes.principalAxes). The
+    internal labelmap of the segment is read in place, so no node is added to the scene and the
+    other segments are not measured. If the bounding box of the segment holds more than
+    maxVoxels voxels, a regular subset of them is used. Returns None if the segment is empty.
+    """
+
+    from SegmentGeometryLib import SegmentAxes
+
+    segmentLabelmap = self.segmentLabelmapArray(segmentationNode, segmentID)
+    if segmentLabelmap is None:
+      return None
+    labelArray, ijkToRas, labelValue = segmentLabelmap
+    return SegmentAxes.principalAxes(labelArray, ijkToRas, labelValue, maxVoxels)
+
+  def segmentSliceCentroid(self, segmentationNode, segmentID, sliceToRas):
+    """
+    Centroid in world RAS of the section of a segment by the plane of a slice view, given as the
+    SliceToRAS matrix (4x4 array) of its slice node, or None if the plane misses the segment (see
+    SegmentAxes.planeCentroid). The plane is probed in the internal labelmap of the segment,
+    through the parent transform of the segmentation, so no node is added to the scene. Returns
+    None for segmentations under a non-linear transform.
+    """
+
+    from SegmentGeometryLib import SegmentAxes
+
+    segmentLabelmap = self.segmentLabelmapArray(segmentationNode, segmentID)
+    if segmentLabelmap is None:
+      return None
+    labelArray, ijkToRas, labelValue = segmentLabelmap
+    toWorld = vtk.vtkMatrix4x4()
+    if not slicer.vtkMRMLTransformNode.GetMatrixTransformBetweenNodes(segmentationNode.GetParentTransformNode(), None, toWorld):
+      return None
+    ijkToWorld = slicer.util.arrayFromVTKMatrix(toWorld) @ ijkToRas
+    return SegmentAxes.planeCentroid(labelArray, ijkToWorld, sliceToRas, labelValue)
+
+  def updateOrientation(self, angle):
+    """
+    Re-derive the custom neutral axis columns of the last run for a new angle (degrees) from the
+    kept moment tensors and boundary pixels, and write them into its table in place so that the
+    table and plots update. Returns False if there is nothing to update.
+    """
+    from vtk.util import numpy_support
+    from SegmentGeometryLib import SectionMoments, SectionTable
+
+    state = self.orientationState
+    if state is None or state["tableNode"].GetScene() is None:
+      return False
+    props = SectionMoments.tensorOrientation(state["tensors"], angle)
+    columns = SectionTable.orientationColumns(props, state["numSlices"], state["pixelWidth"], state["pixelDepth"],
+                                              state["doube"], state["summers"])
+    table = state["tableNode"].GetTable()
+    for name, values in columns.items():
+      column = table.GetColumnByName(name)
+      if column is None or column.GetNumberOfTuples() != len(values):
+        continue
+      numpy_support.vtk_to_numpy(column)[:] = values
+      column.Modified()
+    table.Modified()
+    state["tableNode"].Modified()
+    # the normalized columns that are switched on later are derived from the new angle
+    if self.normalizationState is not None and self.normalizationState["tableNode"] is state["tableNode"]:
+      self.normalizationState["columns"].update({name: values for name, values in columns.items() if not name.endswith("Norm)")})
+    return True
+
+  def updateNormalization(self, doube, summers):
+    """
+    Add or remove the Doube and Summers normalized columns of the last run in its table when the
+    normalizations are switched after the run, deriving them from the kept columns in mm instead
+    of measuring the segment again. Returns False if there is nothing to update.
+    """
+    state = self.normalizationState
+    if state is None or state["tableNode"].GetScene() is None:
+      return False
+    tableNode = state["tableNode"]
+    table = tableNode.GetTable()
+    columns = state["columns"]
+    selected = columns.derivedNames(doube, summers, state["names"])
+    for name in columns.derivedNames(True, True, state["names"]):
+      if name not in selected and table.GetColumnByName(name) is not None:
+        table.RemoveColumnByName(name)
+    self.addTableColumns(tableNode, columns, [name for name in selected if table.GetColumnByName(name) is None])
+    if self.orientationState is not None and self.orientationState["tableNode"] is tableNode:
+      self.orientationState["doube"] = doube
+      self.orientationState["summers"] = summers
+    return True
+
+  def addTableColumns(self, tableNode, columns, names):
+    """
+    Add the columns (name -> NumPy array) listed in names to tableNode in one call per column,
+    with the unit labels and descriptions of SectionTable.columnInfo. Numeric columns are
+    converted to float (or int for the slice index) once and shared with VTK without copying.
+    """
+
+    import numpy as np
+    from vtk.util import numpy_support
+    from SegmentGeometryLib import SectionTable
+
+    for name in names:
+      values = columns[name]
+      if name == "Segment":
+        columnArray = vtk.vtkStringArray()
+        columnArray.SetNumberOfValues(len(values))
+        for row, segName in enumerate(values):
+          columnArray.SetValue(row, segName)
+      elif name == "Slice Index":
+        columnArray = numpy_support.numpy_to_vtk(np.ascontiguousarray(values, dtype=np.int32), deep=False, array_type=vtk.VTK_INT)
+      else:
+        columnArray = numpy_support.numpy_to_vtk(np.ascontiguousarray(values, dtype=np.float32), deep=False, array_type=vtk.VTK_FLOAT)
+      columnArray.SetName(name)
+      tableNode.AddColumn(columnArray)
+      unit, description = SectionTable.columnInfo(name)
+      if unit is not None:
+        tableNode.SetColumnUnitLabel(name, unit)
+      if description is not None:
+        tableNode.SetColumnDescription(name, description)
+    tableNode.Modified()
+
+  def computeBatch(self, segmentationNode, segmentIDs, volumeNode, axis, interval, angle=None, workers=None):
+    """
+    Compute the section properties of several segments without touching any table, plot or widget.
+    All segments are exported with a single call to one multi-label labelmap in the geometry of
+    volumeNode (or of the segmentation if volumeNode is None) and measured from that shared array.
+    Returns the table columns of all segments (name -> array), with the segment name of every row
+    in the "Segment" column. Segments must not overlap, as each voxel of the labelmap holds a single segment.
+    """
+
+    from SegmentGeometryLib import Profiling, SegmentBatch
+
+    if not segmentationNode:
+      raise ValueError("Segmentation node is invalid")
+    if len(segmentIDs) == 0:
+      raise ValueError("No segments selected")
+
+    axisIndex = axisIndexFromName(axis)
+
+    segmentNames = [segmentationNode.GetSegmentation().GetSegment(segmentID).GetName() for segmentID in segmentIDs]
+    segmentList = vtk.vtkStringArray()
+    for segmentID in segmentIDs:
+      segmentList.InsertNextValue(segmentID)
+
+    tempSegmentLabelmapVolumeNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLLabelMapVolumeNode', "SegmentGeometryBatchTemp")
+    try:
+      with Profiling.activeStage("export", segments=len(segmentIDs)):
+        if not slicer.modules.segmentations.logic().ExportSegmentsToLabelmapNode(segmentationNode, segmentList, tempSegmentLabelmapVolumeNode, volumeNode):
+          raise ValueError("Failed to export the segments to a labelmap")
+      with Profiling.activeStage("fetch"):
+        narray = slicer.util.arrayFromVolume(tempSegmentLabelmapVolumeNode)
+      spacing = tempSegmentLabelmapVolumeNode.GetSpacing()
+      with Profiling.activeStage("columns"):
+        columns = SegmentBatch.batchColumns(narray, segmentNames, axisIndex, interval, spacing, angle, workers)
+    finally:
+      slicer.mrmlScene.RemoveNode(tempSegmentLabelmapVolumeNode)
+      slicer.mrmlScene.RemoveNode(slicer.mrmlScene.GetFirstNodeByName("SegmentGeometryBatchTemp_ColorTable"))
+    return columns
+
+  def computePolarProfile(self, segmentationNode, segmentID, volumeNode, axis, interval, angles=None, workers=None):
+    """
+    Compute the second moment of area, max distance and section modulus of every sampled slice
+    of a segment around the axes through its centroid at all angles (degrees, 0 to 179 in 1
+    degree steps by default). The moment tensors and boundary pixels are extracted once and
+    all angles are derived from them, so it takes about as long as one run.
+    Returns a dictionary with "Slice Index", "Percent (%)", "Angles" and the slice by angle
+    arrays "I" (mm^4), "R" (mm) and "Z" (mm^3).
+    """
+
+    import numpy as np
+    from SegmentGeometryLib import SectionMoments, SegmentBatch, SliceChunks
+
+    if not segmentationNode:
+      raise ValueError("Segmentation node is invalid")
+
+    axisIndex = axisIndexFromName(axis)
+
+    if angles is None:
+      angles = np.arange(180)
+    angles = np.asarray(angles, dtype=np.float64)
+
+    cacheEntry = self.cachedSegmentArrays(segmentationNode, segmentID, volumeNode)
+    narray = cacheEntry["labelArray"]
+    spacing = cacheEntry["spacing"]
+
+    PixelWidthMm, PixelHeightMm = [spacing[i] for i in range(3) if i != axisIndex]
+    unitOfPixelMm4 = PixelWidthMm**4
+
+    sampleSlices, percentLength = SegmentBatch.sampleSliceIndices(narray.shape[2-axisIndex], interval)
+    tensors = SliceChunks.mapSliceChunks(SectionMoments.stackSectionTensors, narray, axisIndex, sampleSlices, workers,
+                                         PixelHeightMm / PixelWidthMm)
+    profile = SectionMoments.polarProfile(tensors, angles)
+    return {"Slice Index": sampleSlices, "Percent (%)": percentLength, "Angles": angles,
+            "I": profile["I"] * unitOfPixelMm4, "R": profile["R"] * PixelWidthMm, "Z": profile["Z"] * unitOfPixelMm4 / PixelWidthMm}
+
+  def computeDirectionSections(self, segmentationNode, segmentID, volumeNode, direction, interval=0, thickness=None, angle=None, chunkVoxels=None):
+    """
+    Compute the section properties of a segment along any direction, given as a RAS vector
+    (for example the z axis of the oriented bounding box from Segment Statistics) or as a
+    markups line node. The voxels of the segment on the grid of volumeNode are projected on the
+    direction and the moments are accumulated in the rotated section plane (see
+    ObliqueSections), so neither the segment nor the volume is aligned or resampled first.
+    Sections are thickness mm apart, the smallest voxel size by default.
+    Returns the table columns (name -> array) with the names and units of run.
+    """
+
+    import numpy as np
+    from SegmentGeometryLib import ObliqueSections, SectionTable, SegmentBatch
+
+    if not segmentationNode:
+      raise ValueError("Segmentation node is invalid")
+    if not volumeNode:
+      raise ValueError("Volume node is invalid")
+
+    if hasattr(direction, "GetNthControlPointPositionWorld"):
+      if direction.GetNumberOfControlPoints() < 2:
+        raise ValueError("Direction line needs two points")
+      start = np.zeros(3)
+      end = np.zeros(3)
+      direction.GetNthControlPointPositionWorld(0, start)
+      direction.GetNthControlPointPositionWorld(1, end)
+      direction = end - start
+
+    cacheEntry = self.cachedSegmentArrays(segmentationNode, segmentID, volumeNode)
+    narray = cacheEntry["labelArray"]
+    spacing = np.asarray(cacheEntry["spacing"], dtype=np.float64)
+
+    # direction in the IJK axes of the array, scaled to mm
+    rasToIjk = vtk.vtkMatrix4x4()
+    volumeNode.GetRASToIJKMatrix(rasToIjk)
+    rasToIjk = slicer.util.arrayFromVTKMatrix(rasToIjk)[:3, :3]
+    ijkDirection = spacing * (rasToIjk @ np.asarray(direction, dtype=np.float64))
+
+    if chunkVoxels is None:
+      chunkVoxels = ObliqueSections.DEFAULT_CHUNK_VOXELS
+    props = ObliqueSections.obliqueSectionProperties(narray, spacing, ijkDirection, thickness, angle, chunkVoxels)
+    if thickness is None:
+      thickness = spacing.min()
+
+    numSlices = len(props["CSA"])
+    sampleSlices, percentLength = SegmentBatch.sampleSliceIndices(numSlices, interval)
+    props = {key: values[sampleSlices] for key, values in props.items()}
+    columns = {"Slice Index": sampleSlices, "Percent (%)": percentLength}
+    columns.update(SectionTable.sectionColumns(props, numSlices, thickness, thickness))
+    return columns
+
+  def runDirectionSections(self, segmentationNode, segmentID, volumeNode, direction, tableNode, interval=0, thickness=None, angle=None):
+    """
+    Compute the section properties of a segment along any direction (see
+    computeDirectionSections) and write them to tableNode. Returns the columns.
+    """
+    return self.runColumns("Direction sections", tableNode, self.computeDirectionSections,
+                           segmentationNode, segmentID, volumeNode, direction, interval, thickness, angle)
+
+  def computeCurveSections(self, segmentationNode, segmentID, volumeNode, curveNode, numStations=100, angle=None, chunkVoxels=None):
+    """
+    Compute the section properties of a curved segment, such as a rib or a mandible, on the
+    planes perpendicular to a markups curve (drawn by hand or extracted as a centerline) at
+    numStations equally spaced stations along it. The voxels of the segment on the grid of
+    volumeNode are assigned to the closest stations and projected on their planes (see
+    ObliqueSections.curveSectionProperties), so nothing is resliced station by station.
+    Returns the table columns (name -> array) with the names and units of run, where the slice
+    index is the station number and Cx and Cy are the offsets of the centroid from the curve.
+    """
+
+    import numpy as np
+    from SegmentGeometryLib import ObliqueSections, SectionTable, SegmentBatch
+
+    if not segmentationNode:
+      raise ValueError("Segmentation node is invalid")
+    if not volumeNode:
+      raise ValueError("Volume node is invalid")
+    if numStations < 2:
+      raise ValueError("Invalid number of stations: "+str(numStations))
+
+    curvePoints = slicer.util.arrayFromMarkupsCurvePoints(curveNode, world=True)
+    if len(curvePoints) < 2:
+      raise ValueError("Curve needs at least two points")
+
+    cacheEntry = self.cachedSegmentArrays(segmentationNode, segmentID, volumeNode)
+    narray = cacheEntry["labelArray"]
+    spacing = np.asarray(cacheEntry["spacing"], dtype=np.float64)
+
+    # equally spaced stations along the curve
+    arcLength = np.concatenate(([0], np.cumsum(np.linalg.norm(np.diff(curvePoints, axis=0), axis=1))))
+    stationLength = np.linspace(0, arcLength[-1], numStations)
+    stations = np.stack([np.interp(stationLength, arcLength, curvePoints[:, i]) for i in range(3)], axis=1)
+
+    # stations in mm along the IJK axes of the cropped array
+    rasToIjk = vtk.vtkMatrix4x4()
+    volumeNode.GetRASToIJKMatrix(rasToIjk)
+    rasToIjk = slicer.util.arrayFromVTKMatrix(rasToIjk)
+    stations = ((stations @ rasToIjk[:3, :3].T + rasToIjk[:3, 3]) - cacheEntry["ijkOrigin"]) * spacing
+
+    if chunkVoxels is None:
+      chunkVoxels = ObliqueSections.DEFAULT_CHUNK_VOXELS
+    props = ObliqueSections.curveSectionProperties(narray, spacing, stations, angle, chunkVoxels)
+    thickness = np.linalg.norm(np.diff(stations, axis=0), axis=1).mean()
+
+    sampleSlices, percentLength = SegmentBatch.sampleSliceIndices(numStations, 0)
+    columns = {"Slice Index": sampleSlices, "Percent (%)": percentLength}
+    columns.update(SectionTable.sectionColumns(props, numStations, thickness, thickness))
+    return columns
+
+  def runCurveSections(self, segmentationNode, segmentID, volumeNode, curveNode, tableNode, numStations=100, angle=None):
+    """
+    Compute the section properties of a segment along a curve (see computeCurveSections) and
+    write them to tableNode. Returns the columns.
+    """
+    return self.runColumns("Curve sections", tableNode, self.computeCurveSections,
+                           segmentationNode, segmentID, volumeNode, curveNode, numStations, angle)
+
+  def computeStreamedSections(self, labelmapPath, axis, interval, segmentName=None, volumePath=None, angle=None, maxBytes=None):
+    """
+    Compute the section properties of a segment that is too large to load, from an uncompressed
+    NRRD file that is memory mapped and read in slabs of slices (see SlabStream). labelmapPath is
+    a labelmap volume or a segmentation (.seg.nrrd) file; segmentName selects a segment of a
+    segmentation by name, the first one if None. If volumePath is given, the mean brightness
+    is measured on that volume, which has to be on the same voxel grid. maxBytes bounds the
+    memory of the slabs (SlabStream.DEFAULT_MEMORY_BYTES if None). The columns are the same as
+    those of a run on the segment in memory.
+    """
+
+    from SegmentGeometryLib import SlabStream
+
+    axisIndex = axisIndexFromName(axis)
+    if maxBytes is None:
+      maxBytes = SlabStream.DEFAULT_MEMORY_BYTES
+
+    array, header = SlabStream.readNrrd(labelmapPath)
+    if "Segment0_ID" in header:
+      if segmentName is None:
+        segmentName = header["Segment0_Name"]
+      layer, labelValue = SlabStream.nrrdSegment(header, segmentName)
+      labelArray = SlabStream.LabelLayer(array, labelValue, layer if array.ndim == 4 else None)
+    else:
+      labelArray = array
+    voxelArray = None
+    if volumePath is not None:
+      voxelArray = SlabStream.readNrrd(volumePath)[0]
+    return SlabStream.streamColumns(labelArray, axisIndex, interval, SlabStream.nrrdSpacing(header), angle, maxBytes, voxelArray)
+
+  def runStreamedSections(self, labelmapPath, axis, interval, tableNode, segmentName=None, volumePath=None, angle=None, maxBytes=None):
+    """
+    Compute the section properties of a segment read from a file in slabs (see
+    computeStreamedSections) and write them to tableNode. Returns the columns.
+    """
+    return self.runColumns("Streamed sections", tableNode, self.computeStreamedSections,
+                           labelmapPath, axis, interval, segmentName, volumePath, angle, maxBytes)
+
+  def runPolarProfile(self, segmentationNode, segmentID, volumeNode, axis, interval, tableNode, angles=None, workers=None):
+    """
+    Compute the polar profile of a segment (see computePolarProfile) and write it to tableNode
+    as a slice by angle matrix, with one I and one Z column per angle. Returns the profile.
+    """
+
+    from SegmentGeometryLib import SectionTable
+
+    profile = {}
+    def profileColumns():
+      profile.update(self.computePolarProfile(segmentationNode, segmentID, volumeNode, axis, interval, angles, workers))
+      columns = {"Slice Index": profile["Slice Index"], "Percent (%)": profile["Percent (%)"]}
+      columns.update(SectionTable.polarColumns(profile))
+      return columns
+
+    self.runColumns("Polar profile", tableNode, profileColumns)
+    return profile
+
+  def runColumns(self, name, tableNode, compute, *args):
+    """
+    Call compute(*args), which returns table columns (name -> array), replace the columns of
+    tableNode with them and log how long it took under name. Returns the columns.
+    """
+
+    import time
+
+    start = time.time()
+    logging.info(name + ' started')
+    columns = compute(*args)
+    tableNode.RemoveAllColumns()
+    self.addTableColumns(tableNode, columns, list(columns))
+    logging.info("{} completed in {:.2f} seconds".format(name, time.time() - start))
+    return columns
+
+#
+# SegmentCrossSectionAreaTest
+#
+
+class SegmentGeometryTest(ScriptedLoadableModuleTest):
+  """
+  This is the test case for your scripted module.
+  Uses ScriptedLoadableModuleTest base class, available at:
+  https://github.com/Slicer/Slicer/blob/master/Base/Python/slicer/ScriptedLoadableModule.py
+  """
+  
+  def setUp(self):
+    """ Do whatever is needed to reset the state - typically a scene clear will be enough.
+    """
+    slicer.mrmlScene.Clear(0)
+
+  def runTest(self):
+    """Run as few or as many tests as needed here.
+    """
+    self.setUp()
+    self.test_SegmentGeometry1()
+    self.test_SectionMoments1()
+    self.test_SectionPerimeter1()
+    self.test_SectionFeret1()
+    self.test_SliceChunks1()
+    self.test_SegmentBatch1()
+    self.test_BatchCLI1()
+    self.test_SectionTable1()
+    self.test_LabelmapCache1()
+    self.test_NeutralAxis1()
+    self.test_PolarProfile1()
+    self.test_ObliqueSections1()
+    self.test_AnisotropicSpacing1()
+    self.test_CurveSections1()
+    self.test_SectionMetrics1()
+    self.test_SharedLabelmap1()
+    self.test_SlabStream1()
+    self.test_CompactMasks1()
+    self.test_Benchmark1()
+    self.test_Profiling1()
+    self.test_PrincipalAxes1()
+    self.test_SliceProbe1()
+    self.test_NormalizedColumns1()
+    self.test_WeightedMoments1()
+
+  def taperedLabelmap(self, bore=True, gap=True):
+    """ Labelmap (120 slices of 80x90) of elliptic sections whose width varies along the slices,
+    with a rectangular bore through all the slices and five empty slices from slice 50.
+    """
+    import numpy as np
+    kk, jj, ii = np.ogrid[0:120, 0:80, 0:90]
+    narray = ((ii - 45)**2 / (20 + 10*np.sin(kk/15))**2 + (jj - 40)**2 / 25**2 <= 1).astype(np.uint8)
+    if bore == True:
+      narray[:, (np.abs(ii[0] - 45) < 6) & (np.abs(jj[0] - 40) < 4)] = 0
+    if gap == True:
+      narray[50:55] = 0
+    return narray
+
+  def test_SegmentGeometry1(self):
+    """ Ideally you should have several levels of tests.  At the lowest level
+    tests should exercise the functionality of the logic with different inputs
+    (both valid and invalid).  At higher levels your tests should emulate the
+    way the user would interact with your code and confirm that it still works
+    the way you intended.
+    One of the most important features of the tests is that it should alert other
+    developers when their changes will have an impact on the behavior of your
+    module.  For example, if a developer removes a feature that you depend on,
+    your test should break so they know that the feature is needed.
+    """
+
+    self.delayDisplay("Starting the test")
+
+    # Load master volume
+    import SampleData
+    sampleDataLogic = SampleData.SampleDataLogic()
+    masterVolumeNode = sampleDataLogic.downloadMRBrainTumor1()
     #sampleDataLogic.downloadDentalSurgery()
     #masterVolumeNode = slicer.util.getFirstNodeByName("PreDentalSurgery")
 
@@ -2695,6 +2413,7 @@ class SegmentGeometryTest(ScriptedLoadableModuleTest):
     logic.run(segmentationNode, segmentId, masterVolumeNode, "S (Red)", 0, tableNode, plotChartNode, True, True, True, False, True, True,
     True, True, 0, True, True, True, True, True,True, segmentationNode, segmentId, True, True, True)
     import math
+    import numpy as np
     # Compute CSA error
     crossSectionAreas = slicer.util.arrayFromTableColumn(tableNode, "CSA (mm^2)")
     largestCrossSectionArea = crossSectionAreas.max()
@@ -2729,4 +2448,1240 @@ class SegmentGeometryTest(ScriptedLoadableModuleTest):
     self.assertTrue(errorPercent2 < 2.0)
     self.assertTrue(errorPercent3 < 2.0)
 
+    # A second run with other columns reuses the exported labelmap
+    firstAreas = crossSectionAreas.copy()
+    cachedEntries = len(logic.labelmapCache)
+    self.assertTrue(cachedEntries > 0)
+    logic.run(segmentationNode, segmentId, masterVolumeNode, "S (Red)", 0, tableNode, plotChartNode, True, False, True, False, True, True,
+    True, True, 0, True, True, False, False, True,True, segmentationNode, segmentId, True, False, True)
+    self.assertEqual(len(logic.labelmapCache), cachedEntries)
+    np.testing.assert_array_equal(slicer.util.arrayFromTableColumn(tableNode, "CSA (mm^2)"), firstAreas)
+    logic.labelmapCache.invalidate(segmentationNode.GetID())
+    self.assertEqual(len(logic.labelmapCache), 0)
+
+    # The export through temporary nodes gives the same volume up to the voxelization of the segment
+    logic.run(segmentationNode, segmentId, masterVolumeNode, "S (Red)", 0, tableNode, plotChartNode, True, False, True, False, True, True,
+    True, True, 0, True, True, False, False, True,True, segmentationNode, segmentId, True, False, True, sceneFree=False)
+    sceneAreas = slicer.util.arrayFromTableColumn(tableNode, "CSA (mm^2)")
+    self.assertTrue(abs(1 - sceneAreas.sum() / firstAreas.sum()) < 0.01)
+
+    # Measure two separate segments from a single labelmap export
+    radius2 = 15
+    tumorSeed2 = vtk.vtkSphereSource()
+    tumorSeed2.SetCenter(-6, -40, 28)
+    tumorSeed2.SetRadius(radius2)
+    tumorSeed2.SetPhiResolution(120)
+    tumorSeed2.SetThetaResolution(120)
+    tumorSeed2.Update()
+    segmentId3 = segmentationNode.AddSegmentFromClosedSurfaceRepresentation(tumorSeed2.GetOutput(), "Tumor 2",
+                                                                            [0.0, 1.0, 0.0])
+    batchTableNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTableNode", "SegmentGeometry batch test table")
+    logic.runBatch(segmentationNode, [segmentId, segmentId3], masterVolumeNode, "S (Red)", 0, batchTableNode)
+    segmentNames = [batchTableNode.GetCellText(row, 0) for row in range(batchTableNode.GetNumberOfRows())]
+    crossSectionAreas = slicer.util.arrayFromTableColumn(batchTableNode, "CSA (mm^2)")
+    for segName, expectedRadius in (("Tumor", radius), ("Tumor 2", radius2)):
+      segmentRows = np.asarray(segmentNames) == segName
+      self.assertTrue(segmentRows.any())
+      expectedArea = expectedRadius*expectedRadius*math.pi
+      errorPercent = 100.0 * abs(1-(crossSectionAreas[segmentRows].max() / expectedArea))
+      logging.info("{0} largest cross-section area error: {1:.2f}%".format(segName, errorPercent))
+      self.assertTrue(errorPercent < 2.0)
+
+    self.delayDisplay('Test passed')
+
+  def test_SectionMoments1(self):
+    """ Check the vectorized section property engine against closed-form values
+    for a rectangular section, where the pixel self moment makes the result exact.
+    """
+
+    self.delayDisplay("Starting the section moments test")
+
+    import numpy as np
+    from SegmentGeometryLib import SectionMoments
+
+    width, height = 40, 16
+    coords_Kji = np.where(np.ones((height, width)))
+    props = SectionMoments.sliceProperties(coords_Kji[1] + 7, coords_Kji[0] + 3, 90)
+
+    self.assertAlmostEqual(props["Cx"], 7 + (width-1)/2)
+    self.assertAlmostEqual(props["Cy"], 3 + (height-1)/2)
+    self.assertAlmostEqual(props["Theta"], 0)
+    self.assertAlmostEqual(props["Imajor"], width * height**3 / 12)
+    self.assertAlmostEqual(props["Iminor"], height * width**3 / 12)
+    self.assertAlmostEqual(props["Rmajor"], (height-1)/2)
+    self.assertAlmostEqual(props["Rminor"], (width-1)/2)
+    # a neutral axis at 90 degrees swaps the roles of the two axes
+    self.assertAlmostEqual(props["Ina"], props["Iminor"])
+    self.assertAlmostEqual(props["Ila"], props["Imajor"])
+
+    # the whole-stack pass must agree with the slice by slice computation
+    kk, jj, ii = np.mgrid[0:12, 0:50, 0:60]
+    narray = ((ii - 30)**2 / (8 + kk)**2 + (jj - 24)**2 / (4 + kk/2)**2 <= 1).astype(np.uint8)
+    narray[0] = 0
+    sampleSlices = np.arange(12)
+    stackProps = SectionMoments.stackProperties(narray, 2, sampleSlices, 30)
+    self.assertEqual(stackProps["CSA"][0], 0)
+    for i in sampleSlices[1:]:
+      coords_Kji = np.where(narray[i] > 0)
+      props = SectionMoments.sliceProperties(coords_Kji[1], coords_Kji[0], 30)
+      self.assertEqual(stackProps["CSA"][i], len(coords_Kji[0]))
+      for key in props:
+        self.assertAlmostEqual(stackProps[key][i], props[key], places=6)
+
+    self.delayDisplay('Test passed')
+
+  def test_SectionPerimeter1(self):
+    """ Check the contour perimeter on sections with several islands and holes
+    and compare its speed with the legacy boundary tracer.
+    """
+
+    self.delayDisplay("Starting the section perimeter test")
+
+    import numpy as np
+    import time
+    from SegmentGeometryLib import SectionPerimeter
+
+    # the contour of a rectangle runs along its edges with the corners cut diagonally
+    narray = np.zeros((4, 30, 40), dtype=np.uint8)
+    narray[1, 5:9, 10:15] = 1
+    perimeters = SectionPerimeter.stackPerimeter(narray, 2, np.arange(4))
+    self.assertAlmostEqual(perimeters[1], 2*(5-1) + 2*(4-1) + 4*np.sqrt(0.5), places=5)
+    self.assertEqual(perimeters[0], 0)
+
+    # two islands add up
+    narray[2, 5:9, 10:15] = 1
+    narray[2, 20:24, 25:30] = 1
+    # the outline of a hole is counted as well
+    narray[3, 5:15, 10:20] = 1
+    narray[3, 8:12, 13:17] = 0
+    perimeters = SectionPerimeter.stackPerimeter(narray, 2, [3, 2, 1])
+    self.assertAlmostEqual(perimeters[1], 2 * perimeters[2], places=5)
+    # a 10x10 square with a 4x4 hole
+    self.assertAlmostEqual(perimeters[0], 4*(10-1) + 4*(4-1) + 8*np.sqrt(0.5), places=5)
+
+    # both methods agree closely on a single convex island
+    kk, jj, ii = np.mgrid[0:200, 0:120, 0:120]
+    narray = ((ii - 60)**2 + (jj - 60)**2 <= (20 + kk/5)**2).astype(np.uint8)
+    sampleSlices = np.arange(200)
+    startTime = time.time()
+    tracer = [SectionPerimeter.tracerPerimeter(*np.where(narray[i].T > 0)) for i in sampleSlices]
+    tracerTime = time.time() - startTime
+    startTime = time.time()
+    contour = SectionPerimeter.stackPerimeter(narray, 2, sampleSlices)
+    contourTime = time.time() - startTime
+    np.testing.assert_allclose(contour, tracer, rtol=0.05)
+    logging.info("Perimeter of {} slices: tracer {:.3f} s, contour {:.3f} s ({:.1f}x faster)".format(
+      len(sampleSlices), tracerTime, contourTime, tracerTime / contourTime))
+
+    self.delayDisplay('Test passed')
+
+  def test_SectionFeret1(self):
+    """ Check the rotating calipers feret diameters against closed-form values and
+    against the convex hull of all pixels, and compare the speed of both approaches.
+    """
+
+    self.delayDisplay("Starting the section feret test")
+
+    import numpy as np
+    import time
+    from scipy.spatial import ConvexHull
+    from scipy.spatial.distance import pdist
+    from SegmentGeometryLib import SectionFeret
+
+    # rectangle, single pixel, line and empty slice
+    narray = np.zeros((4, 30, 40), dtype=np.uint8)
+    narray[0, 5:10, 5:25] = 1
+    narray[1, 12, 7] = 1
+    narray[2, 3:23, 9] = 1
+    ferets = SectionFeret.stackFeret(narray, 2, np.arange(4))
+    self.assertAlmostEqual(ferets["MaxFeret"][0], np.hypot(19, 4))
+    self.assertAlmostEqual(ferets["MinFeret"][0], 4)
+    self.assertAlmostEqual(ferets["MinFeretAngle"][0], 90)
+    self.assertEqual(ferets["MaxFeret"][1], 0)
+    self.assertAlmostEqual(ferets["MaxFeret"][2], 19)
+    self.assertAlmostEqual(ferets["MaxFeretAngle"][2], 90)
+    self.assertAlmostEqual(ferets["MinFeret"][2], 0)
+    self.assertEqual(ferets["MaxFeret"][3], 0)
+
+    # irregular sections with several islands
+    rng = np.random.default_rng(0)
+    kk, jj, ii = np.mgrid[0:100, 0:80, 0:80]
+    narray = ((ii - 40)**2 / (10 + kk/5)**2 + (jj - 40)**2 / (25 - kk/5)**2 <= 1).astype(np.uint8)
+    narray[rng.random(narray.shape) < 0.002] = 1
+    sampleSlices = np.arange(100)
+    startTime = time.time()
+    ferets = SectionFeret.stackFeret(narray, 2, sampleSlices)
+    caliperTime = time.time() - startTime
+
+    startTime = time.time()
+    for i in sampleSlices:
+      coords_Kji = np.where(narray[i] > 0)
+      points = np.stack((coords_Kji[1], coords_Kji[0]), axis=1).astype(float)
+      hull_pts = points[ConvexHull(points).vertices]
+      edges = np.roll(hull_pts, -1, axis=0) - hull_pts
+      normals = np.stack((-edges[:,1], edges[:,0]), axis=1) / np.linalg.norm(edges, axis=1)[:,None]
+      projections = hull_pts @ normals.T
+      self.assertAlmostEqual(ferets["MaxFeret"][i], pdist(hull_pts).max())
+      self.assertAlmostEqual(ferets["MinFeret"][i], (projections.max(axis=0) - projections.min(axis=0)).min())
+    hullTime = time.time() - startTime
+    logging.info("Feret diameters of {} slices: all pixel hulls {:.3f} s, rotating calipers {:.3f} s ({:.1f}x faster)".format(
+      len(sampleSlices), hullTime, caliperTime, hullTime / caliperTime))
+
+    self.delayDisplay('Test passed')
+
+  def test_SliceChunks1(self):
+    """ Check that processing chunks of slices in parallel gives the same results as
+    the serial computation and log how the run time scales with the number of workers.
+    """
+
+    self.delayDisplay("Starting the parallel slice processing test")
+
+    import numpy as np
+    import time
+    from SegmentGeometryLib import SectionFeret, SectionMoments, SectionPerimeter, SliceChunks
+
+    kk, jj, ii = np.ogrid[0:300, 0:150, 0:150]
+    narray = ((ii - 75)**2 / (30 + 25*np.sin(kk/40))**2 + (jj - 75)**2 / 40**2 <= 1).astype(np.uint8)
+    sampleSlices = np.arange(0, 300, 2)
+
+    for function, args in ((SectionMoments.stackProperties, (30,)), (SectionPerimeter.stackPerimeter, ()),
+                           (SectionFeret.stackFeret, ())):
+      timings = []
+      for workers in (1, 2, 4, 8):
+        startTime = time.time()
+        results = SliceChunks.mapSliceChunks(function, narray, 2, sampleSlices, workers, *args)
+        timings.append("{} workers {:.3f} s".format(workers, time.time() - startTime))
+        if workers == 1:
+          serial = results
+        elif isinstance(results, dict):
+          for key in serial:
+            np.testing.assert_array_equal(results[key], serial[key])
+        else:
+          np.testing.assert_array_equal(results, serial)
+      logging.info(function.__name__ + ": " + ", ".join(timings))
+
+    # two parts 180 slices apart, where some chunks of 4 workers have no foreground
+    twoParts = narray.copy()
+    twoParts[60:240] = 0
+    self.assertTrue(any(not twoParts[chunk].any() for chunk in SliceChunks.sliceChunks(sampleSlices, 4)))
+    for function, args in ((SectionMoments.stackProperties, (30,)), (SectionMoments.stackSectionTensors, ()),
+                           (SectionPerimeter.stackPerimeter, ()), (SectionFeret.stackFeret, ())):
+      serial = function(twoParts, 2, sampleSlices, *args)
+      results = SliceChunks.mapSliceChunks(function, twoParts, 2, sampleSlices, 4, *args)
+      if isinstance(results, dict):
+        for key in serial:
+          np.testing.assert_array_equal(results[key], serial[key])
+      else:
+        np.testing.assert_array_equal(results, serial)
+
+    self.delayDisplay('Test passed')
+
+  def test_SegmentBatch1(self):
+    """ Check that measuring several segments from one multi-label array gives the same
+    results as measuring every segment on its own.
+    """
+
+    self.delayDisplay("Starting the segment batch test")
+
+    import numpy as np
+    from SegmentGeometryLib import SegmentBatch
+
+    sampleSlices, percentLength = SegmentBatch.sampleSliceIndices(200, 10)
+    np.testing.assert_array_equal(sampleSlices, np.arange(19, 200, 20))
+    self.assertEqual(percentLength[-1], 100)
+    sampleSlices, percentLength = SegmentBatch.sampleSliceIndices(50, 10)
+    np.testing.assert_array_equal(sampleSlices, np.arange(50))
+
+    # three bones side by side in one labelmap
+    kk, jj, ii = np.ogrid[0:120, 0:60, 0:150]
+    labelArray = np.zeros((120, 60, 150), dtype=np.uint8)
+    labelArray[((ii - 25)**2 + (jj - 30)**2 <= 15**2) & (kk >= 10)] = 1
+    labelArray[((ii - 75)**2 / 20**2 + (jj - 30)**2 / 10**2 <= 1) & (kk < 100)] = 2
+    labelArray[(np.abs(ii - 125) <= 12) & (np.abs(jj - 30) <= 5 + kk // 20)] = 3
+    spacing = (0.5, 0.5, 0.8)
+    segmentNames = ["Femur", "Tibia", "Fibula"]
+
+    columns = SegmentBatch.batchColumns(labelArray, segmentNames, 2, 0, spacing, 30)
+    for label, segName in enumerate(segmentNames, start=1):
+      segmentRows = columns["Segment"] == segName
+      box = SegmentBatch.labelBoundingBoxes(labelArray, [label])[0]
+      segmentColumns = SegmentBatch.segmentColumns(labelArray[box] == label, 2, 0, spacing, 30)
+      self.assertEqual(np.count_nonzero(segmentRows), box[0].stop - box[0].start)
+      for name, values in segmentColumns.items():
+        np.testing.assert_array_equal(columns[name][segmentRows], values)
+      self.assertAlmostEqual(columns["CSA (mm^2)"][segmentRows].sum() * spacing[2], np.count_nonzero(labelArray == label) * 0.2)
+
+    # cropping to a segment in memory
+    box = SegmentBatch.foregroundBox(labelArray == 2)
+    self.assertEqual(box, SegmentBatch.labelBoundingBoxes(labelArray, [2])[0])
+    self.assertTrue(np.shares_memory(SegmentBatch.cropBlock(labelArray, box), labelArray))
+    self.assertIsNone(SegmentBatch.foregroundBox(labelArray == 4))
+    block = SegmentBatch.cropBlock(labelArray, (slice(-5, 20), slice(50, 70), slice(0, 10)))
+    self.assertEqual(block.shape, (25, 20, 10))
+    np.testing.assert_array_equal(block[5:, :10], labelArray[:20, 50:, :10])
+    self.assertFalse(block[:5].any() or block[:, 10:].any())
+
+    self.delayDisplay('Test passed')
+
+  def test_BatchCLI1(self):
+    """ Check reading batch manifests and combining the results of several jobs.
+    """
+
+    self.delayDisplay("Starting the batch command line test")
+
+    import csv
+    import json
+    import tempfile
+    import numpy as np
+    from SegmentGeometryLib import BatchCLI
+
+    with tempfile.TemporaryDirectory() as tempDirectory:
+      manifestPath = os.path.join(tempDirectory, "study.csv")
+      with open(manifestPath, "w", newline="") as manifestFile:
+        manifestFile.write("Segmentation,Volume,Segments,Axis\n")
+        manifestFile.write("specimen1.seg.nrrd,specimen1.nrrd,Femur;Tibia,A (Green)\n")
+        manifestFile.write("specimen2.seg.nrrd,,,\n")
+      specimens = BatchCLI.readManifest(manifestPath)
+      self.assertEqual([entry["specimen"] for entry in specimens], ["specimen1", "specimen2"])
+      self.assertEqual(specimens[0]["segmentation"], os.path.join(tempDirectory, "specimen1.seg.nrrd"))
+      self.assertEqual(specimens[0]["axis"], "A (Green)")
+      self.assertEqual(specimens[1]["axis"], "S (Red)")
+      self.assertEqual(specimens[1]["volume"], "")
+
+      jsonPath = os.path.join(tempDirectory, "study.json")
+      with open(jsonPath, "w") as manifestFile:
+        json.dump([{"specimen": "A", "segmentation": "/data/a.seg.nrrd", "interval": 5, "angle": 30}], manifestFile)
+      specimens = BatchCLI.readManifest(jsonPath)
+      self.assertEqual(specimens[0]["segmentation"], "/data/a.seg.nrrd")
+      self.assertEqual(float(specimens[0]["interval"]), 5)
+      with open(jsonPath, "w") as manifestFile:
+        json.dump([{"segmentation": "a.seg.nrrd", "side": "left"}], manifestFile)
+      with self.assertRaises(ValueError):
+        BatchCLI.readManifest(jsonPath)
+
+      # results of two jobs, the second one with extra columns
+      partialPaths = [os.path.join(tempDirectory, "job0.csv"), os.path.join(tempDirectory, "job1.csv")]
+      BatchCLI.writeResults(partialPaths[0], [("specimen1", {"Segment": np.array(["Femur", "Femur"], dtype=object), "CSA (mm^2)": np.array([1.5, 2.5])})])
+      BatchCLI.writeResults(partialPaths[1], [("specimen2", {"Segment": np.array(["Tibia"], dtype=object), "CSA (mm^2)": np.array([3.0]), "Ina (mm^4)": np.array([4.0])})])
+      outputPath = os.path.join(tempDirectory, "results.csv")
+      BatchCLI.combineResults(partialPaths + [os.path.join(tempDirectory, "missing.csv")], outputPath)
+      with open(outputPath, newline="") as resultsFile:
+        rows = list(csv.DictReader(resultsFile))
+      self.assertEqual([row["Specimen"] for row in rows], ["specimen1", "specimen1", "specimen2"])
+      self.assertEqual(float(rows[1]["CSA (mm^2)"]), 2.5)
+      self.assertEqual(rows[0]["Ina (mm^4)"], "")
+      self.assertEqual(float(rows[2]["Ina (mm^4)"]), 4.0)
+
+    self.delayDisplay('Test passed')
+
+  def test_SectionTable1(self):
+    """ Check the table columns computed as whole arrays against the slice by slice formulas.
+    """
+
+    self.delayDisplay("Starting the table columns test")
+
+    import numpy as np
+    from SegmentGeometryLib import SectionMoments, SectionTable
+
+    narray = self.taperedLabelmap()
+    kk, jj, ii = np.ogrid[0:120, 0:80, 0:90]
+    sampleSlices = np.arange(0, 120, 3)
+
+    stackProps = SectionMoments.stackProperties(narray, 2, sampleSlices, 30)
+    sliceProps = SectionMoments.sliceBySliceProperties(narray, 2, sampleSlices, 30)
+    for key in stackProps:
+      np.testing.assert_allclose(stackProps[key], sliceProps[key], rtol=1e-9, atol=1e-9)
+
+    columns = SectionTable.sectionColumns(stackProps, 120, 0.5, 0.25, doube=True, summers=True)
+    for sampleIndex, i in enumerate(sampleSlices):
+      y, x = np.nonzero(narray[i])
+      if len(x) == 0:
+        for name, values in columns.items():
+          if name != "Length (mm)":
+            self.assertEqual(values[sampleIndex], 0)
+        continue
+      props = SectionMoments.sliceProperties(x, y, 30)
+      CSA = len(x)
+      self.assertAlmostEqual(columns["CSA (mm^2)"][sampleIndex], CSA * 0.25)
+      self.assertAlmostEqual(columns["Ina (mm^4)"][sampleIndex], props["Ina"] * 0.0625, places=6)
+      self.assertAlmostEqual(columns["Zpol (mm^3)"][sampleIndex], props["Zpol"] * 0.125, places=6)
+      self.assertAlmostEqual(columns["Rla (mm)"][sampleIndex], props["Rla"] * 0.5, places=9)
+      # the size correction divides by the length in mm, 120 slices of 0.25 mm
+      self.assertAlmostEqual(columns["Imajor (LenNorm)"][sampleIndex], (props["Imajor"] * 0.0625)**(1/4) / 30, places=9)
+      self.assertAlmostEqual(columns["Zna (LenNorm)"][sampleIndex], (props["Zna"] * 0.125)**(1/3) / 30, places=9)
+      self.assertAlmostEqual(columns["Iminor (MatNorm)"][sampleIndex], props["Iminor"]/((np.pi * (np.sqrt(CSA/np.pi))**4) / 4), places=9)
+      self.assertAlmostEqual(columns["Zla (MatNorm)"][sampleIndex], props["Zla"]/((np.pi * (np.sqrt(CSA/np.pi))**3) / 4), places=9)
+      self.assertAlmostEqual(columns["Jz (MatNorm)"][sampleIndex], props["Jz"]/((np.pi * (np.sqrt(CSA/np.pi))**4) / 2), places=9)
+      self.assertAlmostEqual(columns["Zpol (MatNorm)"][sampleIndex], props["Zpol"]/((np.pi * (np.sqrt(CSA/np.pi))**3) / 16), places=9)
+
+    # mean brightness of the voxels inside the segment
+    voxelArray = narray * (100 + kk + ii).astype(np.int16)
+    meanIntensity = SectionMoments.stackMeanIntensity(voxelArray, 2, sampleSlices)
+    for sampleIndex, i in enumerate(sampleSlices):
+      inside = voxelArray[i][np.where(voxelArray[i])]
+      self.assertAlmostEqual(meanIntensity[sampleIndex], np.mean(inside) if len(inside) else 0)
+    # the same from the unmasked volume and the labelmap
+    np.testing.assert_allclose(SectionMoments.stackMeanIntensity((100 + kk + ii + 0*jj).astype(np.int16), 2, sampleSlices, narray), meanIntensity)
+
+    self.delayDisplay('Test passed')
+
+  def test_LabelmapCache1(self):
+    """ Check the eviction order and memory bound of the labelmap cache.
+    """
+
+    self.delayDisplay("Starting the labelmap cache test")
+
+    import numpy as np
+    from SegmentGeometryLib import LabelmapCache
+
+    cache = LabelmapCache(maxBytes=3000)
+    for name in ("a", "b", "c"):
+      cache.put(("Segmentation", name), {"labelArray": np.zeros(1000, dtype=np.uint8), "spacing": (1, 1, 1)})
+    self.assertEqual(len(cache), 3)
+    # use "a" so that "b" is the least recently used entry
+    self.assertIsNotNone(cache.get(("Segmentation", "a")))
+    cache.put(("Segmentation", "d"), {"labelArray": np.zeros(1000, dtype=np.uint8)})
+    self.assertNotIn(("Segmentation", "b"), cache)
+    self.assertIn(("Segmentation", "a"), cache)
+    self.assertTrue(cache.totalBytes <= 3000)
+    # an entry larger than the budget is not stored
+    cache.put(("Segmentation", "e"), {"labelArray": np.zeros(4000, dtype=np.uint8)})
+    self.assertIsNone(cache.get(("Segmentation", "e")))
+    cache.put(("Other", "a"), {"labelArray": np.zeros(10, dtype=np.uint8)})
+    cache.invalidate("Segmentation")
+    self.assertEqual(len(cache), 1)
+    cache.invalidate()
+    self.assertEqual(len(cache), 0)
+    # a cropped view holds on to the whole array
+    self.assertEqual(cache.entryBytes({"labelArray": np.zeros(2000, dtype=np.uint8)[:10]}), 2000)
+
+    self.delayDisplay('Test passed')
+
+  def test_NeutralAxis1(self):
+    """ Check the neutral axis properties re-derived from the moment tensors against a full
+    computation at several angles.
+    """
+
+    self.delayDisplay("Starting the neutral axis test")
+
+    import numpy as np
+    from SegmentGeometryLib import SectionMoments, SectionTable
+
+    narray = self.taperedLabelmap()
+    # unsorted and repeated samples
+    sampleSlices = np.array([100, 3, 52, 3, 60, 119, 0, 77])
+
+    tensors = SectionMoments.stackSectionTensors(narray, 2, sampleSlices)
+    self.assertEqual(len(tensors["dx"]), tensors["Pixels"].sum())
+    for angle in (0, 30, 90, 137.5):
+      stackProps = SectionMoments.stackProperties(narray, 2, sampleSlices, angle)
+      props = SectionMoments.tensorOrientation(tensors, angle)
+      for key in props:
+        np.testing.assert_allclose(props[key], stackProps[key], rtol=1e-9, atol=1e-9)
+      columns = SectionTable.sectionColumns(stackProps, 120, 0.5, 0.25, doube=True, summers=True)
+      for name, values in SectionTable.orientationColumns(props, 120, 0.5, 0.25, doube=True, summers=True).items():
+        np.testing.assert_allclose(values, columns[name], rtol=1e-9, atol=1e-12)
+
+    self.delayDisplay('Test passed')
+
+  def test_PolarProfile1(self):
+    """ Check the polar profile against the properties around single axes.
+    """
+
+    self.delayDisplay("Starting the polar profile test")
+
+    import numpy as np
+    from SegmentGeometryLib import SectionMoments, SectionTable
+
+    narray = self.taperedLabelmap()
+    sampleSlices = np.arange(0, 120, 3)
+    angles = np.arange(0, 180, 7.5)
+
+    tensors = SectionMoments.stackSectionTensors(narray, 2, sampleSlices)
+    # a small block size to go through several blocks of angles
+    profile = SectionMoments.polarProfile(tensors, angles, maxElements=5000)
+    self.assertEqual(profile["I"].shape, (len(sampleSlices), len(angles)))
+    for angleIndex, angle in enumerate(angles):
+      props = SectionMoments.tensorOrientation(tensors, angle)
+      np.testing.assert_allclose(profile["I"][:, angleIndex], props["Ina"], rtol=1e-9, atol=1e-9)
+      np.testing.assert_allclose(profile["R"][:, angleIndex], props["Rna"], rtol=1e-9, atol=1e-9)
+      np.testing.assert_allclose(profile["Z"][:, angleIndex], props["Zna"], rtol=1e-9, atol=1e-9)
+    # the axis at 90 degrees from a slice's own neutral axis is its loading axis
+    props = SectionMoments.sliceProperties(*np.nonzero(narray[30])[::-1], 15)
+    self.assertAlmostEqual(profile["I"][10, 2], props["Ina"], places=6)
+    self.assertAlmostEqual(profile["I"][10, 14], props["Ila"], places=6)
+    self.assertAlmostEqual(profile["R"][10, 14], props["Rla"], places=9)
+
+    columns = SectionTable.polarColumns({"Angles": angles, "I": profile["I"], "Z": profile["Z"]})
+    self.assertEqual(len(columns), 2 * len(angles))
+    self.assertIn("Z(7.5) (mm^3)", columns)
+    self.assertEqual(SectionTable.columnInfo("I(30) (mm^4)")[0], "mm^4")
+    self.assertEqual(SectionTable.columnInfo("Ina (mm^4)"), SectionTable.COLUMN_INFO["Ina (mm^4)"])
+
+    self.delayDisplay('Test passed')
+
+  def test_ObliqueSections1(self):
+    """ Check the sections along an arbitrary direction against the slice by slice results
+    for a volume axis and against the exact properties of a tilted cylinder.
+    """
+
+    self.delayDisplay("Starting the oblique sections test")
+
+    import numpy as np
+    from SegmentGeometryLib import ObliqueSections, SectionMoments
+
+    narray = self.taperedLabelmap()
+
+    # along the third array axis the sections are the slices, read in several chunks
+    stackProps = SectionMoments.stackProperties(narray, 2, np.arange(120), 30)
+    props = ObliqueSections.obliqueSectionProperties(narray, (1, 1, 1), (0, 0, 2), angle=30, chunkVoxels=50000)
+    for key in stackProps:
+      np.testing.assert_allclose(props[key], stackProps[key], rtol=1e-9, atol=1e-8)
+    # along the second array axis only the slices with foreground are sections
+    filled = np.flatnonzero(narray.any(axis=(0, 2)))
+    stackProps = SectionMoments.stackProperties(narray, 1, filled)
+    props = ObliqueSections.obliqueSectionProperties(narray, (1, 1, 1), (0, 1, 0))
+    for key in ("CSA", "Imajor", "Iminor", "Jz", "Rmajor", "Rminor", "Maxrad", "Zpol"):
+      np.testing.assert_allclose(props[key], stackProps[key], rtol=1e-9, atol=1e-8)
+
+    # a cylinder of radius 20 and length 120 along a direction that is not aligned with the voxels
+    z, y, x = np.mgrid[0:160, 0:160, 0:160].astype(np.float64) - 80
+    direction = np.array([1.0, 1.0, 2.0]) / np.sqrt(6)
+    along = x * direction[0] + y * direction[1] + z * direction[2]
+    radial = np.sqrt(np.maximum(x*x + y*y + z*z - along*along, 0))
+    cylinder = ((radial <= 20) & (np.abs(along) <= 60)).astype(np.uint8)
+    props = ObliqueSections.obliqueSectionProperties(cylinder, (1, 1, 1), direction)
+    central = slice(20, -20)
+    self.assertAlmostEqual(props["CSA"][central].mean() / (np.pi * 20**2), 1, delta=0.01)
+    self.assertAlmostEqual(props["Imajor"][central].mean() / (np.pi * 20**4 / 4), 1, delta=0.01)
+    self.assertAlmostEqual(props["Jz"][central].mean() / (np.pi * 20**4 / 2), 1, delta=0.01)
+    self.assertTrue(np.all(np.abs(props["Maxrad"][central] - 20) < 1))
+    # the same cylinder on voxels twice as long along x, with the default thickness of 1 mm
+    props = ObliqueSections.obliqueSectionProperties(cylinder[:, :, ::2], (2, 1, 1), direction)
+    self.assertAlmostEqual(props["CSA"][central].mean() / (np.pi * 20**2), 1, delta=0.02)
+
+    with self.assertRaises(ValueError):
+      ObliqueSections.obliqueSectionProperties(narray, (1, 1, 1), (0, 0, 0))
+
+    self.delayDisplay('Test passed')
+
+  def test_AnisotropicSpacing1(self):
+    """ Check the columns of a segment on voxels three times as high as they are wide against
+    the same segment on square voxels, and log the time saved by not resampling.
+    """
+
+    self.delayDisplay("Starting the anisotropic spacing test")
+
+    import numpy as np
+    import time
+    from SegmentGeometryLib import SegmentBatch
+
+    kk, jj, ii = np.ogrid[0:60, 0:40, 0:120]
+    narray = ((ii - 60)**2 / (30 + 10*np.sin(kk/15))**2 + (jj*3 - 60)**2 / 45**2 <= 1).astype(np.uint8)
+    narray[:, (np.abs(jj[0]*3 - 60) < 12) & (np.abs(ii[0] - 60) < 10)] = 0
+    # every row repeated three times is the same shape on square pixels
+    squareArray = np.repeat(narray, 3, axis=1)
+
+    for angle in (None, 30):
+      startTime = time.time()
+      columns = SegmentBatch.segmentColumns(narray, 2, 0, (0.3, 0.9, 1.0), angle)
+      nativeTime = time.time() - startTime
+      startTime = time.time()
+      squareColumns = SegmentBatch.segmentColumns(squareArray, 2, 0, (0.3, 0.3, 1.0), angle)
+      squareTime = time.time() - startTime
+      for name in squareColumns:
+        if name.startswith(("CSA", "I", "Jz", "Theta")):
+          np.testing.assert_allclose(columns[name], squareColumns[name], rtol=1e-9, atol=1e-9)
+        elif name.startswith("R"):
+          # the extreme pixel centres of the repeated rows are up to one square pixel further out
+          np.testing.assert_allclose(columns[name], squareColumns[name], atol=0.3 + 1e-9)
+        elif name.startswith(("Max Feret Diameter", "Min Feret Diameter")):
+          np.testing.assert_allclose(columns[name], squareColumns[name], atol=0.6 + 1e-9)
+      np.testing.assert_allclose(columns["Cy"] * 3 + 1, squareColumns["Cy"], atol=1e-9)
+    logging.info("Anisotropic spacing: native grid {:.3f} s, resampled to square pixels {:.3f} s".format(nativeTime, squareTime))
+
+    self.delayDisplay('Test passed')
+
+  def test_CurveSections1(self):
+    """ Check the sections along a curve against the slices for a straight curve and against
+    the exact properties of a bent tube.
+    """
+
+    self.delayDisplay("Starting the curve sections test")
+
+    import numpy as np
+    from SegmentGeometryLib import ObliqueSections, SectionMoments
+
+    narray = self.taperedLabelmap(gap=False)
+
+    # a straight curve through the slices gives the slices
+    stations = np.stack([np.full(120, 45.0), np.full(120, 40.0), np.arange(120.0)], axis=1)
+    props = ObliqueSections.curveSectionProperties(narray, (1, 1, 1), stations, 30, chunkVoxels=50000)
+    stackProps = SectionMoments.stackProperties(narray, 2, np.arange(120), 30)
+    for key in stackProps:
+      np.testing.assert_allclose(props[key], stackProps[key] - {"Cx": 45, "Cy": 40}.get(key, 0), rtol=1e-9, atol=1e-8)
+
+    # half of a torus: a tube of radius 8 bent along a circle of radius 50
+    z, y, x = np.mgrid[0:30, 0:70, 0:130].astype(np.float64)
+    tube = ((np.sqrt((x - 65)**2 + (y - 5)**2) - 50)**2 + (z - 15)**2 <= 64) & (y >= 5)
+    # the area of a digital disc of radius 8
+    discArea = np.count_nonzero(np.add.outer(np.arange(-8, 9)**2, np.arange(-8, 9)**2) <= 64)
+    angles = np.linspace(0.15, np.pi - 0.15, 100)
+    stations = np.stack([65 + 50*np.cos(angles), 5 + 50*np.sin(angles), np.full(100, 15.0)], axis=1)
+    props = ObliqueSections.curveSectionProperties(tube.astype(np.uint8), (1, 1, 1), stations)
+    stationSpacing = np.linalg.norm(stations[1] - stations[0])
+    central = slice(3, -3)
+    self.assertAlmostEqual(props["CSA"][central].mean() * stationSpacing**2 / discArea, 1, delta=0.01)
+    self.assertAlmostEqual(props["Jz"][central].mean() * stationSpacing**4 / (np.pi * 8**4 / 2), 1, delta=0.05)
+    # the centroid stays on the curve and the sections do not twist
+    self.assertTrue(np.all(np.abs(props["Cx"][central] * stationSpacing) < 0.25))
+    self.assertTrue(np.all(np.abs(props["Maxrad"][central] * stationSpacing - 8) < 0.5))
+
+    with self.assertRaises(ValueError):
+      ObliqueSections.curveFrames(np.zeros((1, 3)))
+
+    self.delayDisplay('Test passed')
+
+  def test_SectionMetrics1(self):
+    """ Check that only the metrics the selected columns depend on are evaluated and that they
+    match the full computation.
+    """
+
+    self.delayDisplay("Starting the metric registry test")
+
+    import numpy as np
+    from SegmentGeometryLib import SectionMetrics, SectionMoments, SectionTable
+
+    required = SectionMetrics.requiredMetrics(["Segment", "Slice Index", "Percent (%)", "CSA (mm^2)", "CSA (LenNorm)"])
+    self.assertEqual(required, {"CSA", "Area"})
+    required = SectionMetrics.requiredMetrics(["Zmajor (mm^3)"])
+    self.assertTrue({"Imajor", "Rmajor", "Theta", "Hulls", "Tensors"} <= required)
+    self.assertNotIn("Feret", required)
+    self.assertEqual(SectionMetrics.requiredMetrics(["Iminor (MatNorm)"]), {"Iminor", "Tensors", "CSA", "Area"})
+    self.assertIn("Feret", SectionMetrics.requiredMetrics(["AspectRatio"]))
+    self.assertEqual(SectionMetrics.requiredMetrics(["Rmax (mm)"]), {"Maxrad", "Hulls", "Tensors"})
+    with self.assertRaises(ValueError):
+      SectionMetrics.requiredMetrics(["Volume (mm^3)"])
+
+    narray = self.taperedLabelmap(bore=False)
+    sampleSlices = np.arange(0, 120, 3)
+    fullProps = SectionMoments.stackProperties(narray, 2, sampleSlices, 30, 1.5)
+
+    # CSA only counts the pixels
+    props = SectionMoments.stackProperties(narray, 2, sampleSlices, None, 1.5, SectionMetrics.requiredMetrics(["CSA (mm^2)"]))
+    self.assertEqual(list(props), ["CSA"])
+    np.testing.assert_allclose(props["CSA"], fullProps["CSA"])
+    # the moments without the hulls
+    props = SectionMoments.stackProperties(narray, 2, sampleSlices, 30, 1.5, SectionMetrics.requiredMetrics(["Imajor (mm^4)", "Ina (mm^4)"]))
+    self.assertNotIn("Rmajor", props)
+    self.assertNotIn("Zna", props)
+    for key in props:
+      np.testing.assert_allclose(props[key], fullProps[key])
+    columns = SectionTable.sectionColumns(props, 120, 0.5, 0.25, doube=True, summers=True)
+    self.assertIn("Ina (MatNorm)", columns)
+    self.assertNotIn("Zmajor (mm^3)", columns)
+    columns = SectionTable.sectionColumns({"CSA": fullProps["CSA"]}, 120, 0.5, 0.25, doube=True, summers=True)
+    self.assertEqual(set(columns), {"Length (mm)", "CSA (mm^2)", "CSA (LenNorm)"})
+
+    self.delayDisplay('Test passed')
+
+  def test_SharedLabelmap1(self):
+    """ Check finding a segment in a shared labelmap layer without a full size temporary and
+    matching the grid of a labelmap to the grid of a volume.
+    """
+
+    self.delayDisplay("Starting the shared labelmap test")
+
+    import numpy as np
+    import time
+    from SegmentGeometryLib import SegmentBatch
+
+    # three segments in one layer, as label values 1, 2 and 3
+    kk, jj, ii = np.ogrid[0:150, 0:60, 0:150]
+    layer = np.zeros((150, 60, 150), dtype=np.uint8)
+    layer[((ii - 25)**2 + (jj - 30)**2 <= 15**2) & (kk >= 10)] = 1
+    layer[((ii - 75)**2 / 20**2 + (jj - 30)**2 / 10**2 <= 1) & (kk < 100)] = 2
+    layer[(np.abs(ii - 125) <= 12) & (np.abs(jj - 30) <= 5 + kk // 20) & (kk > 70)] = 3
+    for label in (1, 2, 3):
+      for chunkSlices in (1, 7, 64, 1000):
+        self.assertEqual(SegmentBatch.labelBox(layer, label, chunkSlices), SegmentBatch.foregroundBox(layer == label))
+    self.assertIsNone(SegmentBatch.labelBox(layer, 4))
+
+    # a labelmap on the volume grid that starts at voxel (5, -2, 7), in RAS with 0.5 mm voxels
+    volumeIjkToRas = np.diag([-0.5, -0.5, 0.8, 1.0])
+    volumeIjkToRas[:3, 3] = (10, 20, -30)
+    labelIjkToRas = volumeIjkToRas.copy()
+    labelIjkToRas[:3, 3] += volumeIjkToRas[:3, :3] @ (5, -2, 7)
+    self.assertEqual(SegmentBatch.gridOffset(labelIjkToRas, volumeIjkToRas), (5, -2, 7))
+    # half a voxel off, another spacing or rotated axes have to be resampled
+    shifted = labelIjkToRas.copy()
+    shifted[0, 3] += 0.25
+    self.assertIsNone(SegmentBatch.gridOffset(shifted, volumeIjkToRas))
+    self.assertIsNone(SegmentBatch.gridOffset(labelIjkToRas @ np.diag([2, 1, 1, 1]), volumeIjkToRas))
+    self.assertIsNone(SegmentBatch.gridOffset(labelIjkToRas[:, [1, 0, 2, 3]], volumeIjkToRas))
+
+    # a large layer is compared with the label a chunk at a time
+    largeLayer = np.tile(layer, (8, 1, 1))
+    startTime = time.time()
+    box = SegmentBatch.labelBox(largeLayer, 2)
+    logging.info("labelBox: {} voxels in {:.3f} s".format(largeLayer.size, time.time() - startTime))
+    self.assertEqual(box, (slice(0, 1150), slice(20, 41), slice(55, 96)))
+
+    self.delayDisplay('Test passed')
+
+  def test_SlabStream1(self):
+    """ Check that a segment read from memory-mapped NRRD files in slabs within a memory budget
+    gives the same table as the segment in memory.
+    """
+
+    self.delayDisplay("Starting the slab streaming test")
+
+    import numpy as np
+    import os
+    import tempfile
+    import time
+    import tracemalloc
+    from SegmentGeometryLib import SegmentBatch, SectionMoments, SlabStream
+
+    kk, jj, ii = np.ogrid[0:150, 0:70, 0:90]
+    labelArray = np.zeros((150, 70, 90), dtype=np.uint8)
+    labelArray[((ii - 45)**2 / (20 + 10*np.sin(kk/15))**2 + (jj - 35)**2 / 25**2 <= 1) & (kk > 12) & (kk < 140)] = 1
+    labelArray[:, ((ii - 45)**2 + (jj - 35)**2 <= 8**2)[0]] = 0
+    voxelArray = (1000 + 3*kk + ii + 0*jj).astype(np.uint16)
+    spacing = (0.5, 0.5, 0.8)
+
+    def writeNrrd(path, array, typeName, endian="little", fields=""):
+      sizes = " ".join(str(size) for size in array.shape[::-1])
+      directions = "(0.5,0,0) (0,0.5,0) (0,0,0.8)"
+      if array.ndim == 4:
+        directions = "none " + directions
+      with open(path, "wb") as nrrdFile:
+        nrrdFile.write("NRRD0004\n# test\ntype: {}\ndimension: {}\nspace: left-posterior-superior\nsizes: {}\nspace directions: {}\nendian: {}\nencoding: raw\nspace origin: (0,0,0)\n{}\n".format(
+          typeName, array.ndim, sizes, directions, endian, fields).encode())
+        nrrdFile.write(array.astype(array.dtype.newbyteorder(">" if endian == "big" else "<")).tobytes())
+
+    with tempfile.TemporaryDirectory() as directory:
+      labelPath = os.path.join(directory, "label.nrrd")
+      volumePath = os.path.join(directory, "volume.nrrd")
+      writeNrrd(labelPath, labelArray, "uchar")
+      writeNrrd(volumePath, voxelArray, "unsigned short", "big")
+      array, header = SlabStream.readNrrd(labelPath)
+      np.testing.assert_array_equal(array, labelArray)
+      self.assertEqual(SlabStream.nrrdSpacing(header), spacing)
+      np.testing.assert_array_equal(SlabStream.readNrrd(volumePath)[0], voxelArray)
+
+      box = SegmentBatch.foregroundBox(labelArray)
+      self.assertEqual(SlabStream.streamBox(array, 100000), box)
+      for axisIndex, interval in ((2, 0), (1, 5), (0, 0)):
+        memoryColumns = SegmentBatch.segmentColumns(labelArray[box], axisIndex, interval, spacing, 30)
+        memoryColumns["Mean Brightness"] = SectionMoments.stackMeanIntensity(voxelArray[box], axisIndex, memoryColumns["Slice Index"], labelArray[box])
+        # a budget of a few slices
+        streamedColumns = SlabStream.streamColumns(array, axisIndex, interval, spacing, 30, 200000, SlabStream.readNrrd(volumePath)[0])
+        self.assertEqual(list(streamedColumns), list(memoryColumns))
+        for name, values in memoryColumns.items():
+          np.testing.assert_array_equal(streamedColumns[name], values)
+
+      # the peak memory stays within the budget
+      tracemalloc.start()
+      startTime = time.time()
+      SlabStream.streamColumns(array, 2, 0, spacing, None, 1000000)
+      peak = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+      logging.info("streamColumns: {} slices in {:.3f} s, peak memory {} bytes".format(box[0].stop - box[0].start, time.time() - startTime, peak))
+      self.assertTrue(peak < 1000000)
+      with self.assertRaises(ValueError):
+        SlabStream.streamColumns(array, 2, 0, spacing, None, 1000)
+
+      # two segments of a segmentation with two layers
+      layers = np.stack([labelArray * 3, (jj < 10) * np.ones_like(labelArray)], axis=-1).astype(np.uint8)
+      segmentationPath = os.path.join(directory, "segmentation.seg.nrrd")
+      writeNrrd(segmentationPath, layers, "uchar", fields="Segment0_ID:=Bone\nSegment0_Name:=Bone\nSegment0_Layer:=0\nSegment0_LabelValue:=3\n"
+                "Segment1_ID:=Slab\nSegment1_Name:=Slab\nSegment1_Layer:=1\nSegment1_LabelValue:=1\n")
+      segmentation, header = SlabStream.readNrrd(segmentationPath)
+      self.assertEqual(segmentation.shape, (150, 70, 90, 2))
+      self.assertEqual(SlabStream.nrrdSpacing(header), spacing)
+      self.assertEqual(SlabStream.nrrdSegment(header, "Slab"), (1, 1))
+      layer, labelValue = SlabStream.nrrdSegment(header, "Bone")
+      bone = SlabStream.LabelLayer(segmentation, labelValue, layer)
+      np.testing.assert_array_equal(bone[10:20], labelArray[10:20])
+      np.testing.assert_array_equal(SlabStream.streamColumns(bone, 2, 0, spacing, None, 200000)["CSA (mm^2)"],
+                                    SegmentBatch.segmentColumns(labelArray[box], 2, 0, spacing)["CSA (mm^2)"])
+      with self.assertRaises(ValueError):
+        SlabStream.nrrdSegment(header, "Skin")
+      del array, segmentation, bone
+
+      # compressed files cannot be memory mapped
+      compressedPath = os.path.join(directory, "compressed.nrrd")
+      with open(compressedPath, "wb") as nrrdFile:
+        nrrdFile.write(b"NRRD0004\ntype: uchar\ndimension: 3\nsizes: 2 2 2\nencoding: gzip\n\n")
+      with self.assertRaises(ValueError):
+        SlabStream.readNrrd(compressedPath)
+
+    self.delayDisplay('Test passed')
+
+  def test_CompactMasks1(self):
+    """ Check that boolean labelmaps give the same results as uint8 ones without being copied,
+    that the bit-packed row extents match a search of the unpacked rows and that the stages
+    of a run are timed and traced.
+    """
+
+    self.delayDisplay("Starting the compact masks test")
+
+    import numpy as np
+    import time
+    import tracemalloc
+    from SegmentGeometryLib import Profiling, SectionFeret, SectionMoments, SegmentBatch
+
+    rng = np.random.default_rng(19)
+    mask = rng.random((40, 37, 45)) < 0.05
+    mask[5] = False
+    mask[:, :, 44] |= rng.random((40, 37)) < 0.5
+    s, y, left, right = SectionFeret.rowExtents(mask)
+    filled = mask.any(axis=2)
+    np.testing.assert_array_equal(s, np.nonzero(filled)[0])
+    np.testing.assert_array_equal(y, np.nonzero(filled)[1])
+    np.testing.assert_array_equal(left, np.argmax(mask, axis=2)[filled])
+    np.testing.assert_array_equal(right, 44 - np.argmax(mask[:, :, ::-1], axis=2)[filled])
+    self.assertEqual(left.dtype, np.int32)
+    # a stack without foreground has no rows and no hulls
+    for values in SectionFeret.stackHulls(np.zeros((20, 37, 45), dtype=bool)):
+      self.assertEqual(len(values), 0)
+    # two parts with 140 empty slices between them, which fill whole chunks of 4 workers
+    twoParts = np.zeros((200, 40, 40), dtype=np.uint8)
+    twoParts[0:30, 10:30, 10:30] = 1
+    twoParts[170:200, 5:35, 10:30] = 1
+    serial = SegmentBatch.segmentColumns(twoParts, 2, 0, (1, 1, 1), workers=1)
+    for name, values in SegmentBatch.segmentColumns(twoParts, 2, 0, (1, 1, 1), workers=4).items():
+      np.testing.assert_array_equal(values, serial[name])
+
+    kk, jj, ii = np.ogrid[0:200, 0:90, 0:110]
+    labelArray = np.zeros((200, 90, 110), dtype=np.uint8)
+    labelArray[((ii - 55)**2 / (30 + 10*np.sin(kk/20))**2 + (jj - 45)**2 / 35**2 <= 1) & (kk > 10)] = 1
+    boolArray = labelArray != 0
+    voxelArray = (1000 + kk + ii + 0*jj).astype(np.int16)
+    sampleSlices = np.arange(0, 200, 3)
+    for axisIndex in range(3):
+      allSlices = np.arange(labelArray.shape[2 - axisIndex])
+      self.assertTrue(np.shares_memory(SectionMoments.sliceStack(boolArray, axisIndex, allSlices)[1], boolArray))
+      slices = sampleSlices[sampleSlices < len(allSlices)]
+      for name, values in SectionMoments.stackProperties(labelArray, axisIndex, slices, 30).items():
+        np.testing.assert_array_equal(SectionMoments.stackProperties(boolArray, axisIndex, slices, 30)[name], values)
+      for name, values in SectionFeret.stackFeret(labelArray, axisIndex, slices).items():
+        np.testing.assert_array_equal(SectionFeret.stackFeret(boolArray, axisIndex, slices)[name], values)
+      np.testing.assert_allclose(SectionMoments.stackMeanIntensity(voxelArray, axisIndex, slices, boolArray),
+                                 SectionMoments.stackMeanIntensity(np.where(boolArray, voxelArray, 0), axisIndex, slices))
+
+    timings = []
+    for array in (labelArray, boolArray):
+      startTime = time.time()
+      SectionMoments.stackProperties(array, 2, np.arange(200))
+      SectionFeret.stackFeret(array, 2, np.arange(200))
+      timings.append(time.time() - startTime)
+    logging.info("stackProperties and stackFeret: uint8 {:.3f} s, bool {:.3f} s".format(*timings))
+
+    # nested stages, with the peak of the inner stage included in the outer one
+    report = Profiling.StageReport(traceMemory=True)
+    report.start()
+    try:
+      with report.stage("outer"):
+        with report.stage("inner"):
+          block = np.ones(1000000, dtype=np.uint8)
+          del block
+        with report.stage("inner"):
+          pass
+    finally:
+      report.stop()
+    self.assertFalse(tracemalloc.is_tracing())
+    self.assertEqual([entry["name"] for entry in report.stages], ["inner", "inner", "outer"])
+    self.assertTrue(report.stages[0]["peakBytes"] >= 1000000)
+    self.assertTrue(report.stages[2]["peakBytes"] >= report.stages[0]["peakBytes"])
+    totals = report.totals()
+    self.assertEqual(list(totals), ["inner", "outer"])
+    self.assertEqual(totals["inner"]["count"], 2)
+    self.assertEqual(len(report.summary().splitlines()), 2)
+    untraced = Profiling.StageReport()
+    with untraced.stage("moments"):
+      pass
+    self.assertIsNone(untraced.stages[0]["peakBytes"])
+
+    self.delayDisplay('Test passed')
+
+  def test_Benchmark1(self):
+    """ Check the synthetic solids of the benchmark against their closed-form sections and that
+    the benchmark records every stage and the errors of the table as JSON.
+    """
+
+    self.delayDisplay("Starting the benchmark test")
+
+    import json
+    import numpy as np
+    import os
+    import tempfile
+    from SegmentGeometryLib import Benchmark
+
+    # the voxel counts of the labelmaps follow the closed-form areas
+    for shapeName in Benchmark.SHAPES:
+      labelArray = Benchmark.syntheticLabelmap(shapeName, 96)
+      first, last, sections = Benchmark.shapeSections(shapeName, 96)
+      exact = Benchmark.exactColumns(shapeName, 96)
+      self.assertEqual(len(exact["CSA (mm^2)"]), last - first + 1)
+      self.assertFalse(labelArray[:first].any() or labelArray[last+1:].any())
+      np.testing.assert_allclose(np.count_nonzero(labelArray[first:last+1], axis=(1, 2)), exact["CSA (mm^2)"], rtol=0.03)
+    circle = Benchmark.exactColumns("cylinder", 100)
+    np.testing.assert_allclose(circle["Perimeter (mm)"], 2*np.pi*30)
+    np.testing.assert_allclose(circle["Jz (mm^4)"], np.pi*30**4/2)
+    self.assertTrue(np.isnan(circle["Theta (deg)"]).all())
+    with self.assertRaises(ValueError):
+      Benchmark.shapeSections("sphere", 64)
+
+    records = Benchmark.runBenchmark(sizes=(64,), workers=1)
+    self.assertEqual([record["shape"] for record in records], list(Benchmark.SHAPES))
+    for record in records:
+      self.assertEqual(tuple(record["stages"]), Benchmark.STAGES)
+      logging.info("{} {}: {}".format(record["shape"], record["size"], ", ".join(
+        "{} {:.4f} s".format(name, stage["seconds"]) for name, stage in record["stages"].items())))
+      errors = record["errors"]
+      self.assertTrue(errors["CSA (mm^2)"]["max"] < 0.06)
+      self.assertTrue(errors["Imajor (mm^4)"]["max"] < 0.08)
+      self.assertTrue(errors["Iminor (mm^4)"]["max"] < 0.08)
+      self.assertTrue(errors["Perimeter (mm)"]["max"] < 0.08)
+      self.assertTrue(errors["Max Feret Diameter (mm)"]["max"] < 0.05)
+      if "Theta (deg)" in errors:
+        self.assertTrue(errors["Theta (deg)"]["max"] < 2.5)
+    self.assertNotIn("Theta (deg)", records[0]["errors"])
+    self.assertTrue(records[3]["errors"]["Theta (deg)"]["max"] < 0.1)
+
+    # memory tracing and the JSON file
+    record = Benchmark.benchmarkShape("hollowTube", 48, 1, True)
+    self.assertTrue(all(stage["peakBytes"] is not None for stage in record["stages"].values()))
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, "benchmark.json")
+      Benchmark.writeBenchmark(path, records + [record])
+      with open(path) as resultsFile:
+        results = json.load(resultsFile)
+    self.assertEqual(results["numpy"], np.__version__)
+    self.assertEqual(results["records"][-1], record)
+
+    self.delayDisplay('Test passed')
+
+  def test_Profiling1(self):
+    """ Check the stage decorators and context managers, the per-chunk timing of the kernels and
+    the JSON and Chrome trace exports of a stage report.
+    """
+
+    self.delayDisplay("Starting the profiling test")
+
+    import json
+    import numpy as np
+    import os
+    import tempfile
+    import threading
+    from SegmentGeometryLib import Profiling, SectionMoments, SliceChunks
+
+    @Profiling.profiled("square")
+    def square(values):
+      return values * values
+
+    # nothing is recorded without a started report
+    report = Profiling.StageReport()
+    np.testing.assert_array_equal(square(np.arange(3)), [0, 1, 4])
+    self.assertIsNone(Profiling.activeReport())
+    self.assertEqual(report.stages, [])
+
+    labelArray = np.zeros((120, 30, 40), dtype=bool)
+    labelArray[10:110, 5:25, 8:30] = True
+    report = Profiling.StageReport(traceMemory=True)
+    report.start()
+    try:
+      self.assertIs(Profiling.activeReport(), report)
+      with report.stage("outer", segment="Femur"):
+        square(np.arange(10))
+        with Profiling.activeStage("inner") as entry:
+          self.assertEqual(entry["depth"], 1)
+        SliceChunks.mapSliceChunks(SectionMoments.stackProperties, labelArray, 2, np.arange(120), 3)
+      # stages of other threads are only added with record
+      threadEntries = []
+      def threadStage():
+        with Profiling.activeStage("thread") as entry:
+          threadEntries.append(entry)
+      worker = threading.Thread(target=threadStage)
+      worker.start()
+      worker.join()
+      self.assertEqual(threadEntries, [None])
+      timedSquare = report.timed("timed")(square)
+      timedSquare(np.arange(5))
+    finally:
+      report.stop()
+    self.assertIsNone(Profiling.activeReport())
+    self.assertEqual(square(np.arange(2)).tolist(), [0, 1])
+
+    names = [entry["name"] for entry in report.asDict()["stages"]]
+    self.assertEqual(names[0], "outer")
+    self.assertNotIn("thread", names)
+    self.assertEqual(names.count("square"), 2)
+    self.assertEqual(names.count("timed"), 1)
+    outer = [entry for entry in report.stages if entry["name"] == "outer"][0]
+    self.assertEqual(outer["details"], {"segment": "Femur"})
+    self.assertEqual(outer["depth"], 0)
+    self.assertTrue(outer["peakBytes"] is not None)
+    chunks = sorted((entry["details"]["firstSlice"], entry["details"]["lastSlice"]) for entry in report.stages if entry["name"] == "stackProperties")
+    self.assertEqual(chunks, [(0, 39), (40, 79), (80, 119)])
+    for entry in report.stages:
+      if entry["name"] == "stackProperties":
+        self.assertTrue(outer["start"] <= entry["start"] and entry["start"] + entry["seconds"] <= outer["start"] + outer["seconds"])
+    self.assertEqual(report.totals()["square"]["count"], 2)
+
+    with tempfile.TemporaryDirectory() as directory:
+      jsonPath = os.path.join(directory, "report.json")
+      tracePath = os.path.join(directory, "trace.json")
+      report.toJson(jsonPath)
+      report.toChromeTrace(tracePath)
+      with open(jsonPath) as reportFile:
+        saved = json.load(reportFile)
+      with open(tracePath) as traceFile:
+        trace = json.load(traceFile)
+    self.assertEqual(len(saved["stages"]), len(report.stages))
+    self.assertEqual(saved["totals"]["outer"]["count"], 1)
+    events = trace["traceEvents"]
+    self.assertEqual(len(events), len(report.stages))
+    self.assertTrue(all(event["ph"] == "X" for event in events))
+    self.assertEqual(events[0]["name"], "outer")
+    self.assertEqual(events[0]["tid"], 0)
+    self.assertAlmostEqual(events[0]["dur"], outer["seconds"] * 1e6)
+    self.assertIn("peakBytes", events[0]["args"])
+    self.assertEqual(events[0]["args"]["segment"], "Femur")
+    logging.info(report.summary())
+
+    self.delayDisplay('Test passed')
+
+  def test_PrincipalAxes1(self):
+    """ Check the centroid and principal axes of a rotated ellipsoid on an anisotropic, flipped
+    voxel grid, on a shared labelmap layer and on a subset of its voxels, and the alignment
+    transform built from them.
+    """
+
+    self.delayDisplay("Starting the principal axes test")
+
+    import numpy as np
+    import time
+    from SegmentGeometryLib import SegmentAxes
+
+    # ellipsoid with semi-axes of 12, 20 and 45 mm around rotated axes
+    a, b, c = 0.4, 0.3, -0.2
+    rotation = (np.array([[np.cos(a), -np.sin(a), 0], [np.sin(a), np.cos(a), 0], [0, 0, 1]]) @
+                np.array([[np.cos(b), 0, np.sin(b)], [0, 1, 0], [-np.sin(b), 0, np.cos(b)]]) @
+                np.array([[1, 0, 0], [0, np.cos(c), -np.sin(c)], [0, np.sin(c), np.cos(c)]]))
+    semiAxes = np.array([12.0, 20.0, 45.0])
+    ijkToRas = np.array([[-0.8, 0, 0, 10], [0, -0.8, 0, -5], [0, 0, 1.2, 3], [0, 0, 0, 1]])
+    center = np.array([-70.0, -85.0, 63.0])
+    kk, jj, ii = np.mgrid[0:100, 0:200, 0:200]
+    ras = np.stack([ii * -0.8 + 10, jj * -0.8 - 5, kk * 1.2 + 3], axis=-1) - center
+    ellipsoid = (((ras @ rotation) / semiAxes)**2).sum(axis=-1) <= 1
+    labelArray = np.where(ellipsoid, 3, 0).astype(np.uint8)
+    labelArray[:5] = 1
+
+    startTime = time.time()
+    principal = SegmentAxes.principalAxes(labelArray, ijkToRas, 3)
+    logging.info("principalAxes: {} voxels in {:.4f} s".format(principal["voxels"], time.time() - startTime))
+    self.assertEqual(principal["voxels"], np.count_nonzero(ellipsoid))
+    self.assertEqual(principal["step"], 1)
+    np.testing.assert_allclose(principal["centroid"], center, atol=0.05)
+    # the axes from the shortest to the longest, up to their signs, as a right-handed frame
+    np.testing.assert_allclose(np.abs(rotation.T @ principal["axes"]), np.eye(3), atol=2e-3)
+    self.assertAlmostEqual(np.linalg.det(principal["axes"]), 1.0)
+    self.assertTrue(principal["axes"][2, 2] > 0)
+    np.testing.assert_allclose(np.sqrt(5 * principal["variances"]), semiAxes, rtol=0.01)
+    np.testing.assert_allclose(principal["moments"], principal["variances"].sum() - principal["variances"])
+
+    # the other label and the empty labelmap
+    self.assertEqual(SegmentAxes.principalAxes(labelArray, ijkToRas, 1)["voxels"], 5 * 200 * 200)
+    self.assertIsNone(SegmentAxes.principalAxes(np.zeros((4, 4, 4), dtype=np.uint8), ijkToRas))
+
+    # a regular subset of the voxels changes the axes by a fraction of a degree
+    subset = SegmentAxes.principalAxes(np.where(labelArray == 3, labelArray, 0), ijkToRas, None, 20000)
+    self.assertTrue(subset["step"] >= 3)
+    self.assertTrue(subset["voxels"] < principal["voxels"] / 20)
+    angles = np.degrees(np.arccos(np.clip(np.abs(np.sum(subset["axes"] * principal["axes"], axis=0)), 0, 1)))
+    self.assertTrue(angles.max() < 0.5)
+    np.testing.assert_allclose(subset["centroid"], center, atol=1.5)
+
+    # the alignment rotates the long axis onto S and keeps the centroid in place
+    matrix = SegmentAxes.alignmentMatrix(principal["centroid"], principal["axes"])
+    np.testing.assert_allclose(matrix[:3, :3] @ principal["axes"], np.eye(3), atol=1e-12)
+    np.testing.assert_allclose(matrix @ np.append(principal["centroid"], 1), np.append(principal["centroid"], 1))
+
+    self.delayDisplay('Test passed')
+
+  def test_SliceProbe1(self):
+    """ Check the centroid of the section of a slanted cylinder by axial and oblique slice planes,
+    probed in its labelmap, and the planes that miss it.
+    """
+
+    self.delayDisplay("Starting the slice probe test")
+
+    import time
+    import numpy as np
+    from SegmentGeometryLib import SegmentAxes
+
+    # a slanted cylinder on an anisotropic grid, with another label around it
+    ijkToRas = np.array([[-0.5, 0, 0, 10], [0, -0.5, 0, -5], [0, 0, 0.8, 3], [0, 0, 0, 1]])
+    kk, jj, ii = np.ogrid[0:160, 0:200, 0:200]
+    cylinder = ((ii - 100 - 0.2 * (kk - 80))**2 + (jj - 90)**2 <= 40**2) & (kk > 5) & (kk < 150)
+    labelArray = np.where(cylinder, 2, 0).astype(np.uint8)
+    labelArray[:, :5] = 1
+
+    # an axial plane through slice k is the section of that slice
+    k = 83
+    sliceToRas = np.eye(4)
+    sliceToRas[:3, 3] = ijkToRas[:3, :3] @ [0, 0, k] + ijkToRas[:3, 3]
+    startTime = time.time()
+    centroid = SegmentAxes.planeCentroid(labelArray, ijkToRas, sliceToRas, 2)
+    logging.info("planeCentroid: {:.4f} s".format(time.time() - startTime))
+    j, i = np.nonzero(labelArray[k] == 2)
+    np.testing.assert_allclose(centroid, ijkToRas[:3, :3] @ [i.mean(), j.mean(), k] + ijkToRas[:3, 3], atol=0.3)
+    self.assertEqual(centroid[2], sliceToRas[2, 3])
+
+    # an oblique plane: the centroid is on the plane and on the axis of the cylinder
+    angle = np.radians(25)
+    sliceToRas[:3, :3] = [[1, 0, 0], [0, np.cos(angle), -np.sin(angle)], [0, np.sin(angle), np.cos(angle)]]
+    centroid = SegmentAxes.planeCentroid(labelArray, ijkToRas, sliceToRas, 2)
+    self.assertAlmostEqual((centroid - sliceToRas[:3, 3]) @ sliceToRas[:3, 2], 0.0)
+    ijk = np.linalg.solve(ijkToRas[:3, :3], centroid - ijkToRas[:3, 3])
+    self.assertTrue(abs(ijk[0] - 100 - 0.2 * (ijk[2] - 80)) < 1.0)
+    self.assertTrue(abs(ijk[1] - 90) < 1.0)
+
+    # the non-zero voxels, and planes that miss the segment or the labelmap
+    self.assertIsNotNone(SegmentAxes.planeCentroid(labelArray, ijkToRas, sliceToRas))
+    sliceToRas[:3, :3] = np.eye(3)
+    sliceToRas[:3, 3] = ijkToRas[:3, :3] @ [0, 0, 2] + ijkToRas[:3, 3]
+    self.assertIsNone(SegmentAxes.planeCentroid(labelArray, ijkToRas, sliceToRas, 2))
+    sliceToRas[2, 3] = 1000
+    self.assertIsNone(SegmentAxes.planeCentroid(labelArray, ijkToRas, sliceToRas))
+
+    self.delayDisplay('Test passed')
+
+  def test_NormalizedColumns1(self):
+    """ Check that the Doube and Summers normalized columns are derived from the columns in mm
+    on lookup without being stored and match the materialized ones.
+    """
+
+    self.delayDisplay("Starting the normalized columns test")
+
+    import numpy as np
+    from SegmentGeometryLib import SectionMoments, SectionTable
+
+    narray = self.taperedLabelmap(bore=False)
+    sampleSlices = np.arange(0, 120, 3)
+    props = SectionMoments.stackProperties(narray, 2, sampleSlices, 30)
+
+    materialized = SectionTable.sectionColumns(props, 120, 0.5, 0.25, doube=True, summers=True)
+    columns = SectionTable.sectionColumns(props, 120, 0.5, 0.25)
+    self.assertIsInstance(columns, SectionTable.SectionColumns)
+    self.assertFalse(any(name.endswith("Norm)") for name in columns))
+    derived = columns.derivedNames()
+    self.assertEqual(set(derived), set(materialized) - set(columns))
+    self.assertEqual(len(derived), 21)
+    for name in derived:
+      np.testing.assert_allclose(columns[name], materialized[name], rtol=1e-12)
+      self.assertNotIn(name, columns)
+    # the empty slices are zeros
+    self.assertEqual(columns["Iminor (MatNorm)"][np.searchsorted(sampleSlices, 51)], 0)
+
+    # only one normalization, and only of the base columns that are in the table
+    self.assertTrue(all(name.endswith("(LenNorm)") for name in columns.derivedNames(summers=False)))
+    self.assertEqual(columns.derivedNames(False, True, ["CSA (mm^2)", "Jz (mm^4)", "Zna (mm^3)"]), ["Jz (MatNorm)", "Zna (MatNorm)"])
+    self.assertEqual(columns.derivedNames(False, False), [])
+    with self.assertRaises(KeyError):
+      SectionTable.sectionColumns({"CSA": props["CSA"]}, 120, 0.5, 0.25)["Jz (LenNorm)"]
+    with self.assertRaises(ValueError):
+      SectionTable.normalizedColumn(columns, "Jz (mm^4)")
+
+    # the neutral axis columns for a new angle keep their normalized columns
+    orientation = SectionTable.orientationColumns(props, 120, 0.5, 0.25, doube=True, summers=True)
+    self.assertEqual(set(orientation), {name for name in materialized if name[:3] in ("Ina", "Ila", "Zna", "Zla", "Rna", "Rla")})
+    for name, values in orientation.items():
+      np.testing.assert_allclose(values, materialized[name], rtol=1e-12)
+
+    self.delayDisplay('Test passed')
+
+  def test_WeightedMoments1(self):
+    """ Check the brightness weighted moments against the slice by slice formulas and the
+    unweighted moments, the brightness percentiles against np.percentile, and log how long
+    both take on a large stack.
+    """
+
+    self.delayDisplay("Starting the weighted moments test")
+
+    import numpy as np
+    import time
+    from SegmentGeometryLib import SectionMetrics, SectionMoments, SectionTable
+
+    kk, jj, ii = np.ogrid[0:60, 0:70, 0:80]
+    narray = ((ii - 40)**2 / (15 + 5*np.sin(kk/9))**2 + (jj - 35)**2 / 20**2 <= 1).astype(np.uint8)
+    narray[20:23] = 0
+    voxelArray = (100 + 3*ii + 2*jj + kk).astype(np.int16)
+    sampleSlices = np.arange(0, 60, 2)
+
+    # with unit weights, the same moments as the foreground
+    ones = SectionMoments.stackWeightedProperties(np.ones_like(voxelArray), 2, sampleSlices, narray, 1.5)
+    props = SectionMoments.stackProperties(narray, 2, sampleSlices, None, 1.5)
+    np.testing.assert_allclose(ones["Weight"], props["CSA"])
+    for key in ("Cx", "Cy", "Ix", "Iy", "Ixy", "Jz", "Theta", "Imajor", "Iminor"):
+      np.testing.assert_allclose(ones[key], props[key], rtol=1e-9, atol=1e-9)
+
+    # the weighted sums of every slice, with the pixel self moment
+    weighted = SectionMoments.stackWeightedProperties(voxelArray, 2, sampleSlices, narray, 1.5)
+    for sampleIndex, i in enumerate(sampleSlices):
+      y, x = np.nonzero(narray[i])
+      if len(x) == 0:
+        self.assertEqual(weighted["Weight"][sampleIndex], 0)
+        self.assertEqual(weighted["Cx"][sampleIndex], 0)
+        continue
+      w = voxelArray[i][y, x].astype(np.float64) * 1.5
+      Cx = (w * x).sum() / w.sum()
+      Cy = (w * y).sum() / w.sum()
+      dx = x - Cx
+      dy = (y - Cy) * 1.5
+      self.assertAlmostEqual(weighted["Weight"][sampleIndex], w.sum())
+      self.assertAlmostEqual(weighted["Cx"][sampleIndex], Cx)
+      self.assertAlmostEqual(weighted["Cy"][sampleIndex], Cy)
+      self.assertAlmostEqual(weighted["Ix"][sampleIndex] / (w * (dy**2 + 1.5**2/12)).sum(), 1)
+      self.assertAlmostEqual(weighted["Iy"][sampleIndex] / (w * (dx**2 + 1/12)).sum(), 1)
+      self.assertAlmostEqual(weighted["Ixy"][sampleIndex] / (w * dx * dy).sum(), 1)
+    # the brighter side pulls the weighted centroid to larger x
+    filled = props["CSA"] > 0
+    self.assertTrue(np.all(weighted["Cx"][filled] > props["Cx"][filled]))
+    # a masked volume gives the same moments without the labelmap
+    masked = SectionMoments.stackWeightedProperties(np.where(narray, voxelArray, 0), 2, sampleSlices, None, 1.5)
+    for key, values in weighted.items():
+      np.testing.assert_allclose(masked[key], values)
+
+    columns = SectionTable.weightedColumns(weighted, 0.5)
+    np.testing.assert_allclose(columns["Weighted Jz"], weighted["Jz"] * 0.0625)
+    self.assertEqual(SectionTable.columnInfo("Weighted Jz")[0], None)
+    self.assertEqual(SectionMetrics.requiredMetrics(list(columns)), {"Weighted"})
+
+    # percentiles in any slice order, the empty slices are zeros
+    percentiles = (0, 10, 50, 97.5, 100)
+    values = SectionMoments.stackIntensityPercentiles(voxelArray, 2, sampleSlices[::-1], narray, percentiles)
+    for sampleIndex, i in enumerate(sampleSlices[::-1]):
+      inside = voxelArray[i][narray[i] > 0]
+      expected = np.percentile(inside, percentiles) if len(inside) else np.zeros(len(percentiles))
+      np.testing.assert_allclose(values[sampleIndex], expected)
+    columns = SectionTable.percentileColumns(values, percentiles)
+    self.assertEqual(list(columns), ["Brightness P0", "Brightness P10", "Brightness P50", "Brightness P97.5", "Brightness P100"])
+    self.assertEqual(SectionMetrics.requiredMetrics(["Brightness P50"]), {"Percentiles"})
+    with self.assertRaises(ValueError):
+      SectionMoments.stackIntensityPercentiles(voxelArray, 2, sampleSlices, narray, (50, 101))
+
+    largeLabels = np.tile(narray, (8, 4, 4))
+    largeVoxels = np.tile(voxelArray, (8, 4, 4))
+    allSlices = np.arange(largeLabels.shape[0])
+    startTime = time.time()
+    SectionMoments.stackWeightedProperties(largeVoxels, 2, allSlices, largeLabels)
+    logging.info("stackWeightedProperties: {} slices in {:.3f} s".format(len(allSlices), time.time() - startTime))
+    startTime = time.time()
+    SectionMoments.stackIntensityPercentiles(largeVoxels, 2, allSlices, largeLabels)
+    logging.info("stackIntensityPercentiles: {} slices in {:.3f} s".format(len(allSlices), time.time() - startTime))
+
     self.delayDisplay('Test passed')
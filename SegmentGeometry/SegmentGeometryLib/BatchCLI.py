@@ -0,0 +1,265 @@
+"""
+Headless batch processing of many specimens with SegmentGeometry.
+
+Run it with Slicer without the main window, for example:
+
+  Slicer --no-splash --no-main-window --python-script SegmentGeometryLib/BatchCLI.py
+    --manifest study.csv --output results.csv --jobs 8
+
+The manifest is a CSV file with a header row, or a JSON list of objects, with one specimen per
+row and the fields:
+
+  segmentation  path of the segmentation file (.seg.nrrd), required
+  volume        path of the volume the segments are measured on, optional
+  segments      names of the segments separated by ";", all segments if empty
+  specimen      name used in the results, the segmentation file name if empty
+  axis          "R (Yellow)", "A (Green)" or "S (Red)" (default)
+  interval      resampling interval in percent of the segment length, 0 (default) for every slice
+  angle         custom neutral axis angle in degrees, optional
+
+Specimens are split between jobs Slicer processes. The rows of all specimens are written to one
+results file with a "Specimen" column, and the time taken and any failure of every specimen are
+written to a report file next to it. The GUI is never used.
+"""
+
+import csv
+import json
+import logging
+import os
+import sys
+import time
+
+__all__ = [
+  "MANIFEST_FIELDS",
+  "readManifest",
+  "writeResults",
+  "combineResults",
+  "writeReport",
+  "measureSpecimen",
+  "runSpecimens",
+]
+
+MANIFEST_FIELDS = ("specimen", "segmentation", "volume", "segments", "axis", "interval", "angle")
+
+_DEFAULTS = {"volume": "", "segments": "", "axis": "S (Red)", "interval": "0", "angle": ""}
+
+
+def readManifest(path):
+  """
+  Read a CSV or JSON manifest and return one dictionary per specimen with all MANIFEST_FIELDS
+  filled in. Relative paths are taken relative to the manifest.
+  """
+  with open(path, newline="") as manifestFile:
+    if os.path.splitext(path)[1].lower() == ".json":
+      entries = json.load(manifestFile)
+    else:
+      entries = list(csv.DictReader(manifestFile))
+
+  baseDirectory = os.path.dirname(os.path.abspath(path))
+  specimens = []
+  for rowIndex, entry in enumerate(entries):
+    entry = {key.strip().lower(): ("" if value is None else str(value).strip()) for key, value in entry.items()}
+    unknown = set(entry) - set(MANIFEST_FIELDS)
+    if unknown:
+      raise ValueError("Unknown manifest field(s) in row {}: {}".format(rowIndex+1, ", ".join(sorted(unknown))))
+    if not entry.get("segmentation"):
+      raise ValueError("Missing segmentation in manifest row {}".format(rowIndex+1))
+    for key, value in _DEFAULTS.items():
+      if not entry.get(key):
+        entry[key] = value
+    for key in ("segmentation", "volume"):
+      if entry[key]:
+        entry[key] = os.path.join(baseDirectory, entry[key])
+    if not entry.get("specimen"):
+      entry["specimen"] = os.path.basename(entry["segmentation"]).split(".")[0]
+    specimens.append(entry)
+  return specimens
+
+
+def writeResults(path, results):
+  """
+  Write the table columns (name -> sequence) of several specimens, given as a list of
+  (specimen, columns), to one CSV file with a "Specimen" column. Columns that only some of the
+  specimens have (e.g. the custom neutral axis columns) are left empty for the others.
+  """
+  names = ["Specimen"]
+  for specimen, columns in results:
+    names.extend(name for name in columns if name not in names)
+  with open(path, "w", newline="") as resultsFile:
+    writer = csv.DictWriter(resultsFile, fieldnames=names, restval="")
+    writer.writeheader()
+    for specimen, columns in results:
+      rowCount = len(next(iter(columns.values()))) if columns else 0
+      for row in range(rowCount):
+        values = {name: values[row] for name, values in columns.items()}
+        values["Specimen"] = specimen
+        writer.writerow(values)
+
+
+def combineResults(partialPaths, outputPath):
+  """
+  Concatenate the CSV results of several jobs into one file. Columns that are missing from some
+  of the files are left empty for their rows.
+  """
+  tables = []
+  names = []
+  for path in partialPaths:
+    if not os.path.exists(path):
+      continue
+    with open(path, newline="") as partialFile:
+      reader = csv.DictReader(partialFile)
+      tables.append(list(reader))
+      names.extend(name for name in reader.fieldnames or [] if name not in names)
+  with open(outputPath, "w", newline="") as outputFile:
+    writer = csv.DictWriter(outputFile, fieldnames=names, restval="")
+    writer.writeheader()
+    for rows in tables:
+      writer.writerows(rows)
+
+
+def writeReport(path, report):
+  """
+  Write the per-specimen report: one row of (specimen, status, seconds, error) per specimen.
+  """
+  with open(path, "w", newline="") as reportFile:
+    writer = csv.writer(reportFile)
+    writer.writerow(["Specimen", "Status", "Seconds", "Error"])
+    for entry in report:
+      writer.writerow([entry["specimen"], entry["status"], "{:.2f}".format(entry["seconds"]), entry["error"]])
+
+
+def measureSpecimen(entry, workers=None):
+  """
+  Load the segmentation and volume of one manifest entry, measure the selected segments and
+  return the table columns. The scene is cleared afterwards.
+  """
+  import slicer
+  from SegmentGeometry import SegmentGeometryLogic
+
+  try:
+    segmentationNode = slicer.util.loadSegmentation(entry["segmentation"])
+    volumeNode = slicer.util.loadVolume(entry["volume"]) if entry["volume"] else None
+    segmentation = segmentationNode.GetSegmentation()
+    if entry["segments"]:
+      segmentIDs = []
+      for segName in entry["segments"].split(";"):
+        segmentID = segmentation.GetSegmentIdBySegmentName(segName.strip())
+        if not segmentID:
+          raise ValueError("Segment {} not found in {}".format(segName.strip(), entry["segmentation"]))
+        segmentIDs.append(segmentID)
+    else:
+      segmentIDs = list(segmentation.GetSegmentIDs())
+    angle = float(entry["angle"]) if entry["angle"] else None
+    return SegmentGeometryLogic().computeBatch(segmentationNode, segmentIDs, volumeNode, entry["axis"],
+                                               float(entry["interval"]), angle, workers)
+  finally:
+    slicer.mrmlScene.Clear(0)
+
+
+def runSpecimens(specimens, resultsPath, workers=None):
+  """
+  Measure specimens one after the other in this process, write their rows to resultsPath and
+  return the report of every specimen. A failing specimen is reported and skipped.
+  """
+  report = []
+  results = []
+  for entry in specimens:
+    start = time.time()
+    try:
+      results.append((entry["specimen"], measureSpecimen(entry, workers)))
+      status, error = "ok", ""
+    except Exception as e:
+      logging.error("Failed to measure {}: {}".format(entry["specimen"], e))
+      status, error = "failed", str(e)
+    seconds = time.time() - start
+    logging.info("{}: {} in {:.2f} seconds".format(entry["specimen"], status, seconds))
+    report.append({"specimen": entry["specimen"], "status": status, "seconds": seconds, "error": error})
+  writeResults(resultsPath, results)
+  return report
+
+
+def _launchJobs(args, jobCount):
+  """
+  Start jobCount Slicer processes that each measure every jobCount-th specimen and wait for them.
+  Returns the paths of their results and report files.
+  """
+  import subprocess
+  import slicer
+
+  processes = []
+  partialPaths = []
+  reportPaths = []
+  for jobIndex in range(jobCount):
+    partialPath = "{}.job{}".format(args.output, jobIndex)
+    partialPaths.append(partialPath)
+    reportPaths.append(partialPath + ".report")
+    command = [slicer.app.applicationFilePath(), "--no-splash", "--no-main-window", "--python-script", os.path.abspath(__file__),
+               "--manifest", args.manifest, "--output", partialPath, "--workers", str(args.workers),
+               "--job-index", str(jobIndex), "--job-count", str(jobCount)]
+    processes.append(subprocess.Popen(command))
+  for process in processes:
+    process.wait()
+  return partialPaths, reportPaths
+
+
+def _readReport(path):
+  if not os.path.exists(path):
+    return []
+  with open(path, newline="") as reportFile:
+    return [{"specimen": row["Specimen"], "status": row["Status"], "seconds": float(row["Seconds"]), "error": row["Error"]}
+            for row in csv.DictReader(reportFile)]
+
+
+def main(argv=None):
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Measure the cross-sections of the specimens listed in a manifest.")
+  parser.add_argument("--manifest", required=True, help="CSV or JSON manifest of the specimens")
+  parser.add_argument("--output", required=True, help="combined results CSV file")
+  parser.add_argument("--jobs", type=int, default=1, help="number of Slicer processes that measure specimens in parallel")
+  parser.add_argument("--workers", type=int, default=1, help="number of threads that process slices within each process")
+  parser.add_argument("--job-index", type=int, default=None, help=argparse.SUPPRESS)
+  parser.add_argument("--job-count", type=int, default=1, help=argparse.SUPPRESS)
+  args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+  start = time.time()
+  specimens = readManifest(args.manifest)
+  if args.job_index is not None:
+    # child process: measure a share of the specimens
+    report = runSpecimens(specimens[args.job_index::args.job_count], args.output, args.workers)
+    writeReport(args.output + ".report", report)
+    return 0
+
+  jobCount = max(min(args.jobs, len(specimens)), 1)
+  if jobCount == 1:
+    report = runSpecimens(specimens, args.output, args.workers)
+  else:
+    partialPaths, reportPaths = _launchJobs(args, jobCount)
+    report = []
+    for reportPath in reportPaths:
+      report.extend(_readReport(reportPath))
+    # specimens whose process died without reporting them
+    reported = set(entry["specimen"] for entry in report)
+    report.extend({"specimen": entry["specimen"], "status": "failed", "seconds": 0.0, "error": "process exited"}
+                  for entry in specimens if entry["specimen"] not in reported)
+    combineResults(partialPaths, args.output)
+    for path in partialPaths + reportPaths:
+      if os.path.exists(path):
+        os.remove(path)
+
+  writeReport(os.path.splitext(args.output)[0] + "_report.csv", report)
+
+  failed = [entry["specimen"] for entry in report if entry["status"] != "ok"]
+  logging.info("Measured {} of {} specimens in {:.2f} seconds".format(len(report) - len(failed), len(specimens), time.time() - start))
+  if failed:
+    logging.warning("Failed specimens: " + ", ".join(failed))
+  return 1 if failed else 0
+
+
+if __name__ == "__main__":
+  exitCode = main()
+  try:
+    import slicer
+    slicer.util.exit(exitCode)
+  except ImportError:
+    sys.exit(exitCode)
@@ -0,0 +1,271 @@
+"""
+Speed and accuracy benchmark of the section kernels on synthetic solids.
+
+The solids are cylinders, elliptic cylinders, hollow tubes, rotated ellipses and tapered
+bones along the S axis of a cubic labelmap of 1 mm voxels. Their sections are ellipses or
+elliptic rings, so the area, second moments, principal angle, perimeter and Feret diameters
+of every slice are known in closed form. Every stage of the measurement (crop, mask, io,
+moments, feret, perimeter, table) is timed, and the table is compared with the closed-form
+columns. The io stage writes the segment to a raw NRRD file and reads it back; the export of
+a segment from a Slicer scene is not measured. Run it without Slicer from the module
+directory, for example:
+
+  python -m SegmentGeometryLib.Benchmark --sizes 128 256 512 1024 --output benchmark.json
+
+The results are written as JSON, one record per solid and size, so that runs on different
+versions can be compared to catch regressions in speed or accuracy.
+"""
+
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+
+import numpy as np
+
+__all__ = [
+  "SHAPES",
+  "DEFAULT_SIZES",
+  "STAGES",
+  "shapeSections",
+  "syntheticLabelmap",
+  "exactColumns",
+  "columnErrors",
+  "benchmarkShape",
+  "runBenchmark",
+  "writeBenchmark",
+]
+
+# shape -> (semi-axis along I, semi-axis along J, inner to outer ratio, rotation in degrees) of the
+# first and last sections, the sizes as fractions of the volume size; linear in between
+SHAPES = {
+  "cylinder": ((0.3, 0.3, 0.0, 0.0), (0.3, 0.3, 0.0, 0.0)),
+  "ellipticCylinder": ((0.35, 0.2, 0.0, 0.0), (0.35, 0.2, 0.0, 0.0)),
+  "hollowTube": ((0.3, 0.3, 0.6, 0.0), (0.3, 0.3, 0.6, 0.0)),
+  "rotatedEllipse": ((0.35, 0.15, 0.0, 30.0), (0.35, 0.15, 0.0, 30.0)),
+  "taperedBone": ((0.3, 0.22, 0.55, 10.0), (0.18, 0.13, 0.55, 10.0)),
+}
+
+DEFAULT_SIZES = (128, 256, 512, 1024)
+
+STAGES = ("crop", "mask", "io", "moments", "feret", "perimeter", "table")
+
+# the solid leaves this fraction of the volume empty at both ends
+_MARGIN = 0.1
+
+
+def shapeSections(shapeName, size):
+  """
+  Sections of a solid in a labelmap of size**3 voxels. Returns (first, last, sections): the
+  first and last slice along K and a dictionary of arrays with one value per slice of the
+  solid: the semi-axes "a" (along I at no rotation) and "b" in voxels, the inner to outer
+  ratio "inner" and the rotation "phi" in radians, clockwise from I towards J.
+  """
+  if shapeName not in SHAPES:
+    raise ValueError("Invalid shape name: "+shapeName)
+  start, stop = (np.asarray(ends, dtype=np.float64) for ends in SHAPES[shapeName])
+  first = int(round(size * _MARGIN))
+  last = size - 1 - first
+  t = np.linspace(0.0, 1.0, last - first + 1)[:, None]
+  values = start + t * (stop - start)
+  sections = {"a": values[:, 0] * size, "b": values[:, 1] * size, "inner": values[:, 2], "phi": values[:, 3] * np.pi/180}
+  return first, last, sections
+
+
+def syntheticLabelmap(shapeName, size):
+  """
+  Binary labelmap (uint8, KJI order, size**3 voxels) of a solid, built one slice at a time.
+  A voxel belongs to the solid if its center is inside the section of its slice.
+  """
+  first, last, sections = shapeSections(shapeName, size)
+  labelArray = np.zeros((size, size, size), dtype=np.uint8)
+  center = (size - 1) / 2
+  y, x = np.ogrid[0:size, 0:size]
+  x = x - center
+  y = y - center
+  previous = None
+  for index in range(last - first + 1):
+    a, b, inner, phi = (sections[key][index] for key in ("a", "b", "inner", "phi"))
+    if previous is None or previous[0] != (a, b, inner, phi):
+      u = x * np.cos(phi) + y * np.sin(phi)
+      v = y * np.cos(phi) - x * np.sin(phi)
+      radius = (u / a)**2 + (v / b)**2
+      section = radius <= 1
+      if inner > 0:
+        section &= radius > inner**2
+      previous = ((a, b, inner, phi), section)
+    labelArray[first + index] = previous[1]
+  return labelArray
+
+
+def exactColumns(shapeName, size):
+  """
+  Closed-form table columns of every slice of a solid, with the names of
+  SectionTable.sectionColumns. The perimeter of the ellipses is Ramanujan's approximation. The
+  "Theta (deg)" of circular sections is NaN as their principal axes are not defined.
+  """
+  sections = shapeSections(shapeName, size)[2]
+  a = sections["a"]
+  b = sections["b"]
+  inner = sections["inner"]
+  ring = 1 - inner**4
+  columns = {}
+  columns["CSA (mm^2)"] = np.pi * a * b * (1 - inner**2)
+  Ia = np.pi * a * b**3 / 4 * ring
+  Ib = np.pi * a**3 * b / 4 * ring
+  columns["Jz (mm^4)"] = Ia + Ib
+  columns["Imajor (mm^4)"] = np.minimum(Ia, Ib)
+  columns["Iminor (mm^4)"] = np.maximum(Ia, Ib)
+  # the minor principal axis is perpendicular to the longer semi-axis
+  majorAngle = sections["phi"] + np.where(a >= b, 0.0, np.pi/2)
+  columns["Theta (deg)"] = np.where(a == b, np.nan, np.mod(majorAngle * 180/np.pi + 90, 180))
+  ellipse = np.pi * (3 * (a + b) - np.sqrt((3 * a + b) * (a + 3 * b)))
+  columns["Perimeter (mm)"] = ellipse * (1 + inner)
+  columns["Max Feret Diameter (mm)"] = 2 * np.maximum(a, b)
+  columns["Min Feret Diameter (mm)"] = 2 * np.minimum(a, b)
+  return columns
+
+
+def columnErrors(columns, exact):
+  """
+  Largest and mean error of every column of exact that the measured columns hold: relative for
+  the sizes and absolute, in degrees modulo 180, for the angles. NaN values of exact are skipped.
+  """
+  errors = {}
+  for name, expected in exact.items():
+    if name not in columns:
+      continue
+    measured = np.asarray(columns[name], dtype=np.float64)
+    defined = ~np.isnan(expected)
+    if not defined.any():
+      continue
+    if name.endswith("(deg)"):
+      difference = np.mod(measured[defined] - expected[defined] + 90, 180) - 90
+      error = np.abs(difference)
+    else:
+      error = np.abs(measured[defined] - expected[defined]) / expected[defined]
+    errors[name] = {"max": float(error.max()), "mean": float(error.mean())}
+  return errors
+
+
+def _writeNrrd(path, array):
+  with open(path, "wb") as nrrdFile:
+    sizes = " ".join(str(size) for size in array.shape[::-1])
+    nrrdFile.write("NRRD0004\ntype: uchar\ndimension: 3\nsizes: {}\nspacings: 1 1 1\nencoding: raw\n\n".format(sizes).encode())
+    array.astype(np.uint8).tofile(nrrdFile)
+
+
+def benchmarkShape(shapeName, size, workers=None, traceMemory=False, labelArray=None):
+  """
+  Measure the slices of a solid along S as SegmentGeometryLogic.run does and return a record
+  with the time (and peak memory if traceMemory is True) of every stage and the errors of the
+  table columns against the closed-form columns. The labelmap is built with
+  syntheticLabelmap if it is not given.
+  """
+  from .Profiling import StageReport
+  from .SectionFeret import stackFeret
+  from .SectionMoments import stackProperties
+  from .SectionPerimeter import stackPerimeter
+  from .SectionTable import sectionColumns
+  from .SegmentBatch import foregroundBox
+  from .SlabStream import readNrrd
+  from .SliceChunks import mapSliceChunks
+
+  if labelArray is None:
+    labelArray = syntheticLabelmap(shapeName, size)
+  axisIndex = 2
+  report = StageReport(traceMemory)
+  report.start()
+  try:
+    with report.stage("crop"):
+      box = foregroundBox(labelArray)
+      crop = labelArray[box]
+    with report.stage("mask"):
+      mask = crop != 0
+    # the segment written to a labelmap file and read back
+    with tempfile.TemporaryDirectory() as directory:
+      with report.stage("io"):
+        path = os.path.join(directory, "segment.nrrd")
+        _writeNrrd(path, mask)
+        readBack = np.asarray(readNrrd(path)[0]) != 0
+      if not np.array_equal(readBack, mask):
+        raise ValueError("The labelmap file of {} differs from the segment".format(shapeName))
+      del readBack
+    sampleSlices = np.arange(mask.shape[0])
+    with report.stage("moments"):
+      props = mapSliceChunks(stackProperties, mask, axisIndex, sampleSlices, workers)
+    with report.stage("feret"):
+      ferets = mapSliceChunks(stackFeret, mask, axisIndex, sampleSlices, workers)
+    with report.stage("perimeter"):
+      perimeter = mapSliceChunks(stackPerimeter, mask, axisIndex, sampleSlices, workers)
+    with report.stage("table"):
+      columns = sectionColumns(props, mask.shape[0], 1.0, 1.0, perimeter, ferets)
+  finally:
+    report.stop()
+
+  exact = exactColumns(shapeName, size)
+  totals = report.totals()
+  stages = {}
+  for name in STAGES:
+    stages[name] = {"seconds": totals[name]["seconds"], "peakBytes": totals[name]["peakBytes"]}
+  return {"shape": shapeName, "size": size, "slices": int(mask.shape[0]), "voxels": int(np.count_nonzero(mask)),
+          "stages": stages, "errors": columnErrors(columns, exact)}
+
+
+def runBenchmark(shapes=None, sizes=DEFAULT_SIZES, workers=None, traceMemory=False):
+  """
+  Benchmark every solid of shapes (all SHAPES if None) at every size and return the records of
+  benchmarkShape, sizes first so that the small sizes finish early.
+  """
+  if shapes is None:
+    shapes = list(SHAPES)
+  records = []
+  for size in sizes:
+    for shapeName in shapes:
+      record = benchmarkShape(shapeName, size, workers, traceMemory)
+      logging.info("{} {}: {:.3f} s".format(shapeName, size, sum(stage["seconds"] for stage in record["stages"].values())))
+      records.append(record)
+  return records
+
+
+def writeBenchmark(path, records):
+  """
+  Write the records of runBenchmark with the versions of Python and NumPy and the number of
+  cores to a JSON file, or to the standard output if path is None.
+  """
+  results = {
+    "python": platform.python_version(),
+    "numpy": np.__version__,
+    "machine": platform.machine(),
+    "cpus": os.cpu_count(),
+    "records": records,
+  }
+  if path is None:
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+  else:
+    with open(path, "w") as resultsFile:
+      json.dump(results, resultsFile, indent=2)
+
+
+def main(argv=None):
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Benchmark the section kernels on synthetic solids with closed-form section properties.")
+  parser.add_argument("--shapes", nargs="+", default=None, choices=list(SHAPES), help="solids to measure, all by default")
+  parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES), help="edge lengths of the cubic labelmaps in voxels")
+  parser.add_argument("--workers", type=int, default=None, help="threads that process chunks of slices, one per core by default")
+  parser.add_argument("--trace-memory", action="store_true", help="also record the peak memory of every stage, which is slower")
+  parser.add_argument("--output", default=None, help="JSON results file, the standard output by default")
+  args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+  logging.basicConfig(level=logging.INFO)
+  records = runBenchmark(args.shapes, args.sizes, args.workers, args.trace_memory)
+  writeBenchmark(args.output, records)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Least recently used cache of the cropped labelmap and intensity arrays of segments.
+
+Exporting a segment to a labelmap (clone, mask, pad and export) is the slowest part of a run
+and does not depend on which properties are computed. The arrays of the last exported
+segments are kept here under a key that changes whenever the segmentation, the volume or
+their transforms change, so that re-running with other options skips the export.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+__all__ = [
+  "DEFAULT_CACHE_BYTES",
+  "LabelmapCache",
+]
+
+# memory budget of the cached arrays
+DEFAULT_CACHE_BYTES = 1024**3
+
+
+class LabelmapCache:
+  """
+  Dictionary of entries (dictionaries of NumPy arrays and other values) with a bound on the
+  total size of the arrays. The least recently used entries are dropped first.
+  Keys are tuples whose first item is the ID of the segmentation node.
+  """
+
+  def __init__(self, maxBytes=DEFAULT_CACHE_BYTES):
+    self.maxBytes = maxBytes
+    self._entries = OrderedDict()
+
+  @staticmethod
+  def entryBytes(entry):
+    """
+    Memory held by the arrays of an entry. A view is counted with the whole array it is a view of.
+    """
+    size = 0
+    for value in entry.values():
+      if isinstance(value, np.ndarray):
+        while isinstance(value.base, np.ndarray):
+          value = value.base
+        size += value.nbytes
+    return size
+
+  @property
+  def totalBytes(self):
+    return sum(self.entryBytes(entry) for entry in self._entries.values())
+
+  def __len__(self):
+    return len(self._entries)
+
+  def __contains__(self, key):
+    return key in self._entries
+
+  def get(self, key):
+    """
+    Return the entry stored under key and mark it as recently used, or None.
+    """
+    entry = self._entries.get(key)
+    if entry is not None:
+      self._entries.move_to_end(key)
+    return entry
+
+  def put(self, key, entry):
+    """
+    Store entry under key and drop the least recently used entries until the arrays fit in
+    maxBytes. An entry that is larger than maxBytes on its own is not stored.
+    """
+    self._entries.pop(key, None)
+    size = self.entryBytes(entry)
+    if size > self.maxBytes:
+      return
+    while self._entries and self.totalBytes + size > self.maxBytes:
+      self._entries.popitem(last=False)
+    self._entries[key] = entry
+
+  def invalidate(self, segmentationNodeID=None):
+    """
+    Drop the entries of a segmentation node, or all entries if no node ID is given.
+    """
+    if segmentationNodeID is None:
+      self._entries.clear()
+      return
+    for key in [key for key in self._entries if key[0] == segmentationNodeID]:
+      del self._entries[key]
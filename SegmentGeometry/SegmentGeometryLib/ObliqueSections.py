@@ -0,0 +1,258 @@
+"""
+Cross-sections of a labelmap array along an arbitrary direction, without resampling.
+
+The foreground voxel centres are projected on the direction and split between the sections,
+which are a given thickness apart. The in-plane moments of every section are accumulated in
+the rotated frame of the direction, so the properties of sections that are not aligned with
+the volume axes are obtained from the original voxels. Sections perpendicular to a curve, such as the centerline
+of a curved bone, are obtained the same way from the closest stations along the curve. The
+array is read in chunks of planes, so only the coordinates of one chunk are held in memory
+at a time.
+
+Results are in the same pixel units as SectionMoments, where a pixel is a square with the
+side of the section thickness, so that they can be scaled to mm with SectionTable.sectionColumns.
+"""
+
+import numpy as np
+
+__all__ = [
+  "sectionFrame",
+  "projectionRange",
+  "obliqueSectionProperties",
+  "curveFrames",
+  "curveSectionProperties",
+]
+
+# number of voxels of the array read at a time
+DEFAULT_CHUNK_VOXELS = 2**24
+
+
+def sectionFrame(direction):
+  """
+  Orthonormal frame (u, v, d) of the sections perpendicular to direction, given in the IJK
+  axes of the array. u is the first array axis (columns) projected on the section plane, or
+  the second one if the direction is close to the first, and v = d x u, so that sections
+  along the third array axis have u and v along the columns and rows as in SectionMoments.
+  """
+  d = np.asarray(direction, dtype=np.float64)
+  length = np.linalg.norm(d)
+  if length == 0:
+    raise ValueError("Invalid section direction: "+str(direction))
+  d = d / length
+  reference = np.array([1.0, 0.0, 0.0]) if abs(d[0]) < 0.9 else np.array([0.0, 1.0, 0.0])
+  u = reference - np.dot(reference, d) * d
+  u /= np.linalg.norm(u)
+  v = np.cross(d, u)
+  return u, v, d
+
+
+def _planeChunks(labelArray, chunkVoxels):
+  """
+  Boolean foreground of consecutive chunks of planes (first array axis) and their first plane.
+  """
+  planeVoxels = max(labelArray.shape[1] * labelArray.shape[2], 1)
+  step = max(1, chunkVoxels // planeVoxels)
+  for first in range(0, labelArray.shape[0], step):
+    yield first, labelArray[first:first+step] > 0
+
+
+def _positions(k, j, i, spacing, origin):
+  """
+  Physical positions (mm, IJK axes) of voxels relative to origin, as an (N, 3) array.
+  """
+  return np.stack([i * spacing[0], j * spacing[1], k * spacing[2]], axis=1) - origin
+
+
+def projectionRange(labelArray, spacing, direction, chunkVoxels=DEFAULT_CHUNK_VOXELS):
+  """
+  Smallest and largest projection (mm) of the foreground voxel centres of a labelmap array in
+  KJI order on direction, relative to the centre of the array. As the projection is linear, it
+  is enough to look at the first and last foreground voxel of every row.
+  Returns None if the array is empty.
+  """
+  spacing = np.asarray(spacing, dtype=np.float64)
+  d = sectionFrame(direction)[2]
+  origin = (np.array(labelArray.shape[::-1]) // 2) * spacing
+  low, high = np.inf, -np.inf
+  for first, chunk in _planeChunks(labelArray, chunkVoxels):
+    k, j = np.nonzero(chunk.any(axis=2))
+    if len(k) == 0:
+      continue
+    left = np.argmax(chunk, axis=2)[k, j]
+    right = chunk.shape[2] - 1 - np.argmax(chunk[:, :, ::-1], axis=2)[k, j]
+    h = np.concatenate([_positions(k + first, j, i, spacing, origin) @ d for i in (left, right)])
+    low = min(low, h.min())
+    high = max(high, h.max())
+  if low > high:
+    return None
+  return low, high
+
+
+def _sectionProperties(chunkCoordinates, numSections, voxelArea, angle=None):
+  """
+  Properties of numSections sections from the voxels given by chunkCoordinates, a function
+  that yields (section, weight, x, y) arrays for every chunk of the array, with x and y the
+  in-plane coordinates of the voxels in their section. voxelArea is the area that a voxel of
+  weight 1 adds to its section. Returns the dictionary of SectionMoments.stackProperties.
+  """
+  from .SectionMoments import centralMoments, momentProperties, _addSectionModuli
+
+  # raw moments of every section
+  sums = np.zeros((6, numSections))
+  for section, weights, x, y in chunkCoordinates():
+    for row, values in enumerate((weights, weights * x, weights * y, weights * x * x, weights * y * y, weights * x * y)):
+      sums[row] += np.bincount(section, weights=values, minlength=numSections)
+  n, Sx, Sy, Sxx, Syy, Sxy = sums
+  Cx, Cy, Cxx, Cyy, Cxy = centralMoments(n, Sx, Sy, Sxx, Syy, Sxy)
+  props = momentProperties(n * voxelArea, Cxx * voxelArea, Cyy * voxelArea, Cxy * voxelArea, angle)
+
+  # extreme fibre distances from the centroid of every section
+  distances = {key: np.zeros(numSections) for key in ("Rmajor", "Rminor", "Maxrad", "Rna", "Rla")}
+  for section, weights, x, y in chunkCoordinates():
+    dx = x - Cx[section]
+    dy = y - Cy[section]
+    c = np.cos(props["Theta"])[section]
+    s = np.sin(props["Theta"])[section]
+    np.maximum.at(distances["Rmajor"], section, np.abs(dy * c - dx * s))
+    np.maximum.at(distances["Rminor"], section, np.abs(dx * c + dy * s))
+    np.maximum.at(distances["Maxrad"], section, np.sqrt(dx * dx + dy * dy))
+    if angle is not None:
+      c = np.cos(angle * np.pi/180)
+      s = np.sin(angle * np.pi/180)
+      np.maximum.at(distances["Rna"], section, np.abs(dy * c - dx * s))
+      np.maximum.at(distances["Rla"], section, np.abs(dx * c + dy * s))
+  if angle is None:
+    del distances["Rna"], distances["Rla"]
+  props.update(distances)
+
+  props["CSA"] = n * voxelArea
+  props["Cx"] = np.where(n > 0, Cx, 0.0)
+  props["Cy"] = np.where(n > 0, Cy, 0.0)
+  _addSectionModuli(props, n)
+  return {key: np.asarray(value, dtype=np.float64) for key, value in props.items()}
+
+
+def obliqueSectionProperties(labelArray, spacing, direction, thickness=None, angle=None,
+                             chunkVoxels=DEFAULT_CHUNK_VOXELS):
+  """
+  Second moment based properties of the sections of a labelmap array in KJI order
+  perpendicular to direction (IJK axes of the array), with spacing the IJK voxel size in mm.
+  Sections are thickness mm apart (the smallest voxel size by default), from the first to
+  the last foreground voxel. Every voxel is split linearly between the two sections on either
+  side of its centre, and adds its volume over the thickness to their areas. Returns the
+  dictionary of SectionMoments.stackProperties for every section, in pixels of the size of
+  the thickness; Cx and Cy are the centroid along u and v of sectionFrame.
+  """
+  spacing = np.asarray(spacing, dtype=np.float64)
+  if thickness is None:
+    thickness = spacing.min()
+  if thickness <= 0:
+    raise ValueError("Invalid section thickness: "+str(thickness))
+  u, v, d = sectionFrame(direction)
+  origin = (np.array(labelArray.shape[::-1]) // 2) * spacing
+  extent = projectionRange(labelArray, spacing, d, chunkVoxels)
+  if extent is None:
+    raise ValueError("Labelmap is empty")
+  numSections = int(np.floor((extent[1] - extent[0]) / thickness)) + 1
+
+  def chunkCoordinates():
+    # section number, weight and in-plane coordinates (in thickness units) of the voxels of every chunk
+    for first, chunk in _planeChunks(labelArray, chunkVoxels):
+      k, j, i = np.nonzero(chunk)
+      if len(k) == 0:
+        continue
+      positions = _positions(k + first, j, i, spacing, origin)
+      # split every voxel between the two sections on either side of its centre, which avoids
+      # the beating between the voxel grid and the sections of oblique directions
+      q = (positions @ d - extent[0]) / thickness
+      lower = np.floor(q).astype(np.int64)
+      fraction = q - lower
+      section = np.minimum(np.concatenate((lower, lower + 1)), numSections - 1)
+      weights = np.concatenate((1 - fraction, fraction))
+      x = np.tile(positions @ u / thickness, 2)
+      y = np.tile(positions @ v / thickness, 2)
+      keep = weights > 0
+      yield section[keep], weights[keep], x[keep], y[keep]
+
+  # every voxel adds its volume over the thickness to the area of its section
+  props = _sectionProperties(chunkCoordinates, numSections, np.prod(spacing) / thickness**3, angle)
+  filled = props["CSA"] > 0
+  props["Cx"] = np.where(filled, props["Cx"] + origin @ u / thickness, 0.0)
+  props["Cy"] = np.where(filled, props["Cy"] + origin @ v / thickness, 0.0)
+  return props
+
+
+def curveFrames(points):
+  """
+  Unit tangents and rotation minimizing in-plane axes (u, v) of a curve given by its points
+  (N, 3). The axes of the first point are those of sectionFrame and every next u is the
+  previous one projected on the next section plane, so the sections do not twist.
+  """
+  points = np.asarray(points, dtype=np.float64)
+  if len(points) < 2:
+    raise ValueError("Curve needs at least two points")
+  tangents = np.gradient(points, axis=0)
+  lengths = np.linalg.norm(tangents, axis=1)
+  if np.any(lengths == 0):
+    raise ValueError("Curve has repeated points")
+  tangents /= lengths[:, None]
+  u = np.zeros_like(points)
+  u[0] = sectionFrame(tangents[0])[0]
+  for station in range(1, len(points)):
+    axis = u[station-1] - np.dot(u[station-1], tangents[station]) * tangents[station]
+    u[station] = axis / np.linalg.norm(axis)
+  v = np.cross(tangents, u)
+  return tangents, u, v
+
+
+def curveSectionProperties(labelArray, spacing, points, angle=None, chunkVoxels=DEFAULT_CHUNK_VOXELS):
+  """
+  Second moment based properties of the sections of a labelmap array in KJI order
+  perpendicular to a curve, such as the centerline of a curved bone, at each of its points.
+  points (N, 3) are equally spaced stations along the curve, in mm along the IJK axes of the
+  array from its first voxel. Every voxel belongs to the sections of the station it is closest
+  to and of the next station on the side of the section plane it lies on, split linearly by
+  its distance to their planes as in obliqueSectionProperties, and adds its volume over the
+  distance between the two planes at the voxel to their areas. Voxels more than one station
+  spacing before the first or after the last station are left out. Returns the dictionary of
+  SectionMoments.stackProperties for every station, in pixels of the size of the station
+  spacing; Cx and Cy are the centroid along u and v of curveFrames relative to the station.
+  """
+  from scipy.spatial import cKDTree
+
+  spacing = np.asarray(spacing, dtype=np.float64)
+  points = np.asarray(points, dtype=np.float64)
+  tangents, u, v = curveFrames(points)
+  numSections = len(points)
+  thickness = np.linalg.norm(np.diff(points, axis=0), axis=1).mean()
+  stations = cKDTree(points)
+  # a plane one station spacing beyond either end, for the voxels past the first or last station
+  planePoints = np.concatenate(([points[0] - thickness * tangents[0]], points, [points[-1] + thickness * tangents[-1]]))
+  planeNormals = np.concatenate(([tangents[0]], tangents, [tangents[-1]]))
+
+  def chunkCoordinates():
+    for first, chunk in _planeChunks(labelArray, chunkVoxels):
+      k, j, i = np.nonzero(chunk)
+      if len(k) == 0:
+        continue
+      positions = _positions(k + first, j, i, spacing, 0.0)
+      # the planes of the closest station and of its neighbour on the other side of the voxel
+      nearest = stations.query(positions)[1]
+      side = np.einsum('ij,ij->i', positions - points[nearest], tangents[nearest]) >= 0
+      lower = np.where(side, nearest, nearest - 1)
+      below = np.einsum('ij,ij->i', positions - planePoints[lower+1], planeNormals[lower+1])
+      above = np.einsum('ij,ij->i', planePoints[lower+2] - positions, planeNormals[lower+2])
+      # split the voxel linearly between the two planes; where they are closer together, as on
+      # the inside of a bend, the voxel adds more to their areas
+      gap = np.where(below + above > 0, below + above, thickness)
+      fraction = np.clip(below / gap, 0, 1)
+      section = np.concatenate((lower, lower + 1))
+      weights = np.concatenate((1 - fraction, fraction)) * np.tile(thickness / gap, 2)
+      keep = (weights > 0) & (section >= 0) & (section < numSections)
+      section = section[keep]
+      offsets = np.tile(positions, (2, 1))[keep] - points[section]
+      x = np.einsum('ij,ij->i', offsets, u[section]) / thickness
+      y = np.einsum('ij,ij->i', offsets, v[section]) / thickness
+      yield section, weights[keep], x, y
+
+  return _sectionProperties(chunkCoordinates, numSections, np.prod(spacing) / thickness**3, angle)
@@ -0,0 +1,221 @@
+"""
+Time and memory taken by the stages of a run.
+
+A StageReport records the wall time of every stage that is run inside its stage context
+manager and, if memory tracing is on, the peak memory allocated during the stage with
+tracemalloc, so that the cost of every stage of SegmentGeometryLogic.run can be compared.
+
+While a report is started, the functions decorated with profiled and the blocks run in
+activeStage are recorded in it too, so that the helpers of the logic and the kernels can be
+instrumented without passing the report around. Without a started report they cost nothing
+but a list lookup. The report can be saved as JSON or as a Chrome trace, which can be opened
+in chrome://tracing or https://ui.perfetto.dev to see the stages on a timeline.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+__all__ = [
+  "StageReport",
+  "activeReport",
+  "activeStage",
+  "profiled",
+]
+
+# started reports, the innermost last
+_ACTIVE = []
+
+
+class StageReport:
+  """
+  List of the stages of a run with their start ("start", seconds since the report was made),
+  duration ("seconds"), nesting level ("depth"), thread and details and, if traceMemory is True,
+  the peak memory allocated by NumPy and Python while they ran ("peakBytes", None otherwise).
+  Stages can be nested: the peak of a stage includes the peaks of the stages run inside of it.
+  Nested stages must be run on the thread that started the report; other threads can only add
+  stages with record.
+  """
+
+  def __init__(self, traceMemory=False):
+    self.traceMemory = traceMemory
+    self.stages = []
+    self._open = []
+    self._origin = time.perf_counter()
+    self._startedTracing = False
+    self._thread = None
+
+  @contextmanager
+  def stage(self, name, **details):
+    """
+    Measure the code run in a with block as the stage name, with the keyword arguments as its
+    details (numbers or strings, such as the segment or the number of slices).
+    """
+    tracing = self.traceMemory == True and tracemalloc.is_tracing()
+    entry = {"name": name, "start": 0.0, "seconds": 0.0, "peakBytes": None, "depth": len(self._open),
+             "thread": threading.get_ident(), "details": details}
+    if tracing:
+      current = tracemalloc.get_traced_memory()[0]
+      tracemalloc.reset_peak()
+      self._open.append([current, current])
+    else:
+      self._open.append(None)
+    start = time.perf_counter()
+    entry["start"] = start - self._origin
+    try:
+      yield entry
+    finally:
+      entry["seconds"] = time.perf_counter() - start
+      memory = self._open.pop()
+      if memory is not None:
+        startBytes, peak = memory
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        entry["peakBytes"] = peak - startBytes
+        for outer in reversed(self._open):
+          if outer is not None:
+            outer[1] = max(outer[1], peak)
+            break
+      self.stages.append(entry)
+
+  def record(self, name, start, seconds, **details):
+    """
+    Add a stage that was timed elsewhere, from its time.perf_counter start and its duration.
+    Safe to call from worker threads, for example for every chunk of slices of a kernel.
+    """
+    self.stages.append({"name": name, "start": start - self._origin, "seconds": seconds, "peakBytes": None,
+                        "depth": None, "thread": threading.get_ident(), "details": details})
+
+  def timed(self, name):
+    """
+    Decorator that measures every call of a function as the stage name.
+    """
+    def decorator(function):
+      @functools.wraps(function)
+      def wrapper(*args, **kwargs):
+        with self.stage(name):
+          return function(*args, **kwargs)
+      return wrapper
+    return decorator
+
+  def start(self):
+    """
+    Make this the active report of activeStage and profiled, and start tracemalloc if
+    traceMemory is True and it is not on already.
+    """
+    _ACTIVE.append(self)
+    self._thread = threading.get_ident()
+    self._startedTracing = self.traceMemory == True and not tracemalloc.is_tracing()
+    if self._startedTracing:
+      tracemalloc.start()
+
+  def stop(self):
+    """
+    Stop being the active report, and stop tracemalloc if start turned it on.
+    """
+    if self in _ACTIVE:
+      _ACTIVE.remove(self)
+    if self._startedTracing:
+      tracemalloc.stop()
+      self._startedTracing = False
+
+  def totals(self):
+    """
+    Total time (and largest peak) of every stage name, in the order they were first run.
+    """
+    totals = {}
+    for entry in self.stages:
+      total = totals.setdefault(entry["name"], {"seconds": 0.0, "peakBytes": None, "count": 0})
+      total["seconds"] += entry["seconds"]
+      total["count"] += 1
+      if entry["peakBytes"] is not None:
+        total["peakBytes"] = max(total["peakBytes"] or 0, entry["peakBytes"])
+    return totals
+
+  def summary(self):
+    """
+    One line per stage name with its total time and peak memory, for the log.
+    """
+    lines = []
+    for name, total in self.totals().items():
+      line = "{}: {:.3f} s".format(name, total["seconds"])
+      if total["peakBytes"] is not None:
+        line += ", peak {:.1f} MB".format(total["peakBytes"] / 1024**2)
+      lines.append(line)
+    return "\n".join(lines)
+
+  def asDict(self):
+    """
+    The stages, in the order they were started, and their totals as a dictionary that can be
+    saved as JSON.
+    """
+    return {"traceMemory": self.traceMemory == True,
+            "stages": sorted(self.stages, key=lambda entry: entry["start"]),
+            "totals": self.totals()}
+
+  def toJson(self, path=None):
+    """
+    The report as a JSON string (see asDict), also written to path if it is given.
+    """
+    text = json.dumps(self.asDict(), indent=2)
+    if path is not None:
+      with open(path, "w") as reportFile:
+        reportFile.write(text)
+    return text
+
+  def toChromeTrace(self, path=None):
+    """
+    The stages as complete events of the Chrome trace event format, one timeline row per thread,
+    with the peak memory and the details as arguments. Written as JSON to path if it is given.
+    """
+    threads = {}
+    events = []
+    for entry in sorted(self.stages, key=lambda entry: entry["start"]):
+      arguments = dict(entry["details"])
+      if entry["peakBytes"] is not None:
+        arguments["peakBytes"] = entry["peakBytes"]
+      events.append({"name": entry["name"], "cat": "SegmentGeometry", "ph": "X",
+                     "ts": entry["start"] * 1e6, "dur": entry["seconds"] * 1e6, "pid": os.getpid(),
+                     "tid": threads.setdefault(entry["thread"], len(threads)), "args": arguments})
+    trace = {"traceEvents": events, "displayTimeUnit": "ms"}
+    if path is not None:
+      with open(path, "w") as traceFile:
+        json.dump(trace, traceFile)
+    return trace
+
+
+def activeReport():
+  """
+  The report that was started last and not stopped yet, or None.
+  """
+  return _ACTIVE[-1] if _ACTIVE else None
+
+
+@contextmanager
+def activeStage(name, **details):
+  """
+  Measure the code run in a with block as a stage of the active report, if there is one and it
+  was started on this thread.
+  """
+  report = activeReport()
+  if report is None or report._thread != threading.get_ident():
+    yield None
+  else:
+    with report.stage(name, **details) as entry:
+      yield entry
+
+
+def profiled(name):
+  """
+  Decorator that measures every call of a function as a stage of the active report, if there is one.
+  """
+  def decorator(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      with activeStage(name):
+        return function(*args, **kwargs)
+    return wrapper
+  return decorator
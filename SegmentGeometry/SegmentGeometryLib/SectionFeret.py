@@ -0,0 +1,200 @@
+"""
+Feret diameters of all slices of a stack, measured between pixel centres.
+
+The convex hull of every slice is built from boundary pixels only: a hull vertex is always
+the leftmost or rightmost pixel of its row and the top or bottom pixel of its column. The
+minimum and maximum Feret diameters are then found with one rotating calipers pass over
+the hull edges of all slices at once.
+"""
+
+import numpy as np
+
+__all__ = [
+  "rowExtents",
+  "stackHulls",
+  "hullFeret",
+  "stackFeret",
+]
+
+# offset between the caliper angles of consecutive hulls, larger than the 4 pi spanned by one hull
+_HULL_ANGLE_SPAN = 16.0
+
+
+def _groupStarts(counts):
+  starts = np.zeros(len(counts), dtype=np.int64)
+  np.cumsum(counts[:-1], out=starts[1:])
+  return starts
+
+
+def _cyclicNeighbours(groups):
+  """
+  Index of the previous and next point of every point of a list of closed polygons,
+  where groups holds the (sorted) polygon number of each point.
+  """
+  index = np.arange(len(groups))
+  first = np.r_[True, groups[1:] != groups[:-1]]
+  last = np.r_[groups[1:] != groups[:-1], True]
+  firstIndex = np.maximum.accumulate(np.where(first, index, 0))
+  lastIndex = np.flatnonzero(last)[np.cumsum(first) - 1]
+  previous = np.where(first, lastIndex, index - 1)
+  following = np.where(last, firstIndex, index + 1)
+  return previous, following
+
+
+# position of the first and last set bit of a byte packed with np.packbits (most significant bit first)
+_FIRST_BIT = np.array([0] + [7 - int(value).bit_length() + 1 for value in range(1, 256)], dtype=np.int32)
+_LAST_BIT = np.array([0] + [7 - (int(value) & -int(value)).bit_length() + 1 for value in range(1, 256)], dtype=np.int32)
+
+
+def rowExtents(mask):
+  """
+  First and last foreground column of every row of a boolean stack (slices, rows, columns),
+  found on the bit-packed rows, which are 8 times smaller to search. Returns (s, y, left,
+  right) for the rows that are not empty, as int32 arrays.
+  """
+  packed = np.packbits(mask, axis=2)
+  filledBytes = packed != 0
+  s, y = np.nonzero(filledBytes.any(axis=2))
+  s = s.astype(np.int32)
+  y = y.astype(np.int32)
+  first = np.argmax(filledBytes, axis=2)[s, y]
+  last = packed.shape[2] - 1 - np.argmax(filledBytes[:, :, ::-1], axis=2)[s, y]
+  left = 8 * first.astype(np.int32) + _FIRST_BIT[packed[s, y, first]]
+  right = 8 * last.astype(np.int32) + _LAST_BIT[packed[s, y, last]]
+  return s, y, left, right
+
+
+def stackHulls(mask):
+  """
+  Convex hull of every slice of a boolean stack (slices, rows, columns), with x along the
+  columns and y along the rows. Returns the slice numbers of the non empty slices and the
+  counterclockwise hull vertices of all of them as flat arrays (slice, x, y). The vertices are
+  int32, or int64 for slices of 2**15 pixels or more across, where the cross products of int32
+  coordinates could overflow.
+  """
+  slices, rows, columns = mask.shape
+  coordinateType = np.int32 if max(rows, columns) < 2**15 else np.int64
+  s, y, xLeft, xRight = rowExtents(mask)
+  # a stack without foreground has no hulls
+  if len(s) == 0:
+    return np.unique(s), s, xLeft.astype(coordinateType), y.astype(coordinateType)
+  # bottom and top row of every column, reduced along the rows without a strided argmax
+  rowIndex = np.broadcast_to(np.arange(rows, dtype=np.int32)[None, :, None], mask.shape)
+  bottom = np.min(rowIndex, axis=1, where=mask, initial=rows)
+  top = np.max(rowIndex, axis=1, where=mask, initial=-1)
+
+  # a single pixel in the top or bottom row of a slice is only visited once
+  first = np.r_[True, s[1:] != s[:-1]]
+  last = np.r_[s[1:] != s[:-1], True]
+  yMin = y[first][np.cumsum(first) - 1]
+  yMax = y[last][np.cumsum(first) - 1]
+  leftKeep = (xLeft != xRight) | ((y != yMin) & (y != yMax))
+  # go up along the right ends of the rows and back down along the left ends
+  side = np.r_[np.zeros(len(s), dtype=np.int32), np.ones(np.count_nonzero(leftKeep), dtype=np.int32)]
+  s, x, y = np.r_[s, s[leftKeep]], np.r_[xRight, xLeft[leftKeep]], np.r_[y, y[leftKeep]]
+  keep = (y == bottom[s, x]) | (y == top[s, x])
+  s, x, y, side = s[keep], x[keep], y[keep], side[keep]
+  order = np.lexsort((np.where(side == 0, y, -y), side, s))
+  s, x, y = s[order], x[order].astype(coordinateType), y[order].astype(coordinateType)
+
+  # drop the reflex points until every polygon is convex
+  while len(s) > 0:
+    previous, following = _cyclicNeighbours(s)
+    cross = (x - x[previous]) * (y[following] - y) - (y - y[previous]) * (x[following] - x)
+    reflex = cross < 0
+    if not reflex.any():
+      break
+    s, x, y = s[~reflex], x[~reflex], y[~reflex]
+  return np.unique(s), s, x, y
+
+
+def hullFeret(s, x, y):
+  """
+  Maximum and minimum Feret diameters of a list of convex polygons given as flat arrays of
+  counterclockwise vertices (polygon, x, y), sorted by polygon. Every edge is paired with the
+  vertex on the opposite caliper, found by a merge (searchsorted) of the edge directions.
+  Returns the polygon numbers, both diameters and their directions in degrees [0, 180),
+  measured counterclockwise from the x axis.
+  """
+  polygons, counts = np.unique(s, return_counts=True)
+  starts = _groupStarts(counts)
+  maxFeret = np.zeros(len(polygons))
+  minFeret = np.zeros(len(polygons))
+  maxAngle = np.zeros(len(polygons))
+  minAngle = np.zeros(len(polygons))
+  if len(s) == 0:
+    return polygons, maxFeret, minFeret, maxAngle, minAngle
+
+  group = np.repeat(np.arange(len(polygons)), counts)
+  previous, following = _cyclicNeighbours(group)
+  ex = x[following] - x
+  ey = y[following] - y
+  edgeLength = np.hypot(ex, ey)
+  # edge directions, unwrapped so that they increase along every polygon by a total of 2 pi
+  # the polygons are convex, so a negative turn is only rounding of a 0 or pi turn
+  turn = np.abs(np.arctan2(ex[previous] * ey - ey[previous] * ex, ex[previous] * ex + ey[previous] * ey))
+  turn[starts] = 0
+  direction = np.cumsum(turn)
+  direction -= np.repeat(direction[starts], counts)
+  direction += np.repeat(np.arctan2(ey[starts], ex[starts]), counts)
+
+  # go around every polygon twice so that the opposite caliper never wraps
+  doubledCounts = 2 * counts
+  doubledStarts = _groupStarts(doubledCounts)
+  doubledGroup = np.repeat(np.arange(len(polygons)), doubledCounts)
+  local = np.arange(doubledCounts.sum()) - np.repeat(doubledStarts, doubledCounts)
+  doubledVertex = np.repeat(starts, doubledCounts) + local % np.repeat(counts, doubledCounts)
+  doubledDirection = direction[doubledVertex] + 2 * np.pi * (local >= np.repeat(counts, doubledCounts))
+  offset = direction[starts] - np.arange(len(polygons)) * _HULL_ANGLE_SPAN
+  keys = doubledDirection - offset[doubledGroup]
+  opposite = np.searchsorted(keys, direction + np.pi - offset[group])
+  opposite = np.minimum(opposite, len(keys) - 1)
+  opposite = doubledVertex[opposite]
+
+  # width of every edge and distance of both of its ends to the opposite vertex
+  width = np.zeros(len(s))
+  longest = np.zeros(len(s))
+  longestAngle = np.zeros(len(s))
+  for shift in (-1, 0, 1):
+    candidate = np.repeat(starts, counts) + (opposite - np.repeat(starts, counts) + shift) % np.repeat(counts, counts)
+    cx = x[candidate] - x
+    cy = y[candidate] - y
+    distance = np.where(edgeLength > 0, (ex * cy - ey * cx) / np.where(edgeLength > 0, edgeLength, 1), 0)
+    width = np.maximum(width, distance)
+    for end in (np.arange(len(s)), following):
+      dx = x[candidate] - x[end]
+      dy = y[candidate] - y[end]
+      length = np.hypot(dx, dy)
+      better = length > longest
+      longest = np.where(better, length, longest)
+      longestAngle = np.where(better, np.arctan2(dy, dx), longestAngle)
+
+  # the narrowest caliper of each polygon is the smallest edge width
+  order = np.lexsort((width, group))
+  narrowest = order[starts]
+  minFeret = width[narrowest]
+  minAngle = np.arctan2(ex[narrowest], -ey[narrowest])
+  order = np.lexsort((-longest, group))
+  widest = order[starts]
+  maxFeret = longest[widest]
+  maxAngle = longestAngle[widest]
+  return polygons, maxFeret, minFeret, np.degrees(maxAngle) % 180, np.degrees(minAngle) % 180
+
+
+def stackFeret(labelArray, axisIndex, sampleSlices, pixelWidth=1.0, pixelHeight=1.0):
+  """
+  Maximum and minimum Feret diameters and caliper angles (degrees) of all sampled slices of
+  a labelmap array, in the same order as sampleSlices. Empty slices get zeros.
+  """
+  from .SectionMoments import sliceStack
+  sampleSlices = np.asarray(sampleSlices)
+  rows, mask = sliceStack(labelArray, axisIndex, sampleSlices)
+  hullSlices, s, x, y = stackHulls(mask)
+  polygons, maxFeret, minFeret, maxAngle, minAngle = hullFeret(s, x * pixelWidth, y * pixelHeight)
+  index = np.searchsorted(rows, sampleSlices)
+  results = {}
+  for key, values in (("MaxFeret", maxFeret), ("MinFeret", minFeret), ("MaxFeretAngle", maxAngle), ("MinFeretAngle", minAngle)):
+    stackValues = np.zeros(len(rows))
+    stackValues[polygons] = values
+    results[key] = stackValues[index]
+  return results
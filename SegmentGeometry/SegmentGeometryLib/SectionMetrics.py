@@ -0,0 +1,103 @@
+"""
+Registry of the section metrics and of the metrics each of them is derived from.
+
+The metrics without dependencies are the passes over the labelmap ("Area", "Tensors", "Hulls",
+"Perimeter", "Feret") and over the volume ("Intensity", "Weighted" and "Percentiles"). Every table column is mapped to the metrics it shows, so
+that requiredMetrics gives the smallest set of passes that fills the selected columns: a table
+of CSA only counts the foreground pixels of every slice and never builds a convex hull.
+"""
+
+__all__ = [
+  "METRICS",
+  "requiredMetrics",
+  "columnMetrics",
+]
+
+# metric -> metrics it is computed from
+METRICS = {
+  # passes over the labelmap
+  "Area": (),
+  "Tensors": (),
+  "Hulls": ("Tensors",),
+  "Perimeter": (),
+  "Feret": (),
+  "Intensity": (),
+  "Weighted": (),
+  "Percentiles": (),
+  # per-slice properties
+  "CSA": ("Area",),
+  "Cx": ("Tensors",),
+  "Cy": ("Tensors",),
+  "Theta": ("Tensors",),
+  "Imajor": ("Tensors",),
+  "Iminor": ("Tensors",),
+  "Jz": ("Tensors",),
+  "Ina": ("Tensors",),
+  "Ila": ("Tensors",),
+  "Rmajor": ("Theta", "Hulls"),
+  "Rminor": ("Theta", "Hulls"),
+  "Maxrad": ("Hulls",),
+  "Rna": ("Hulls",),
+  "Rla": ("Hulls",),
+  "Zmajor": ("Imajor", "Rmajor"),
+  "Zminor": ("Iminor", "Rminor"),
+  "Zpol": ("Jz", "Maxrad"),
+  "Zna": ("Ina", "Rna"),
+  "Zla": ("Ila", "Rla"),
+  "Circularity": ("CSA", "Perimeter"),
+  # the slenderness of the segment that the no-shear warning is based on
+  "AspectRatio": ("Feret",),
+}
+
+# table columns that show a metric under another name
+_COLUMN_NAMES = {
+  "Length (mm)": (),
+  "Max Feret Diameter (mm)": ("Feret",),
+  "Min Feret Diameter (mm)": ("Feret",),
+  "Max Feret Angle (deg)": ("Feret",),
+  "Min Feret Angle (deg)": ("Feret",),
+  "Perimeter (mm)": ("Perimeter",),
+  "Mean Brightness": ("Intensity",),
+  "Compactness": ("CSA",),
+  "Rmax (mm)": ("Maxrad",),
+}
+
+
+def columnMetrics(name):
+  """
+  Metrics shown in the table column name. The Doube columns ("... (LenNorm)") only need the
+  metric they normalize and the Summers columns ("... (MatNorm)") also need the CSA. All the
+  brightness weighted columns ("Weighted ...") and percentiles ("Brightness P...") come from
+  one pass each.
+  """
+  if name in ("Segment", "Slice Index", "Percent (%)"):
+    return ()
+  if name in _COLUMN_NAMES:
+    return _COLUMN_NAMES[name]
+  if name.startswith("Weighted "):
+    return ("Weighted",)
+  if name.startswith("Brightness P"):
+    return ("Percentiles",)
+  key, _, unit = name.partition(" (")
+  if key not in METRICS:
+    raise ValueError("Invalid column name: "+name)
+  if unit == "MatNorm)":
+    return (key, "CSA")
+  return (key,)
+
+
+def requiredMetrics(names):
+  """
+  Set of all metrics that have to be evaluated to get the given metrics or table columns,
+  including the metrics they depend on.
+  """
+  required = set()
+  pending = []
+  for name in names:
+    pending.extend([name] if name in METRICS else columnMetrics(name))
+  while pending:
+    name = pending.pop()
+    if name not in required:
+      required.add(name)
+      pending.extend(METRICS[name])
+  return required
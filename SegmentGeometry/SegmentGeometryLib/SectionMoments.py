@@ -0,0 +1,524 @@
+"""
+Vectorized section property engine used by SegmentGeometryLogic.
+
+Every value is returned in pixel units (distances in pixels, second moments in pixels^4).
+SegmentGeometryLogic scales the results to physical units when it fills the table.
+The functions accept scalars or arrays, so the same code serves a single slice or
+a whole stack of slices at once.
+"""
+
+import numpy as np
+
+__all__ = [
+  "PIXEL_MOMENT",
+  "rawMoments",
+  "centralMoments",
+  "principalAngle",
+  "axisMoments",
+  "axisDistances",
+  "momentProperties",
+  "aspectMoments",
+  "sliceProperties",
+  "sliceStack",
+  "stackRawMoments",
+  "stackSectionTensors",
+  "tensorOrientation",
+  "polarProfile",
+  "tensorProperties",
+  "stackProperties",
+  "sliceBySliceProperties",
+  "stackMeanIntensity",
+  "stackWeightedRawMoments",
+  "stackWeightedProperties",
+  "stackIntensityPercentiles",
+]
+
+# second moment of area of a unit pixel around its own centroid
+PIXEL_MOMENT = 1/12
+
+# relative size below which the product of inertia is treated as exactly zero
+PRODUCT_TOLERANCE = 1e-10
+
+
+def rawMoments(x, y):
+  """
+  Compute the raw moments (n, Sx, Sy, Sxx, Syy, Sxy) of the pixel coordinates of one slice.
+  """
+  x = np.asarray(x, dtype=np.float64)
+  y = np.asarray(y, dtype=np.float64)
+  return x.size, x.sum(), y.sum(), np.dot(x, x), np.dot(y, y), np.dot(x, y)
+
+
+def centralMoments(n, Sx, Sy, Sxx, Syy, Sxy):
+  """
+  Convert raw moments to the centroid (Cx, Cy) and the central sums
+  (Cxx, Cyy, Cxy) = (sum(dx^2), sum(dy^2), sum(dx*dy)). Empty slices give zeros.
+  """
+  n = np.asarray(n, dtype=np.float64)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    Cx = np.where(n > 0, Sx / n, 0.0)
+    Cy = np.where(n > 0, Sy / n, 0.0)
+  Cxx = np.maximum(Sxx - Sx * Cx, 0.0)
+  Cyy = np.maximum(Syy - Sy * Cy, 0.0)
+  Cxy = Sxy - Sx * Cy
+  return Cx, Cy, Cxx, Cyy, Cxy
+
+
+def principalAngle(Ix, Iy, Ixy):
+  """
+  Angle (radians) between the horizontal and the major principal axis. Zero when Ixy is zero.
+  """
+  Ix, Iy, Ixy = np.broadcast_arrays(np.asarray(Ix, dtype=np.float64), np.asarray(Iy, dtype=np.float64), np.asarray(Ixy, dtype=np.float64))
+  zero = np.abs(Ixy) <= PRODUCT_TOLERANCE * (np.abs(Ix) + np.abs(Iy))
+  with np.errstate(divide='ignore', invalid='ignore'):
+    Theta = np.arctan((Ix - Iy + np.sqrt((Ix - Iy) * (Ix - Iy) + 4 * Ixy * Ixy)) / (2 * Ixy))
+  Theta = np.where(zero, 0.0, Theta)
+  return Theta if Theta.ndim else float(Theta)
+
+
+def axisMoments(n, Cxx, Cyy, Cxy, theta):
+  """
+  Second moments of area around the axis rotated by theta (radians) from the horizontal
+  and around the axis perpendicular to it. Includes the pixel self moment of 1/12.
+  """
+  c = np.cos(theta)
+  s = np.sin(theta)
+  Iaxis = n * PIXEL_MOMENT + c * c * Cyy - 2 * s * c * Cxy + s * s * Cxx
+  Iperp = n * PIXEL_MOMENT + c * c * Cxx + 2 * s * c * Cxy + s * s * Cyy
+  return Iaxis, Iperp
+
+
+def axisDistances(dx, dy, theta):
+  """
+  Max distances of the pixels (dx, dy relative to the centroid) from the axis rotated by
+  theta (radians) and from the axis perpendicular to it.
+  """
+  if len(dx) == 0:
+    return 0.0, 0.0
+  c = np.cos(theta)
+  s = np.sin(theta)
+  Raxis = np.abs(dy * c - dx * s).max()
+  Rperp = np.abs(dx * c + dy * s).max()
+  return float(Raxis), float(Rperp)
+
+
+def _sectionModulus(I, R):
+  return np.where(R == 0, I, I / np.where(R == 0, 1, R))
+
+
+def momentProperties(n, Cxx, Cyy, Cxy, angle=None):
+  """
+  Closed-form second moments from the central sums: Ix, Iy, Ixy, Jz, the principal
+  angle Theta and Imajor/Iminor, plus Ina/Ila around the custom neutral axis if an
+  angle (degrees) is given.
+  """
+  props = {}
+  props["Ix"] = n * PIXEL_MOMENT + Cyy
+  props["Iy"] = n * PIXEL_MOMENT + Cxx
+  props["Ixy"] = Cxy
+  props["Jz"] = Cxx + Cyy
+  props["Theta"] = principalAngle(props["Ix"], props["Iy"], Cxy)
+  props["Imajor"], props["Iminor"] = axisMoments(n, Cxx, Cyy, Cxy, props["Theta"])
+  if angle is not None:
+    props["Ina"], props["Ila"] = axisMoments(n, Cxx, Cyy, Cxy, angle * np.pi/180)
+  return props
+
+
+def aspectMoments(n, Cxx, Cyy, Cxy, aspect=1.0):
+  """
+  Area and central sums of pixels that are aspect times as high as they are wide, in units of
+  the pixel width, from the pixel counts and central sums in pixel indices. The part of the
+  pixel self moment that is not the same around every axis is added to Cyy, so that the
+  results can be used with momentProperties and axisMoments as for square pixels.
+  """
+  if aspect == 1:
+    return n, Cxx, Cyy, Cxy
+  return (n * aspect, Cxx * aspect, Cyy * aspect**3 + n * (aspect**3 - aspect) * PIXEL_MOMENT,
+          Cxy * aspect**2)
+
+
+def _addSectionModuli(props, n):
+  """
+  Add the section moduli once the moments and extreme fibre distances are known.
+  """
+  props["Zmajor"] = _sectionModulus(props["Imajor"], props["Rmajor"])
+  props["Zminor"] = _sectionModulus(props["Iminor"], props["Rminor"])
+  with np.errstate(divide='ignore', invalid='ignore'):
+    props["Zpol"] = np.where(np.asarray(n) == 0, 0.0, np.float64(props["Jz"]) / props["Maxrad"])
+  if "Ina" in props:
+    props["Zna"] = _sectionModulus(props["Ina"], props["Rna"])
+    props["Zla"] = _sectionModulus(props["Ila"], props["Rla"])
+
+
+def sliceProperties(x, y, angle=None, aspect=1.0):
+  """
+  Compute all second moment based properties of one slice from the coordinates of its
+  foreground pixels in one pass. If angle (degrees) is given, the properties around the
+  custom neutral axis and loading axis are added as well. aspect is the pixel height over
+  the pixel width; the results are in units of the pixel width and the centroid in pixels.
+  """
+  x = np.asarray(x)
+  y = np.asarray(y)
+  # shift to a local integer origin to keep the raw sums small and exact
+  x0 = int(x.min())
+  y0 = int(y.min())
+  xs = x - x0
+  ys = y - y0
+  n, Sx, Sy, Sxx, Syy, Sxy = rawMoments(xs, ys)
+  Cx, Cy, Cxx, Cyy, Cxy = centralMoments(n, Sx, Sy, Sxx, Syy, Sxy)
+  Cx = float(Cx)
+  Cy = float(Cy)
+  dx = xs - Cx
+  dy = (ys - Cy) * aspect
+  n, Cxx, Cyy, Cxy = aspectMoments(n, Cxx, Cyy, Cxy, aspect)
+
+  props = momentProperties(n, Cxx, Cyy, Cxy, angle)
+  props["Cx"] = Cx + x0
+  props["Cy"] = Cy + y0
+  props["Rmajor"], props["Rminor"] = axisDistances(dx, dy, props["Theta"])
+  props["Maxrad"] = float(np.sqrt((dx * dx + dy * dy).max()))
+  if angle is not None:
+    props["Rna"], props["Rla"] = axisDistances(dx, dy, angle * np.pi/180)
+  _addSectionModuli(props, n)
+  return {key: float(value) for key, value in props.items()}
+
+
+def sliceStack(labelArray, axisIndex, sampleSlices=None):
+  """
+  Return (rows, mask): the slice indices that were selected and a boolean array of shape
+  (slices, rows, columns) holding the foreground of every selected slice perpendicular to
+  axisIndex (0=R, 1=A, 2=S) of a labelmap array in KJI order. The in-plane x coordinate
+  runs along the last axis and y along the middle axis, as in the slice by slice code.
+  A boolean labelmap is not copied unless only some of its slices are selected.
+  """
+  # put the slice axis first; this is a view, not a copy
+  stack = np.moveaxis(labelArray, 2 - axisIndex, 0)
+  if sampleSlices is None:
+    rows = np.arange(stack.shape[0])
+  else:
+    rows = np.unique(sampleSlices)
+    if len(rows) != stack.shape[0]:
+      stack = stack[rows]
+  if stack.dtype == bool:
+    return rows, stack
+  return rows, stack > 0
+
+
+def stackRawMoments(mask, x0=0, y0=0):
+  """
+  Raw moments (n, Sx, Sy, Sxx, Syy, Sxy) of every slice of a boolean stack at once.
+  The sums are taken from the row and column projections of the whole stack, so no
+  per-pixel coordinate arrays are needed. Coordinates are shifted by (x0, y0).
+  """
+  # the row sums of x fit in int32 below 2**15 columns, only the totals need float64
+  coordinateType = np.int32 if max(mask.shape[1:]) < 2**15 else np.int64
+  x = np.arange(mask.shape[2], dtype=coordinateType) - x0
+  y = np.arange(mask.shape[1], dtype=coordinateType) - y0
+  columnCounts = mask.sum(axis=1, dtype=np.int32)
+  rowCounts = mask.sum(axis=2, dtype=np.int32)
+  n = columnCounts.sum(axis=1).astype(np.float64)
+  Sx = columnCounts @ x.astype(np.float64)
+  Sxx = columnCounts @ (x * x).astype(np.float64)
+  Sy = rowCounts @ y.astype(np.float64)
+  Syy = rowCounts @ (y * y).astype(np.float64)
+  Sxy = np.einsum('src,c->sr', mask, x) @ y.astype(np.float64)
+  return n, Sx, Sy, Sxx, Syy, Sxy
+
+
+def _sliceReduce(ufunc, values, counts, starts):
+  """
+  Per-slice reduction of values for pixels grouped by slice. Empty slices give 0.
+  """
+  result = np.zeros(len(counts))
+  nonempty = counts > 0
+  if len(values) > 0:
+    result[nonempty] = ufunc.reduceat(values, starts[nonempty])
+  return result
+
+
+def _axisDistances(xf, yf, Cx, Cy, theta, counts, starts):
+  """
+  Per-slice max distances from the axis rotated by theta (radians, scalar or one per
+  slice) and from the perpendicular axis. The pixels are projected once on each axis and
+  the centroid projection is subtracted from the per-slice extremes afterwards.
+  """
+  c = np.cos(theta)
+  s = np.sin(theta)
+  pixelCos = np.repeat(c, counts) if np.ndim(theta) else c
+  pixelSin = np.repeat(s, counts) if np.ndim(theta) else s
+  distances = []
+  for projection, centre in ((yf * pixelCos - xf * pixelSin, Cy * c - Cx * s),
+                             (xf * pixelCos + yf * pixelSin, Cx * c + Cy * s)):
+    high = _sliceReduce(np.maximum, projection, counts, starts) - centre
+    low = centre - _sliceReduce(np.minimum, projection, counts, starts)
+    distances.append(np.where(counts > 0, np.maximum(high, low), 0.0))
+  return distances
+
+
+def stackSectionTensors(labelArray, axisIndex, sampleSlices, aspect=1.0, hulls=True):
+  """
+  Second moment tensors of all sampled slices of a labelmap array and the positions of the
+  convex hull vertices relative to the centroid, which is all that is needed to get the
+  properties around any axis. Returns a dictionary of per-slice arrays in the order of
+  sampleSlices (n, Cx, Cy, Cxx, Cyy, Cxy and Pixels, the number of hull vertices) and of
+  per-vertex arrays (dx, dy) grouped by slice in the same order. aspect is the pixel height
+  over the pixel width; n is the area and all sums and distances are in units of the pixel
+  width, while the centroid (Cx, Cy) is in pixels. If hulls is False, the convex hulls are
+  not built and only the per-slice moment arrays are returned.
+  """
+  sampleSlices = np.asarray(sampleSlices)
+  rows, mask = sliceStack(labelArray, axisIndex, sampleSlices)
+  # shift to the middle of the slice to keep the raw sums small
+  x0 = mask.shape[2] // 2
+  y0 = mask.shape[1] // 2
+  n, Sx, Sy, Sxx, Syy, Sxy = stackRawMoments(mask, x0, y0)
+  Cx, Cy, Cxx, Cyy, Cxy = centralMoments(n, Sx, Sy, Sxx, Syy, Sxy)
+  if hulls == False:
+    index = np.searchsorted(rows, sampleSlices)
+    area, Cxx, Cyy, Cxy = aspectMoments(n, Cxx, Cyy, Cxy, aspect)
+    return {"n": np.asarray(area, dtype=np.float64)[index], "Cx": np.where(n > 0, Cx + x0, 0.0)[index], "Cy": np.where(n > 0, Cy + y0, 0.0)[index],
+            "Cxx": Cxx[index], "Cyy": Cyy[index], "Cxy": np.asarray(Cxy, dtype=np.float64)[index]}
+
+  # extreme fibre distances are always reached on a vertex of the convex hull, so only keep those pixels
+  from .SectionFeret import stackHulls
+  _, s, x, y = stackHulls(mask)
+  counts = np.bincount(s, minlength=len(rows))
+  starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+  dx = (x.astype(np.float64) - x0) - np.repeat(Cx, counts)
+  dy = ((y.astype(np.float64) - y0) - np.repeat(Cy, counts)) * aspect
+  area, Cxx, Cyy, Cxy = aspectMoments(n, Cxx, Cyy, Cxy, aspect)
+
+  # map the searched slices back to the requested order
+  index = np.searchsorted(rows, sampleSlices)
+  if len(index) != len(rows) or np.any(index != np.arange(len(rows))):
+    sampleCounts = counts[index]
+    sampleStarts = np.concatenate(([0], np.cumsum(sampleCounts)[:-1]))
+    pixels = np.arange(sampleCounts.sum()) - np.repeat(sampleStarts - starts[index], sampleCounts)
+    dx = dx[pixels]
+    dy = dy[pixels]
+  return {"n": np.asarray(area, dtype=np.float64)[index], "Cx": np.where(n > 0, Cx + x0, 0.0)[index], "Cy": np.where(n > 0, Cy + y0, 0.0)[index],
+          "Cxx": Cxx[index], "Cyy": Cyy[index], "Cxy": np.asarray(Cxy, dtype=np.float64)[index],
+          "Pixels": counts[index], "dx": dx, "dy": dy}
+
+
+def tensorOrientation(tensors, angle):
+  """
+  Properties around the custom neutral axis at angle (degrees) and the loading axis
+  perpendicular to it (Ina, Ila, Rna, Rla, Zna, Zla), and CSA, from the result of
+  stackSectionTensors. Only the hull vertices are projected, so a new angle is cheap. Without
+  hull vertices only CSA, Ina and Ila are returned.
+  """
+  n = tensors["n"]
+  props = {"CSA": n}
+  props["Ina"], props["Ila"] = axisMoments(n, tensors["Cxx"], tensors["Cyy"], tensors["Cxy"], angle * np.pi/180)
+  if "dx" not in tensors:
+    return {key: np.asarray(value, dtype=np.float64) for key, value in props.items()}
+  counts = tensors["Pixels"]
+  starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+  props["Rna"], props["Rla"] = _axisDistances(tensors["dx"], tensors["dy"], 0.0, 0.0, angle * np.pi/180, counts, starts)
+  props["Zna"] = _sectionModulus(props["Ina"], props["Rna"])
+  props["Zla"] = _sectionModulus(props["Ila"], props["Rla"])
+  return {key: np.asarray(value, dtype=np.float64) for key, value in props.items()}
+
+
+def polarProfile(tensors, angles, maxElements=2**22):
+  """
+  Second moment of area, max distance and section modulus around the axes at all angles
+  (degrees) through the centroid of every slice of stackSectionTensors. Returns a dictionary
+  with "I", "R" and "Z", arrays of shape (number of slices, number of angles) in pixel units.
+  The hull vertices are projected on blocks of angles at a time so that no more than
+  maxElements projections are held in memory.
+  """
+  angles = np.atleast_1d(np.asarray(angles, dtype=np.float64))
+  theta = angles * np.pi/180
+  n = tensors["n"][:, None]
+  I = axisMoments(n, tensors["Cxx"][:, None], tensors["Cyy"][:, None], tensors["Cxy"][:, None], theta[None, :])[0]
+
+  counts = tensors["Pixels"]
+  starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+  nonempty = counts > 0
+  dx = tensors["dx"][None, :]
+  dy = tensors["dy"][None, :]
+  R = np.zeros((len(counts), len(angles)))
+  blockSize = max(1, maxElements // max(len(tensors["dx"]), 1))
+  for first in range(0, len(angles) if len(tensors["dx"]) else 0, blockSize):
+    block = theta[first:first+blockSize, None]
+    # one row of projections per angle, as the centroid is at 0 the distance is the largest magnitude
+    projection = np.abs(dy * np.cos(block) - dx * np.sin(block))
+    R[nonempty, first:first+blockSize] = np.maximum.reduceat(projection, starts[nonempty], axis=1).T
+  return {"I": I, "R": R, "Z": _sectionModulus(I, R)}
+
+
+def tensorProperties(tensors, angle=None):
+  """
+  All second moment based properties of the slices of stackSectionTensors, the same as
+  stackProperties returns. The extreme fibre distances and section moduli are left out if
+  the tensors have no hull vertices.
+  """
+  n = tensors["n"]
+  props = momentProperties(n, tensors["Cxx"], tensors["Cyy"], tensors["Cxy"])
+  props["CSA"] = n
+  props["Cx"] = tensors["Cx"]
+  props["Cy"] = tensors["Cy"]
+  if "dx" in tensors:
+    counts = tensors["Pixels"]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    dx = tensors["dx"]
+    dy = tensors["dy"]
+    props["Rmajor"], props["Rminor"] = _axisDistances(dx, dy, 0.0, 0.0, props["Theta"], counts, starts)
+    props["Maxrad"] = np.sqrt(_sliceReduce(np.maximum, dx * dx + dy * dy, counts, starts))
+    _addSectionModuli(props, n)
+  if angle is not None:
+    props.update(tensorOrientation(tensors, angle))
+  return {key: np.asarray(value, dtype=np.float64) for key, value in props.items()}
+
+
+def stackProperties(labelArray, axisIndex, sampleSlices, angle=None, aspect=1.0, metrics=None):
+  """
+  Compute the second moment based properties of all sampled slices of a labelmap array
+  in a handful of whole-volume kernels. Returns a dictionary of arrays that have the same
+  length and order as sampleSlices; "CSA" holds the number of foreground pixels, times
+  aspect (the pixel height over the pixel width) for pixels that are not square.
+  metrics is a set of SectionMetrics.requiredMetrics; if it is given, only the passes it
+  holds are run: "Area" alone only counts pixels and "Tensors" without "Hulls" skips the
+  extreme fibre distances.
+  """
+  if metrics is not None and "Tensors" not in metrics:
+    stack = np.moveaxis(labelArray, 2 - axisIndex, 0)
+    rows = np.unique(sampleSlices)
+    counts = np.count_nonzero(stack[rows] if len(rows) != stack.shape[0] else stack, axis=(1, 2))
+    return {"CSA": (counts * aspect).astype(np.float64)[np.searchsorted(rows, sampleSlices)]}
+  hulls = metrics is None or "Hulls" in metrics
+  return tensorProperties(stackSectionTensors(labelArray, axisIndex, sampleSlices, aspect, hulls), angle)
+
+
+def sliceBySliceProperties(labelArray, axisIndex, sampleSlices, angle=None, aspect=1.0):
+  """
+  Same result as stackProperties, computed with sliceProperties on the pixel coordinates of
+  one slice at a time. Empty slices get zeros.
+  """
+  stack = np.moveaxis(labelArray, 2 - axisIndex, 0)
+  # the keys of a one pixel slice
+  props = {key: np.zeros(len(sampleSlices)) for key in sliceProperties([0], [0], angle)}
+  props["CSA"] = np.zeros(len(sampleSlices))
+  for sampleIndex, i in enumerate(sampleSlices):
+    y, x = np.nonzero(stack[i])
+    if len(x) == 0:
+      continue
+    for key, value in sliceProperties(x, y, angle, aspect).items():
+      props[key][sampleIndex] = value
+    props["CSA"][sampleIndex] = len(x) * aspect
+  return props
+
+
+def stackMeanIntensity(voxelArray, axisIndex, sampleSlices, labelArray=None):
+  """
+  Mean of the non-zero voxels of every sampled slice of a masked volume array, in the same
+  order as sampleSlices. If labelArray is given, the voxels outside of its foreground are
+  masked out first. Slices without non-zero voxels get zeros.
+  """
+  sampleSlices = np.asarray(sampleSlices)
+  stack = np.moveaxis(voxelArray, 2 - axisIndex, 0)
+  rows = np.unique(sampleSlices)
+  if len(rows) != stack.shape[0]:
+    stack = stack[rows]
+  if labelArray is not None:
+    # reduce inside the mask instead of making a masked copy of the volume
+    labelRows, mask = sliceStack(labelArray, axisIndex, rows)
+    total = stack.sum(axis=(1, 2), dtype=np.float64, where=mask)
+    count = np.sum(stack != 0, axis=(1, 2), where=mask)
+  else:
+    total = stack.sum(axis=(1, 2), dtype=np.float64)
+    count = np.count_nonzero(stack, axis=(1, 2))
+  mean = np.where(count > 0, total / np.maximum(count, 1), 0.0)
+  return mean[np.searchsorted(rows, sampleSlices)]
+
+
+def _intensityStack(voxelArray, axisIndex, rows, labelArray=None):
+  """
+  The sampled slices rows of a volume array with the slice axis first and the mask of the
+  voxels to measure: the foreground of labelArray, or the non-zero voxels if it is None.
+  """
+  stack = np.moveaxis(voxelArray, 2 - axisIndex, 0)
+  if len(rows) != stack.shape[0]:
+    stack = stack[rows]
+  if labelArray is not None:
+    return stack, sliceStack(labelArray, axisIndex, rows)[1]
+  return stack, stack != 0
+
+
+def stackWeightedRawMoments(mask, weights, x0=0, y0=0):
+  """
+  Raw moments (W, Sx, Sy, Sxx, Syy, Sxy) of every slice of a boolean stack with every pixel
+  weighted by weights, an array of the same shape such as the voxel intensities: W is the sum
+  of the weights. The sums are taken from the row and column projections of the weights inside
+  the mask, as in stackRawMoments. Coordinates are shifted by (x0, y0).
+  """
+  x = np.arange(mask.shape[2], dtype=np.float64) - x0
+  y = np.arange(mask.shape[1], dtype=np.float64) - y0
+  # keep the type of the weights, the sums are accumulated in float64
+  weighted = np.where(mask, weights, 0)
+  columnWeights = weighted.sum(axis=1, dtype=np.float64)
+  rowWeights = weighted.sum(axis=2, dtype=np.float64)
+  W = columnWeights.sum(axis=1)
+  Sxy = np.einsum('src,c->sr', weighted, x) @ y
+  return W, columnWeights @ x, rowWeights @ y, columnWeights @ (x * x), rowWeights @ (y * y), Sxy
+
+
+def stackWeightedProperties(voxelArray, axisIndex, sampleSlices, labelArray=None, aspect=1.0):
+  """
+  Second moments of all sampled slices with every pixel weighted by its voxel intensity, for
+  example calibrated to mineral density, in the same order as sampleSlices. Only the voxels in
+  the foreground of labelArray are used, or the non-zero voxels of a masked volume if it is
+  None. Returns "Weight" (the sum of the intensities times the pixel area), the weighted
+  centroid (Cx, Cy) in pixels and Ix, Iy, Ixy, Jz, Theta, Imajor and Iminor as momentProperties,
+  in intensity times units of the pixel width. Slices with no positive weight get zeros.
+  """
+  sampleSlices = np.asarray(sampleSlices)
+  rows = np.unique(sampleSlices)
+  stack, mask = _intensityStack(voxelArray, axisIndex, rows, labelArray)
+  # shift to the middle of the slice to keep the raw sums small
+  x0 = mask.shape[2] // 2
+  y0 = mask.shape[1] // 2
+  W, Sx, Sy, Sxx, Syy, Sxy = stackWeightedRawMoments(mask, stack, x0, y0)
+  Cx, Cy, Cxx, Cyy, Cxy = centralMoments(W, Sx, Sy, Sxx, Syy, Sxy)
+  filled = W > 0
+  W, Cxx, Cyy, Cxy = aspectMoments(np.where(filled, W, 0.0), np.where(filled, Cxx, 0.0), np.where(filled, Cyy, 0.0),
+                                   np.where(filled, Cxy, 0.0), aspect)
+  props = momentProperties(W, Cxx, Cyy, Cxy)
+  props["Weight"] = W
+  props["Cx"] = np.where(filled, Cx + x0, 0.0)
+  props["Cy"] = np.where(filled, Cy + y0, 0.0)
+  index = np.searchsorted(rows, sampleSlices)
+  return {key: np.asarray(value, dtype=np.float64)[index] for key, value in props.items()}
+
+
+def stackIntensityPercentiles(voxelArray, axisIndex, sampleSlices, labelArray=None, percentiles=(5, 25, 50, 75, 95)):
+  """
+  Percentiles (0 to 100, interpolated linearly as np.percentile does) of the voxel intensities
+  of every sampled slice inside the foreground of labelArray, or of the non-zero voxels of a
+  masked volume if it is None. Returns an array of shape (len(sampleSlices), len(percentiles));
+  empty slices get zeros. The voxels of all slices are gathered with one boolean index, grouped
+  by slice, and the voxels of each slice are sorted once in place for all percentiles.
+  """
+  sampleSlices = np.asarray(sampleSlices)
+  percentiles = np.atleast_1d(np.asarray(percentiles, dtype=np.float64))
+  if np.any((percentiles < 0) | (percentiles > 100)):
+    raise ValueError("Invalid percentiles: {}".format(percentiles.tolist()))
+  rows = np.unique(sampleSlices)
+  stack, mask = _intensityStack(voxelArray, axisIndex, rows, labelArray)
+  values = stack[mask]
+  counts = np.count_nonzero(mask, axis=(1, 2))
+  starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+  for start, count in zip(starts, counts):
+    values[start:start+count].sort()
+
+  result = np.zeros((len(rows), len(percentiles)))
+  nonempty = counts > 0
+  position = (counts[nonempty, None] - 1) * percentiles / 100
+  low = np.floor(position).astype(np.int64)
+  high = np.minimum(low + 1, counts[nonempty, None] - 1)
+  offset = starts[nonempty, None]
+  lowValues = values[offset + low].astype(np.float64)
+  result[nonempty] = lowValues + (position - low) * (values[offset + high].astype(np.float64) - lowValues)
+  return result[np.searchsorted(rows, sampleSlices)]
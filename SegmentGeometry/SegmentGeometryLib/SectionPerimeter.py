@@ -0,0 +1,125 @@
+"""
+Perimeter estimators used by SegmentGeometryLogic.
+
+contourPerimeters measures the marching squares contour of every slice of a stack at once.
+It counts every island and the outline of every hole. tracerPerimeter is the original
+boundary tracer, kept so results can be reproduced with the legacy method.
+"""
+
+import numpy as np
+
+__all__ = [
+  "PERIMETER_METHODS",
+  "tracerPerimeter",
+  "contourSegmentLengths",
+  "contourPerimeters",
+  "stackPerimeter",
+  "tracerStackPerimeter",
+]
+
+PERIMETER_METHODS = ("contour", "tracer")
+
+# number of slices measured at once by contourPerimeters, bounds the temporary memory
+CONTOUR_CHUNK_SLICES = 64
+
+# candidate moves of the boundary tracer, tried in order, depending on the previous direction
+_W, _NW, _N, _NE, _E, _SE, _S, _SW = (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1)
+_TRACER_MOVES = {
+  "N": (_W, _NW, _N, _NE, _E, _SE, _S, _SW),
+  "NE": (_NW, _N, _NE, _E, _SE, _S, _SW, _W),
+  "E": (_NW, _N, _NE, _E, _SE, _S, _SW, _W),
+  "SE": (_NE, _E, _SE, _S, _SW, _W, _NW, _N),
+  "S": (_NE, _E, _SE, _S, _SW, _W, _NW, _N),
+  "SW": (_SE, _S, _SW, _W, _NW, _N, _NE, _E),
+  "W": (_SW, _W, _NW, _N, _NE, _E, _SE, _S),
+  "NW": (_SW, _W, _NW, _N, _NE, _E, _SE, _S),
+}
+_DIRECTION_NAMES = {_W: "W", _NW: "NW", _N: "N", _NE: "NE", _E: "E", _SE: "SE", _S: "S", _SW: "SW"}
+
+
+def tracerPerimeter(x, y, pixelWidth=1.0, pixelHeight=1.0):
+  """
+  Legacy perimeter of one slice: walks the outer boundary pixel by pixel starting from
+  the top of the leftmost column and sums the distances between the visited pixel centres,
+  with x along the columns (pixelWidth) and y along the rows (pixelHeight). Only follows
+  one island and ignores holes.
+  """
+  pixels = set(zip(np.asarray(x).tolist(), np.asarray(y).tolist()))
+  startx = int(np.min(x))
+  starty = max(py for px, py in pixels if px == startx)
+  path = [(startx, starty)]
+  prevx, prevy = startx, starty
+  dire = "N"
+  while True:
+    for dx, dy in _TRACER_MOVES[dire]:
+      if (prevx + dx, prevy + dy) in pixels:
+        dire = _DIRECTION_NAMES[(dx, dy)]
+        prevx, prevy = prevx + dx, prevy + dy
+        path.append((prevx, prevy))
+        break
+    if prevx == startx and prevy == starty:
+      break
+
+  if len(path) == 1:
+    return 2 * (pixelWidth + pixelHeight)
+  path = np.asarray(path, dtype=np.float64) * (pixelWidth, pixelHeight)
+  steps = np.diff(path, axis=0)
+  perimeter = np.sqrt((steps**2).sum(axis=1)).sum()
+  perimeter = perimeter + np.sqrt(((path[0] - path[-1])**2).sum())
+  return perimeter
+
+
+def contourSegmentLengths(pixelWidth=1.0, pixelHeight=1.0):
+  """
+  Length of the marching squares contour inside a 2x2 cell for each of the 16 corner
+  configurations. Corners are numbered 1=top left, 2=top right, 4=bottom right, 8=bottom left.
+  """
+  diagonal = 0.5 * np.sqrt(pixelWidth**2 + pixelHeight**2)
+  diagonals = np.array([0, 1, 1, 0, 1, 2, 0, 1, 1, 0, 2, 1, 0, 1, 1, 0])
+  lengths = diagonals * diagonal
+  # two neighbouring corners set: the contour crosses the cell straight
+  lengths[[3, 12]] = pixelWidth
+  lengths[[6, 9]] = pixelHeight
+  return lengths
+
+
+def contourPerimeters(mask, pixelWidth=1.0, pixelHeight=1.0):
+  """
+  Marching squares perimeter of every slice of a boolean stack (slices, rows, columns).
+  x runs along the columns (pixelWidth) and y along the rows (pixelHeight).
+  """
+  lengths = contourSegmentLengths(pixelWidth, pixelHeight).astype(np.float32)
+  perimeters = np.zeros(mask.shape[0])
+  for first in range(0, mask.shape[0], CONTOUR_CHUNK_SLICES):
+    chunk = mask[first:first + CONTOUR_CHUNK_SLICES]
+    padded = np.zeros((chunk.shape[0], chunk.shape[1] + 2, chunk.shape[2] + 2), dtype=np.uint8)
+    padded[:, 1:-1, 1:-1] = chunk
+    cases = padded[:, :-1, :-1] + 2 * padded[:, :-1, 1:] + 4 * padded[:, 1:, 1:] + 8 * padded[:, 1:, :-1]
+    perimeters[first:first + chunk.shape[0]] = lengths[cases].sum(axis=(1, 2), dtype=np.float64)
+  return perimeters
+
+
+def stackPerimeter(labelArray, axisIndex, sampleSlices, pixelWidth=1.0, pixelHeight=1.0):
+  """
+  Marching squares perimeter of all sampled slices of a labelmap array, in the same
+  order as sampleSlices.
+  """
+  from .SectionMoments import sliceStack
+  sampleSlices = np.asarray(sampleSlices)
+  rows, mask = sliceStack(labelArray, axisIndex, sampleSlices)
+  perimeters = contourPerimeters(mask, pixelWidth, pixelHeight)
+  return perimeters[np.searchsorted(rows, sampleSlices)]
+
+
+def tracerStackPerimeter(labelArray, axisIndex, sampleSlices, pixelWidth=1.0, pixelHeight=1.0):
+  """
+  Legacy boundary tracer perimeter of all sampled slices of a labelmap array, traced one
+  slice at a time, in the same order as sampleSlices. Empty slices get zeros.
+  """
+  stack = np.moveaxis(labelArray, 2 - axisIndex, 0)
+  perimeters = np.zeros(len(sampleSlices))
+  for sampleIndex, i in enumerate(sampleSlices):
+    y, x = np.nonzero(stack[i])
+    if len(x) > 0:
+      perimeters[sampleIndex] = tracerPerimeter(x, y, pixelWidth, pixelHeight)
+  return perimeters
@@ -0,0 +1,308 @@
+"""
+Table columns of the section properties.
+
+The whole-stack kernels return one array per property in units of the pixel width, taking the
+pixel aspect ratio into account. sectionColumns scales them to physical units as whole arrays,
+so that the results table can be filled one column at a time. The length (Doube) and material
+(Summers) normalized columns are functions of the columns in mm, so a SectionColumns only
+computes them, in one vectorized step each, when they are looked up, for example while they are
+added to the table, and does not store them unless they are materialized.
+"""
+
+import re
+
+import numpy as np
+
+__all__ = [
+  "COLUMN_INFO",
+  "SectionColumns",
+  "normalizedColumn",
+  "sectionColumns",
+  "orientationColumns",
+  "weightedColumns",
+  "percentileName",
+  "percentileColumns",
+  "polarColumns",
+  "columnInfo",
+]
+
+# unit label and description of every table column, in table order
+COLUMN_INFO = {
+  "Segment": (None, "Segment name"),
+  "Slice Index": (None, "Corresponding slice index on the resampled volume"),
+  "Percent (%)": ("%", "Percent of the segment length"),
+  "Length (mm)": ("mm", "Segment Length"),
+  "Max Feret Diameter (mm)": ("mm", "Maximum feret diameter"),
+  "Min Feret Diameter (mm)": ("mm", "Minimum feret diameter"),
+  "Max Feret Angle (deg)": ("degrees", "Angle between the maximum feret diameter and the horizontal (right side), in a clockwise direction"),
+  "Min Feret Angle (deg)": ("degrees", "Angle between the minimum feret diameter and the horizontal (right side), in a clockwise direction"),
+  "Perimeter (mm)": ("mm", "Perimeter of the section"),
+  "Circularity": ("none", "Circularity calculated as 4*pi*CSA/Perimeter^2"),
+  "Mean Brightness": (None, "Mean pixel brightness"),
+  "Weighted CSA": (None, "Cross-sectional area weighted by the pixel brightness, in brightness*mm^2"),
+  "Weighted Cx": ("none", "x-coordinate of the brightness weighted centroid in IJK format on the resampled volume"),
+  "Weighted Cy": ("none", "y-coordinate of the brightness weighted centroid in IJK format on the resampled volume"),
+  "Weighted Theta (deg)": ("degrees", "Angle between the brightness weighted minor principal axis and the horizontal (right side), in a clockwise direction"),
+  "Weighted Ix": (None, "Brightness weighted second moment of area around the horizontal axis through the weighted centroid, in brightness*mm^4"),
+  "Weighted Iy": (None, "Brightness weighted second moment of area around the vertical axis through the weighted centroid, in brightness*mm^4"),
+  "Weighted Ixy": (None, "Brightness weighted product of inertia around the weighted centroid, in brightness*mm^4"),
+  "Weighted Jz": (None, "Brightness weighted polar moment of inertia, in brightness*mm^4"),
+  "Weighted Iminor": (None, "Brightness weighted second moment of area around the minor principal axis (larger I), in brightness*mm^4"),
+  "Weighted Imajor": (None, "Brightness weighted second moment of area around the major principal axis (smaller I), in brightness*mm^4"),
+  "CSA (mm^2)": ("mm^2", "Cross-sectional area"),
+  "Compactness": (None, "Compactness calculated as CSA/TCSA"),
+  "Cx": ("none", "x-coordinate of the centroid in IJK format on the resampled volume"),
+  "Cy": ("none", "y-coordinate of the centroid in IJK format on the resampled volume"),
+  "Theta (deg)": ("degrees", "Angle between the minor principal axis and the horizontal (right side), in a clockwise direction"),
+  "Iminor (mm^4)": ("mm^4", "Second moment of area around the minor principal axis (larger I)"),
+  "Imajor (mm^4)": ("mm^4", "Second moment of area around the major principal axis (smaller I)"),
+  "Zminor (mm^3)": ("mm^3", "Section modulus around the minor principal axis (larger Z)"),
+  "Zmajor (mm^3)": ("mm^3", "Section modulus around the major principal axis (smaller Z)"),
+  "Rminor (mm)": ("mm", "Max distance from the minor principal axis"),
+  "Rmajor (mm)": ("mm", "Max distance from the major principal axis"),
+  "Jz (mm^4)": ("mm^4", "Polar moment of inertia"),
+  "Zpol (mm^3)": ("mm^3", "Polar section modulus"),
+  "Rmax (mm)": ("mm", "Max radius from the centroid"),
+  "Ina (mm^4)": ("mm^4", "Second moment of area around the neutral axis"),
+  "Ila (mm^4)": ("mm^4", "Second moment of area around the loading axis"),
+  "Zna (mm^3)": ("mm^3", "Section modulus around the neutral axis"),
+  "Zla (mm^3)": ("mm^3", "Section modulus around the loading axis"),
+  "Rna (mm)": ("mm", "Max distance from the neutral axis"),
+  "Rla (mm)": ("mm", "Max distance from the loading axis"),
+  "CSA (LenNorm)": ("none", "CSA^(1/2)/Length"),
+  "Iminor (LenNorm)": ("none", "Iminor^(1/4)/Length"),
+  "Imajor (LenNorm)": ("none", "Imajor^(1/4)/Length"),
+  "Zminor (LenNorm)": ("none", "Zminor^(1/3)/Length"),
+  "Zmajor (LenNorm)": ("none", "Zmajor^(1/3)/Length"),
+  "Ina (LenNorm)": ("none", "Ina^(1/4)/Length"),
+  "Ila (LenNorm)": ("none", "Ila^(1/4)/Length"),
+  "Zla (LenNorm)": ("none", "Zla^(1/3)/Length"),
+  "Zna (LenNorm)": ("none", "Zna^(1/3)/Length"),
+  "Jz (LenNorm)": ("none", "Jz^(1/4)/Length"),
+  "Zpol (LenNorm)": ("none", "Zpol^(1/3)/Length"),
+  "Iminor (MatNorm)": ("none", "Iminor divided by the second moment of area of a solid circle with the same cross-sectional area"),
+  "Imajor (MatNorm)": ("none", "Imajor divided by the second moment of area of a solid circle with the same cross-sectional area"),
+  "Zminor (MatNorm)": ("none", "Zminor divided by the section modulus of a solid circle with the same cross-sectional area"),
+  "Zmajor (MatNorm)": ("none", "Zmajor divided by the section modulus of a solid circle with the same cross-sectional area"),
+  "Jz (MatNorm)": ("none", "Jz divided by the polar moment of inertia of a solid circle with the same cross-sectional area"),
+  "Zpol (MatNorm)": ("none", "Zpol divided by the polar section modulus of a solid circle with the same cross-sectional area"),
+  "Ina (MatNorm)": ("none", "Ina divided by the second moment of area of a solid circle with the same cross-sectional area"),
+  "Ila (MatNorm)": ("none", "Ila divided by the second moment of area of a solid circle with the same cross-sectional area"),
+  "Zna (MatNorm)": ("none", "Zna divided by the section modulus of a solid circle with the same cross-sectional area"),
+  "Zla (MatNorm)": ("none", "Zla divided by the section modulus of a solid circle with the same cross-sectional area"),
+}
+
+# columns of the polar profile, one per angle
+_POLAR_INFO = {
+  "I": ("mm^4", "Second moment of area around the axis at {} degrees from the horizontal (right side), in a clockwise direction"),
+  "R": ("mm", "Max distance from the axis at {} degrees from the horizontal (right side), in a clockwise direction"),
+  "Z": ("mm^3", "Section modulus around the axis at {} degrees from the horizontal (right side), in a clockwise direction"),
+}
+_POLAR_NAME = re.compile(r"^([IRZ])\((.+)\) \(")
+
+# columns of the brightness percentiles, one per percentile
+_PERCENTILE_INFO = (None, "Pixel brightness below which {}% of the pixels of the section are")
+_PERCENTILE_NAME = re.compile(r"^Brightness P(.+)$")
+
+# properties that are scaled like a second moment, a section modulus and a distance
+_MOMENTS = ("Jz", "Imajor", "Iminor", "Ina", "Ila")
+_MODULI = ("Zmajor", "Zminor", "Zpol", "Zna", "Zla")
+_DISTANCES = (("Rmajor", "Rmajor"), ("Rminor", "Rminor"), ("Rmax", "Maxrad"), ("Rna", "Rna"), ("Rla", "Rla"))
+
+# normalized column -> (base column, normalization, power, factor): the Doube column is the
+# power-th root of the base column over the length and the Summers column the base column over
+# factor times the property of a solid circle with the same area, pi*r^power/4
+_NORMALIZED = {"CSA (LenNorm)": ("CSA (mm^2)", "LenNorm", 2, None)}
+for _key in _MOMENTS:
+  _NORMALIZED[_key + " (LenNorm)"] = (_key + " (mm^4)", "LenNorm", 4, None)
+for _key in _MODULI:
+  _NORMALIZED[_key + " (LenNorm)"] = (_key + " (mm^3)", "LenNorm", 3, None)
+for _key in _MOMENTS:
+  _NORMALIZED[_key + " (MatNorm)"] = (_key + " (mm^4)", "MatNorm", 4, 2 if _key == "Jz" else 1)
+for _key in _MODULI:
+  _NORMALIZED[_key + " (MatNorm)"] = (_key + " (mm^3)", "MatNorm", 3, 1/4 if _key == "Zpol" else 1)
+
+
+def normalizedColumn(columns, name):
+  """
+  Doube (LenNorm) or Summers (MatNorm) normalized column name from the columns in mm of the
+  same slices, which must hold its base column, "Length (mm)" and "CSA (mm^2)". Empty slices
+  get zeros.
+  """
+  if name not in _NORMALIZED:
+    raise ValueError("Invalid normalized column name: "+name)
+  base, normalization, power, factor = _NORMALIZED[name]
+  values = columns[base]
+  if normalization == "LenNorm":
+    return values**(1/power) / columns["Length (mm)"]
+  CSA = columns["CSA (mm^2)"]
+  circle = np.where(CSA > 0, factor * np.pi * np.sqrt(CSA/np.pi)**power / 4, 1)
+  return values / circle
+
+
+class SectionColumns(dict):
+  """
+  Table columns (name -> array) in which the Doube and Summers normalized columns of the base
+  columns it holds can be looked up without being stored: they are computed by normalizedColumn
+  on every lookup. Only the stored columns are listed by keys and in; derivedNames lists the
+  normalized columns that can be looked up.
+  """
+
+  def __missing__(self, name):
+    if name in _NORMALIZED and _NORMALIZED[name][0] in self:
+      return normalizedColumn(self, name)
+    raise KeyError(name)
+
+  def derivedNames(self, doube=True, summers=True, baseNames=None):
+    """
+    Names of the normalized columns that can be derived from the stored columns, in table order,
+    only of the base columns in baseNames if it is given.
+    """
+    normalizations = [normalization for normalization, selected in (("LenNorm", doube), ("MatNorm", summers)) if selected == True]
+    return [name for name in COLUMN_INFO if name in _NORMALIZED and _NORMALIZED[name][1] in normalizations
+            and _NORMALIZED[name][0] in self and name not in self
+            and (baseNames is None or _NORMALIZED[name][0] in baseNames)]
+
+  def materialize(self, names):
+    """
+    Compute and store the normalized columns names, for example to save them as files.
+    """
+    for name in names:
+      self[name] = self[name]
+    return self
+
+
+def sectionColumns(props, numSlices, pixelWidth, pixelDepth, perimeter=None, ferets=None,
+                   feretAngles=False, doube=False, summers=False):
+  """
+  Table columns (name -> array) of the sampled slices of one segment from the results of
+  stackProperties, and of stackPerimeter and stackFeret if they are given, in units of the
+  pixel width. numSlices is the length of the segment in slices and pixelWidth and pixelDepth
+  are the width and depth of the voxels in mm. Only the columns of the properties that props
+  holds are added, which includes the custom neutral axis columns. The columns are a
+  SectionColumns, from which the Doube and Summers normalized columns can be looked up; they are
+  also stored if doube and summers are True. Empty slices get zeros in every column.
+  """
+  areaOfPixelMm2 = pixelWidth**2
+  unitOfPixelMm4 = pixelWidth**4
+  CSA = props["CSA"]
+  filled = CSA > 0
+
+  columns = SectionColumns()
+  columns["Length (mm)"] = np.full(len(CSA), numSlices * pixelDepth)
+  columns["CSA (mm^2)"] = CSA * areaOfPixelMm2
+  if "Cx" in props:
+    columns["Cx"] = props["Cx"]
+    columns["Cy"] = props["Cy"]
+  if "Theta" in props:
+    columns["Theta (deg)"] = np.where(filled, (props["Theta"] + np.pi/2)*180/np.pi, 0)
+  for key in _MOMENTS:
+    if key in props:
+      columns[key + " (mm^4)"] = props[key] * unitOfPixelMm4
+  for key in _MODULI:
+    if key in props:
+      columns[key + " (mm^3)"] = props[key] * unitOfPixelMm4 / pixelWidth
+  for name, key in _DISTANCES:
+    if key in props:
+      columns[name + " (mm)"] = props[key] * pixelWidth
+
+  if ferets is not None:
+    columns["Max Feret Diameter (mm)"] = ferets["MaxFeret"] * pixelWidth
+    columns["Min Feret Diameter (mm)"] = ferets["MinFeret"] * pixelWidth
+    if feretAngles == True:
+      columns["Max Feret Angle (deg)"] = ferets["MaxFeretAngle"]
+      columns["Min Feret Angle (deg)"] = ferets["MinFeretAngle"]
+
+  if perimeter is not None:
+    columns["Perimeter (mm)"] = perimeter * pixelWidth
+    columns["Circularity"] = np.where(filled, 4*np.pi*CSA*areaOfPixelMm2 / np.where(filled, perimeter*pixelWidth, 1)**2, 0)
+
+  columns.materialize(columns.derivedNames(doube, summers))
+  return columns
+
+
+def orientationColumns(props, numSlices, pixelWidth, pixelDepth, doube=False, summers=False):
+  """
+  Only the custom neutral axis columns of sectionColumns, from the result of
+  SectionMoments.tensorOrientation. Used to update the table when the angle changes.
+  """
+  unitOfPixelMm4 = pixelWidth**4
+
+  # the distances and moduli are missing if the tensors were computed without hulls
+  columns = SectionColumns()
+  columns["Length (mm)"] = np.full(len(props["CSA"]), numSlices * pixelDepth)
+  columns["CSA (mm^2)"] = props["CSA"] * pixelWidth**2
+  for key in ("Ina", "Ila"):
+    if key in props:
+      columns[key + " (mm^4)"] = props[key] * unitOfPixelMm4
+  for key in ("Zna", "Zla"):
+    if key in props:
+      columns[key + " (mm^3)"] = props[key] * unitOfPixelMm4 / pixelWidth
+  for key in ("Rna", "Rla"):
+    if key in props:
+      columns[key + " (mm)"] = props[key] * pixelWidth
+  # the length and area are only kept to normalize the neutral axis columns
+  columns.materialize([name for name in columns.derivedNames(doube, summers) if name != "CSA (LenNorm)"])
+  del columns["Length (mm)"], columns["CSA (mm^2)"]
+  return columns
+
+
+def weightedColumns(props, pixelWidth):
+  """
+  Table columns of the brightness weighted properties of SectionMoments.stackWeightedProperties,
+  with the area and moments scaled to mm (times the brightness) and the centroid in pixels.
+  """
+  unitOfPixelMm4 = pixelWidth**4
+  columns = {}
+  columns["Weighted CSA"] = props["Weight"] * pixelWidth**2
+  columns["Weighted Cx"] = props["Cx"]
+  columns["Weighted Cy"] = props["Cy"]
+  columns["Weighted Theta (deg)"] = np.where(props["Weight"] > 0, (props["Theta"] + np.pi/2)*180/np.pi, 0)
+  for key in ("Ix", "Iy", "Ixy", "Jz", "Iminor", "Imajor"):
+    columns["Weighted " + key] = props[key] * unitOfPixelMm4
+  return columns
+
+
+def percentileName(percentile):
+  """
+  Name of the table column of a brightness percentile, like "Brightness P50".
+  """
+  return "Brightness P{:g}".format(percentile)
+
+
+def percentileColumns(values, percentiles):
+  """
+  Table columns of the brightness percentiles of SectionMoments.stackIntensityPercentiles, one
+  column per percentile (see percentileName).
+  """
+  return {percentileName(percentile): values[:, index] for index, percentile in enumerate(percentiles)}
+
+
+def polarColumns(profile, keys=("I", "Z")):
+  """
+  Table columns of a polar profile in mm (see SegmentGeometryLogic.computePolarProfile): one
+  column per angle for each of keys, named like "I(30) (mm^4)", so that the table is a slice
+  by angle matrix.
+  """
+  columns = {}
+  for key in keys:
+    unit = _POLAR_INFO[key][0]
+    for angleIndex, angle in enumerate(profile["Angles"]):
+      columns["{}({:g}) ({})".format(key, angle, unit)] = profile[key][:, angleIndex]
+  return columns
+
+
+def columnInfo(name):
+  """
+  Unit label and description of a table column, (None, None) if it is unknown.
+  """
+  if name in COLUMN_INFO:
+    return COLUMN_INFO[name]
+  match = _POLAR_NAME.match(name)
+  if match:
+    unit, description = _POLAR_INFO[match.group(1)]
+    return unit, description.format(match.group(2))
+  match = _PERCENTILE_NAME.match(name)
+  if match:
+    return _PERCENTILE_INFO[0], _PERCENTILE_INFO[1].format(match.group(1))
+  return None, None
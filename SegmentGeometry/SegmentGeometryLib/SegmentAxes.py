@@ -0,0 +1,143 @@
+"""
+Centroid and principal axes of a whole segment, and centroid of its intersection with a slice
+plane, from the voxels of its labelmap.
+
+The principal axes are the eigenvectors of the second central moments (covariance) of the
+voxel centers, which are also the principal axes of the inertia tensor of the segment as a
+solid of uniform density. The moments are summed a block of slices at a time from the row and
+column projections of SectionMoments.stackRawMoments, so no voxel coordinate arrays are made,
+and large segments can be measured on every n-th voxel along each axis only. The plane is
+sampled on a grid of the voxel size with nearest neighbour lookups, like the reslicing of a
+slice view, so only the voxels that the plane crosses are read.
+"""
+
+import numpy as np
+
+__all__ = [
+  "DEFAULT_MAX_VOXELS",
+  "voxelMoments",
+  "principalAxes",
+  "alignmentMatrix",
+  "planeCentroid",
+]
+
+# voxels of the bounding box above which the principal axes are found on a regular subset,
+# which changes the axes of a segment of a few voxels across by a fraction of a degree only
+DEFAULT_MAX_VOXELS = 2**24
+
+
+def voxelMoments(labelArray, labelValue=None, step=1, chunkSlices=64):
+  """
+  Number of voxels, centroid and covariance matrix (3x3) of the voxel indices of the
+  foreground of a labelmap array in KJI order, all in IJK order. The foreground is the
+  non-zero voxels, or the voxels equal to labelValue if it is given. With step > 1 only
+  every step-th voxel along each axis is used, and the number of voxels is the number of
+  voxels that were used.
+  """
+  from .SectionMoments import stackRawMoments
+
+  sampled = labelArray[::step, ::step, ::step]
+  sums = np.zeros(10)
+  for first in range(0, sampled.shape[0], chunkSlices):
+    block = sampled[first:first+chunkSlices]
+    mask = block != 0 if labelValue is None else block == labelValue
+    n, Si, Sj, Sii, Sjj, Sij = stackRawMoments(mask)
+    k = np.arange(first, first + len(n), dtype=np.float64)
+    sums += [n.sum(), Si.sum(), Sj.sum(), k @ n, Sii.sum(), Sjj.sum(), (k * k) @ n, Sij.sum(), k @ Si, k @ Sj]
+  count, Si, Sj, Sk, Sii, Sjj, Skk, Sij, Sik, Sjk = sums
+  if count == 0:
+    return 0, None, None
+  mean = np.array([Si, Sj, Sk]) / count
+  second = np.array([[Sii, Sij, Sik], [Sij, Sjj, Sjk], [Sik, Sjk, Skk]]) / count
+  covariance = second - np.outer(mean, mean)
+  return int(count), mean * step, covariance * step**2
+
+
+def principalAxes(labelArray, ijkToRas, labelValue=None, maxVoxels=None):
+  """
+  Centroid and principal axes in RAS of the foreground of a labelmap array in KJI order (see
+  voxelMoments), where ijkToRas is the 4x4 matrix from the indices of the array to RAS. If
+  the bounding box of the segment holds more than maxVoxels voxels, a regular subset of about
+  maxVoxels of them is used. Returns a dictionary with "centroid", "axes" (3x3, the axes as
+  columns from the smallest to the largest spread, so the long axis is last, as a right-handed
+  frame), "variances" (the spread of the voxels along each axis, mm^2), "moments" (the
+  principal moments of inertia per unit mass, mm^2), "voxels" and "step", or None if the
+  segment is empty.
+  """
+  from .SegmentBatch import foregroundBox, labelBox
+
+  box = foregroundBox(labelArray) if labelValue is None else labelBox(labelArray, labelValue)
+  if box is None:
+    return None
+  crop = labelArray[box]
+  step = 1
+  if maxVoxels is not None and crop.size > maxVoxels:
+    step = int(np.ceil((crop.size / maxVoxels)**(1/3)))
+  count, mean, covariance = voxelMoments(crop, labelValue, step)
+  if count == 0:
+    return None
+  ijkToRas = np.asarray(ijkToRas, dtype=np.float64)
+  mean = mean + [box[2].start, box[1].start, box[0].start]
+  rotation = ijkToRas[:3, :3]
+  centroid = rotation @ mean + ijkToRas[:3, 3]
+  covariance = rotation @ covariance @ rotation.T
+  variances, axes = np.linalg.eigh(covariance)
+  # the signs of the eigenvectors are arbitrary: point the middle and long axes along A and S
+  for index in (1, 2):
+    if axes[index, index] < 0:
+      axes[:, index] = -axes[:, index]
+  axes[:, 0] = np.cross(axes[:, 1], axes[:, 2])
+  moments = variances.sum() - variances
+  return {"centroid": centroid, "axes": axes, "variances": variances, "moments": moments,
+          "voxels": count, "step": step}
+
+
+def alignmentMatrix(centroid, axes):
+  """
+  4x4 matrix of the rigid transform (to parent) that rotates the principal axes (columns of
+  axes) onto R, A and S around the centroid, so the long axis of the segment runs along S and
+  the segment stays in place.
+  """
+  rotation = np.asarray(axes, dtype=np.float64).T
+  centroid = np.asarray(centroid, dtype=np.float64)
+  matrix = np.eye(4)
+  matrix[:3, :3] = rotation
+  matrix[:3, 3] = centroid - rotation @ centroid
+  return matrix
+
+
+def planeCentroid(labelArray, ijkToRas, planeToRas, labelValue=None):
+  """
+  Centroid in RAS of the intersection of the foreground of a labelmap array in KJI order (see
+  voxelMoments) with a plane, or None if the plane misses it. ijkToRas is the 4x4 matrix from
+  the indices of the array to RAS and planeToRas the 4x4 matrix of the plane, such as the
+  SliceToRAS matrix of a slice node: its first two columns are the in-plane axes and its last
+  column a point of the plane. The plane is sampled with the smallest voxel spacing over the
+  whole labelmap.
+  """
+  ijkToRas = np.asarray(ijkToRas, dtype=np.float64)
+  planeToRas = np.asarray(planeToRas, dtype=np.float64)
+  origin = planeToRas[:3, 3]
+  u = planeToRas[:3, 0] / np.linalg.norm(planeToRas[:3, 0])
+  v = planeToRas[:3, 1] / np.linalg.norm(planeToRas[:3, 1])
+  spacing = np.linalg.norm(ijkToRas[:3, :3], axis=0).min()
+
+  # the in-plane extent of the labelmap, from its corners projected on the plane
+  sizes = labelArray.shape[::-1]
+  corners = np.array(np.meshgrid(*[(-0.5, size - 0.5) for size in sizes], indexing="ij")).reshape(3, -1)
+  corners = ijkToRas[:3, :3] @ corners + ijkToRas[:3, 3:] - origin[:, None]
+  us = np.arange((u @ corners).min(), (u @ corners).max() + spacing, spacing)
+  vs = np.arange((v @ corners).min(), (v @ corners).max() + spacing, spacing)
+
+  # nearest voxel of every grid point, the grid being a linear function of (u, v)
+  rasToIjk = np.linalg.inv(ijkToRas)
+  base = rasToIjk[:3, :3] @ origin + rasToIjk[:3, 3]
+  ijk = np.rint(base + us[:, None, None] * (rasToIjk[:3, :3] @ u) + vs[None, :, None] * (rasToIjk[:3, :3] @ v))
+  inside = np.all((ijk >= 0) & (ijk < sizes), axis=2)
+  uIndex, vIndex = np.nonzero(inside)
+  i, j, k = ijk[uIndex, vIndex].astype(np.intp).T
+  values = labelArray[k, j, i]
+  hit = values != 0 if labelValue is None else values == labelValue
+  if not hit.any():
+    return None
+  return origin + us[uIndex[hit]].mean() * u + vs[vIndex[hit]].mean() * v
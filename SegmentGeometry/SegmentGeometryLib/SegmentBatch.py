@@ -0,0 +1,165 @@
+"""
+Section properties of many segments from one multi-label labelmap array.
+
+All segments are exported once to a labelmap where segment number n has label value n+1.
+The bounding box of every label is found in one pass over the array, and each segment is
+then measured on its own crop of the shared array with the whole-stack kernels.
+"""
+
+import numpy as np
+
+__all__ = [
+  "sampleSliceIndices",
+  "labelBoundingBoxes",
+  "foregroundBox",
+  "labelBox",
+  "gridOffset",
+  "cropBlock",
+  "segmentColumns",
+  "batchColumns",
+]
+
+
+def sampleSliceIndices(numSlices, interval):
+  """
+  Slices to measure for a segment that is numSlices long: every slice if interval is 0 or
+  the segment is shorter than 100 slices, else one slice every interval percent of the
+  length. Returns (sampleSlices, percentLength).
+  """
+  if interval > 0 and numSlices >= 100:
+    resample = np.arange(interval, stop = 101, step = interval)
+    sampleSlices = np.rint(numSlices * (resample / 100) - 1).astype(int)
+  else:
+    sampleSlices = np.arange(numSlices)
+  percentLength = np.around((sampleSlices+1) / numSlices * 100,1)
+  return sampleSlices, percentLength
+
+
+def labelBoundingBoxes(labelArray, labels):
+  """
+  Bounding box (tuple of slices) of every label value of a labelmap array, or None for
+  labels that are not present.
+  """
+  from scipy import ndimage
+  boxes = ndimage.find_objects(labelArray, max_label=int(max(labels)))
+  return [boxes[label-1] for label in labels]
+
+
+def foregroundBox(labelArray):
+  """
+  Bounding box (tuple of slices) of the non-zero voxels of an array, or None if it is empty.
+  Only the projections of the array on its three axes are computed.
+  """
+  box = []
+  for axis in range(labelArray.ndim):
+    otherAxes = tuple(other for other in range(labelArray.ndim) if other != axis)
+    filled = np.flatnonzero(labelArray.any(axis=otherAxes))
+    if len(filled) == 0:
+      return None
+    box.append(slice(filled[0], filled[-1]+1))
+  return tuple(box)
+
+
+def labelBox(labelArray, labelValue, chunkSlices=64):
+  """
+  Bounding box (tuple of slices) of the voxels of a labelmap array that are equal to labelValue,
+  or None if there are none. The array is compared with the label chunkSlices slices at a time,
+  so that no temporary of the size of the whole array is made when it is a shared layer of a
+  large segmentation.
+  """
+  slices = []
+  rows = np.zeros(labelArray.shape[1], dtype=bool)
+  columns = np.zeros(labelArray.shape[2], dtype=bool)
+  for first in range(0, labelArray.shape[0], chunkSlices):
+    chunk = labelArray[first:first+chunkSlices] == labelValue
+    chunkRows = chunk.any(axis=2)
+    filled = np.flatnonzero(chunkRows.any(axis=1))
+    if len(filled) == 0:
+      continue
+    slices += [first + filled[0], first + filled[-1]]
+    rows |= chunkRows.any(axis=0)
+    columns |= chunk.any(axis=1).any(axis=0)
+  if len(slices) == 0:
+    return None
+  rows = np.flatnonzero(rows)
+  columns = np.flatnonzero(columns)
+  return (slice(slices[0], slices[-1]+1), slice(rows[0], rows[-1]+1), slice(columns[0], columns[-1]+1))
+
+
+def gridOffset(ijkToRas, referenceIjkToRas, tolerance=1e-3):
+  """
+  IJK index on a reference voxel grid of the first voxel of an image, given the IJK to RAS
+  matrices (4x4 arrays) of both, if the image lies on the same grid: the same axes and spacing
+  and an origin that is a whole number of voxels away. Returns None otherwise, in which case
+  the image has to be resampled.
+  """
+  imageToReference = np.linalg.solve(referenceIjkToRas, ijkToRas)
+  if not np.allclose(imageToReference[:3, :3], np.eye(3), atol=tolerance):
+    return None
+  offset = imageToReference[:3, 3]
+  if not np.allclose(offset, np.rint(offset), atol=tolerance):
+    return None
+  return tuple(int(value) for value in np.rint(offset))
+
+
+def cropBlock(array, box):
+  """
+  Block of an array given by a tuple of slices that may reach outside of it. A view of the
+  array is returned if the block is inside of it, else a copy padded with zeros.
+  """
+  if all(0 <= b.start and b.stop <= size for b, size in zip(box, array.shape)):
+    return array[tuple(box)]
+  block = np.zeros([b.stop-b.start for b in box], dtype=array.dtype)
+  source = tuple(slice(max(b.start, 0), min(b.stop, size)) for b, size in zip(box, array.shape))
+  target = tuple(slice(s.start-b.start, s.stop-b.start) for s, b in zip(source, box))
+  if all(s.stop > s.start for s in source):
+    block[target] = array[source]
+  return block
+
+
+def segmentColumns(narray, axisIndex, interval, spacing, angle=None, workers=None):
+  """
+  Table columns (name -> array) of one segment, given as a binary array in KJI order that is
+  cropped to the segment. spacing is the IJK spacing of the array in mm, which does not have
+  to be isotropic. The names, units and conventions are the same as the columns of
+  SegmentGeometryLogic.run.
+  """
+  from .SectionFeret import stackFeret
+  from .SectionMoments import stackProperties
+  from .SectionPerimeter import stackPerimeter
+  from .SectionTable import sectionColumns
+  from .SliceChunks import mapSliceChunks
+
+  PixelDepthMm = spacing[axisIndex]
+  PixelWidthMm, PixelHeightMm = [spacing[i] for i in range(3) if i != axisIndex]
+  aspect = PixelHeightMm / PixelWidthMm
+
+  numSlices = narray.shape[2-axisIndex]
+  sampleSlices, percentLength = sampleSliceIndices(numSlices, interval)
+  props = mapSliceChunks(stackProperties, narray, axisIndex, sampleSlices, workers, angle, aspect)
+  perimeter = mapSliceChunks(stackPerimeter, narray, axisIndex, sampleSlices, workers, 1.0, aspect)
+  ferets = mapSliceChunks(stackFeret, narray, axisIndex, sampleSlices, workers, 1.0, aspect)
+
+  columns = {}
+  columns["Slice Index"] = sampleSlices
+  columns["Percent (%)"] = percentLength
+  columns.update(sectionColumns(props, numSlices, PixelWidthMm, PixelDepthMm, perimeter, ferets))
+  return columns
+
+
+def batchColumns(labelArray, segmentNames, axisIndex, interval, spacing, angle=None, workers=None):
+  """
+  Table columns of all segments of a multi-label array, where segmentNames[n] has label
+  value n+1, stacked one segment after the other. The "Segment" column holds the segment
+  name of every row so that the table can be grouped by segment.
+  """
+  labels = range(1, len(segmentNames)+1)
+  segmentTables = []
+  for segName, label, box in zip(segmentNames, labels, labelBoundingBoxes(labelArray, labels)):
+    if box is None:
+      raise ValueError("Segment {} is empty".format(segName))
+    segmentTables.append(segmentColumns(labelArray[box] == label, axisIndex, interval, spacing, angle, workers))
+  columns = {"Segment": np.repeat(np.asarray(segmentNames, dtype=object), [len(table["Slice Index"]) for table in segmentTables])}
+  for name in segmentTables[0]:
+    columns[name] = np.concatenate([table[name] for table in segmentTables])
+  return columns
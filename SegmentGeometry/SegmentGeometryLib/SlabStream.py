@@ -0,0 +1,264 @@
+"""
+Section properties of labelmaps that do not fit in memory, read one slab of slices at a time.
+
+The labelmap and the volume are array-likes in KJI order that are only read with basic slicing:
+a memory-mapped raw NRRD file (readNrrd), an h5py or zarr dataset, or a NumPy array. The
+sampled slices are read in slabs that fit in a memory budget and every slab is measured with the
+same whole-stack kernels as an array in memory and freed before the next one is read. As the
+kernels measure every slice on its own, the results are identical to the in-memory path.
+"""
+
+import os
+import re
+
+import numpy as np
+
+__all__ = [
+  "DEFAULT_MEMORY_BYTES",
+  "KERNEL_BYTES_PER_VOXEL",
+  "readNrrd",
+  "nrrdSpacing",
+  "nrrdSegment",
+  "LabelLayer",
+  "slabSlices",
+  "readSlab",
+  "streamBox",
+  "mapSlabs",
+  "streamColumns",
+]
+
+# memory budget of the slabs and of the temporaries of the kernels
+DEFAULT_MEMORY_BYTES = 512 * 1024**2
+
+# bytes of temporaries the kernels make per voxel of a slab (masks, boundaries and contours)
+KERNEL_BYTES_PER_VOXEL = 8
+
+# NRRD type names -> NumPy type codes
+_NRRD_TYPES = {}
+for _names, _code in ((("signed char", "int8", "int8_t"), "i1"),
+                      (("uchar", "unsigned char", "uint8", "uint8_t"), "u1"),
+                      (("short", "short int", "signed short", "signed short int", "int16", "int16_t"), "i2"),
+                      (("ushort", "unsigned short", "unsigned short int", "uint16", "uint16_t"), "u2"),
+                      (("int", "signed int", "int32", "int32_t"), "i4"),
+                      (("uint", "unsigned int", "uint32", "uint32_t"), "u4"),
+                      (("longlong", "long long", "long long int", "signed long long", "signed long long int", "int64", "int64_t"), "i8"),
+                      (("ulonglong", "unsigned long long", "unsigned long long int", "uint64", "uint64_t"), "u8"),
+                      (("float",), "f4"),
+                      (("double",), "f8")):
+  for _name in _names:
+    _NRRD_TYPES[_name] = _code
+
+
+def readNrrd(path):
+  """
+  Memory map the voxels of an uncompressed (raw encoding) NRRD file, such as a volume or a
+  segmentation (.seg.nrrd) saved without compression, without reading them. Returns (array,
+  header): a read-only NumPy memmap in KJI order, with the layers of a segmentation as the last
+  axis, and a dictionary of the header fields and key/value pairs.
+  """
+  header = {}
+  with open(path, "rb") as nrrdFile:
+    magic = nrrdFile.readline()
+    if not magic.startswith(b"NRRD"):
+      raise ValueError("Not a NRRD file: "+path)
+    while True:
+      line = nrrdFile.readline()
+      if line in (b"", b"\n", b"\r\n"):
+        break
+      line = line.decode("latin-1").rstrip("\r\n")
+      if line.startswith("#"):
+        continue
+      for separator in (":=", ": "):
+        if separator in line:
+          key, value = line.split(separator, 1)
+          header[key.strip()] = value.strip()
+          break
+    dataOffset = nrrdFile.tell()
+
+  if header.get("encoding", "raw") != "raw":
+    raise ValueError("Only uncompressed NRRD files can be read in slabs, save the file without compression: "+path)
+  dtype = np.dtype(_NRRD_TYPES[header["type"]])
+  if dtype.itemsize > 1:
+    dtype = dtype.newbyteorder(">" if header.get("endian", "little") == "big" else "<")
+  shape = tuple(int(size) for size in header["sizes"].split())[::-1]
+  dataPath = path
+  if "data file" in header or "datafile" in header:
+    dataPath = os.path.join(os.path.dirname(path), header.get("data file", header.get("datafile")))
+    dataOffset = 0
+  byteSkip = int(header.get("byte skip", header.get("byteskip", 0)))
+  if byteSkip < 0:
+    # the data is at the end of the file
+    dataOffset = os.path.getsize(dataPath) - int(np.prod(shape)) * dtype.itemsize
+  else:
+    dataOffset += byteSkip
+  # the sizes run from the fastest axis, which are the layers of a segmentation, to K
+  return np.memmap(dataPath, dtype=dtype, mode="r", offset=dataOffset, shape=shape), header
+
+
+def nrrdSpacing(header):
+  """
+  IJK spacing of the voxels of a NRRD header, from the "space directions" or "spacings" field.
+  The axis of the layers of a segmentation is skipped.
+  """
+  if "space directions" in header:
+    directions = re.findall(r"\(([^)]*)\)", header["space directions"])
+    return tuple(float(np.linalg.norm([float(value) for value in direction.split(",")])) for direction in directions)
+  return tuple(float(value) for value in header["spacings"].split() if value.lower() != "nan")
+
+
+def nrrdSegment(header, segmentName):
+  """
+  Layer and label value of a segment of a segmentation NRRD header, by name.
+  """
+  index = 0
+  while "Segment{}_ID".format(index) in header:
+    if header.get("Segment{}_Name".format(index)) == segmentName:
+      return int(header.get("Segment{}_Layer".format(index), 0)), int(header.get("Segment{}_LabelValue".format(index), 1))
+    index += 1
+  raise ValueError("Segment not found: "+segmentName)
+
+
+class LabelLayer:
+  """
+  Array-like binary labelmap of one segment of a shared labelmap layer, read lazily: only the
+  blocks that are sliced out of it are read and compared with the label value. array is a
+  three-dimensional array-like in KJI order, or a four-dimensional one with the layers last.
+  """
+
+  def __init__(self, array, labelValue=1, layer=None):
+    self.array = array
+    self.labelValue = labelValue
+    self.layer = layer
+    self.shape = tuple(array.shape[:3])
+    self.dtype = np.dtype(bool)
+
+  def __getitem__(self, key):
+    if self.layer is not None:
+      key = key if isinstance(key, tuple) else (key,)
+      key = key + (slice(None),) * (3 - len(key)) + (self.layer,)
+    return np.asarray(self.array[key]) == self.labelValue
+
+
+def slabSlices(sliceVoxels, bytesPerVoxel, maxBytes):
+  """
+  Number of slices of sliceVoxels voxels that can be held at once in maxBytes, with
+  bytesPerVoxel bytes of slab and kernel memory per voxel.
+  """
+  count = int(maxBytes // (sliceVoxels * bytesPerVoxel))
+  if count < 1:
+    raise ValueError("Memory budget is smaller than one slice: {} bytes".format(sliceVoxels * bytesPerVoxel))
+  return count
+
+
+def readSlab(array, axis, rows, box=None):
+  """
+  Read the slices rows (sorted indices along axis, relative to box) of the block box (tuple of
+  slices, the whole array if None) of an array-like into a NumPy array with the slices first.
+  Consecutive rows are read with one slicing call.
+  """
+  if box is None:
+    box = tuple(slice(0, size) for size in array.shape)
+  planeShape = [b.stop - b.start for index, b in enumerate(box) if index != axis]
+  slab = np.empty([len(rows)] + planeShape, dtype=array.dtype)
+  position = 0
+  for run in np.split(rows, np.flatnonzero(np.diff(rows) != 1) + 1):
+    if len(run) == 0:
+      continue
+    block = list(box)
+    block[axis] = slice(box[axis].start + run[0], box[axis].start + run[-1] + 1)
+    slab[position:position+len(run)] = np.moveaxis(np.asarray(array[tuple(block)]), axis, 0)
+    position += len(run)
+  return slab
+
+
+def streamBox(array, maxBytes=DEFAULT_MEMORY_BYTES):
+  """
+  Bounding box (tuple of slices) of the non-zero voxels of an array-like, like
+  SegmentBatch.foregroundBox, read in slabs along its first axis. None if it is empty.
+  """
+  from .SegmentBatch import foregroundBox
+  count = slabSlices(array.shape[1] * array.shape[2], 2 * array.dtype.itemsize + 1, maxBytes)
+  starts = []
+  stops = []
+  for first in range(0, array.shape[0], count):
+    box = foregroundBox(np.asarray(array[first:first+count]))
+    if box is not None:
+      starts.append([first + box[0].start, box[1].start, box[2].start])
+      stops.append([first + box[0].stop, box[1].stop, box[2].stop])
+  if len(starts) == 0:
+    return None
+  starts = np.min(starts, axis=0)
+  stops = np.max(stops, axis=0)
+  return tuple(slice(int(start), int(stop)) for start, stop in zip(starts, stops))
+
+
+def mapSlabs(function, labelArray, axisIndex, sampleSlices, maxBytes, *args, box=None):
+  """
+  Call function(slab, 2, chunk, *args) for slabs of the sampled slices of the block box of an
+  array-like labelArray that fit in maxBytes, and merge the per-slice results (arrays or
+  dictionaries of arrays) in the order of sampleSlices, like SliceChunks.mapSliceChunks. The
+  slabs hold the slices first, so the kernels measure them as slices along axis 2 (S) with the
+  same in-plane axes as the slices of labelArray along axisIndex. Array-likes among args with
+  the shape of labelArray (the volume for the brightness) are read in the same slabs.
+  """
+  from .SliceChunks import _mergeChunks
+  axis = 2 - axisIndex
+  if box is None:
+    box = tuple(slice(0, size) for size in labelArray.shape)
+  sampleSlices = np.asarray(sampleSlices)
+  streamed = [index for index, arg in enumerate(args) if tuple(getattr(arg, "shape", ())) == tuple(labelArray.shape)]
+  sliceVoxels = int(np.prod([b.stop - b.start for index, b in enumerate(box) if index != axis]))
+  bytesPerVoxel = 2 * sum(np.dtype(array.dtype).itemsize for array in [labelArray] + [args[index] for index in streamed]) + KERNEL_BYTES_PER_VOXEL
+  count = slabSlices(sliceVoxels, bytesPerVoxel, maxBytes)
+
+  results = []
+  for first in range(0, len(sampleSlices), count):
+    chunk = sampleSlices[first:first+count]
+    rows = np.unique(chunk)
+    slabArgs = list(args)
+    for index in streamed:
+      slabArgs[index] = readSlab(args[index], axis, rows, box)
+    results.append(function(readSlab(labelArray, axis, rows, box), 2, np.searchsorted(rows, chunk), *slabArgs))
+    del slabArgs
+  if len(results) == 1:
+    return results[0]
+  return _mergeChunks(results)
+
+
+def streamColumns(labelArray, axisIndex, interval, spacing, angle=None, maxBytes=DEFAULT_MEMORY_BYTES, voxelArray=None):
+  """
+  Table columns of one segment, given as an array-like binary labelmap in KJI order that does not
+  have to fit in memory (see LabelLayer for a segment of a shared layer), read in slabs of at most
+  maxBytes. The segment is cropped to its bounding box first, so the columns are identical to
+  those of SegmentBatch.segmentColumns on the cropped array in memory. If voxelArray, an
+  array-like on the same grid, is given, the mean brightness of the segment is added.
+  """
+  from .SectionFeret import stackFeret
+  from .SectionMoments import stackMeanIntensity, stackProperties
+  from .SectionPerimeter import stackPerimeter
+  from .SectionTable import sectionColumns
+  from .SegmentBatch import sampleSliceIndices
+
+  if voxelArray is not None and tuple(voxelArray.shape) != tuple(labelArray.shape):
+    raise ValueError("The labelmap and the volume are not on the same voxel grid")
+  box = streamBox(labelArray, maxBytes)
+  if box is None:
+    raise ValueError("Segment is empty")
+
+  PixelDepthMm = spacing[axisIndex]
+  PixelWidthMm, PixelHeightMm = [spacing[i] for i in range(3) if i != axisIndex]
+  aspect = PixelHeightMm / PixelWidthMm
+
+  numSlices = box[2-axisIndex].stop - box[2-axisIndex].start
+  sampleSlices, percentLength = sampleSliceIndices(numSlices, interval)
+  props = mapSlabs(stackProperties, labelArray, axisIndex, sampleSlices, maxBytes, angle, aspect, box=box)
+  perimeter = mapSlabs(stackPerimeter, labelArray, axisIndex, sampleSlices, maxBytes, 1.0, aspect, box=box)
+  ferets = mapSlabs(stackFeret, labelArray, axisIndex, sampleSlices, maxBytes, 1.0, aspect, box=box)
+
+  columns = {}
+  columns["Slice Index"] = sampleSlices
+  columns["Percent (%)"] = percentLength
+  columns.update(sectionColumns(props, numSlices, PixelWidthMm, PixelDepthMm, perimeter, ferets))
+  if voxelArray is not None:
+    columns["Mean Brightness"] = mapSlabs(stackMeanIntensity, voxelArray, axisIndex, sampleSlices, maxBytes, labelArray, box=box)
+  return columns
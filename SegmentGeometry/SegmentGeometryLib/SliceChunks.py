@@ -0,0 +1,77 @@
+"""
+Run the whole-stack section kernels on chunks of slices in a worker pool.
+
+Every kernel (stackProperties, stackPerimeter, stackFeret) computes each slice independently
+from its own pixels, so splitting sampleSlices into chunks gives results that are identical
+to a single serial call. The heavy work of the kernels is done in NumPy routines that release
+the GIL, which lets the chunks run concurrently in threads that share the labelmap array
+without copying it.
+"""
+
+import os
+import time
+import numpy as np
+
+__all__ = [
+  "defaultWorkers",
+  "sliceChunks",
+  "mapSliceChunks",
+]
+
+# do not split the slices into chunks smaller than this
+MIN_CHUNK_SLICES = 16
+
+
+def defaultWorkers():
+  """
+  Number of workers to use when none is given: one per available core.
+  """
+  if hasattr(os, "sched_getaffinity"):
+    return max(len(os.sched_getaffinity(0)), 1)
+  return os.cpu_count() or 1
+
+
+def sliceChunks(sampleSlices, workers):
+  """
+  Split sampleSlices into at most workers consecutive chunks of at least MIN_CHUNK_SLICES slices.
+  """
+  sampleSlices = np.asarray(sampleSlices)
+  chunks = max(min(int(workers), len(sampleSlices) // MIN_CHUNK_SLICES), 1)
+  return np.array_split(sampleSlices, chunks)
+
+
+def _mergeChunks(results):
+  if isinstance(results[0], dict):
+    return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+  return np.concatenate(results)
+
+
+def mapSliceChunks(function, labelArray, axisIndex, sampleSlices, workers=1, *args, **kwargs):
+  """
+  Call function(labelArray, axisIndex, chunk, *args, **kwargs) for chunks of sampleSlices with
+  a pool of workers threads and merge the per-slice results (arrays or dictionaries of arrays)
+  back in the order of sampleSlices. workers=None uses one worker per core. If a
+  Profiling.StageReport is active, the time of every chunk is recorded in it under the name of
+  the function with the first and last slice of the chunk, to find the slices that are slow.
+  """
+  from .Profiling import activeReport
+  if workers is None:
+    workers = defaultWorkers()
+  chunks = sliceChunks(sampleSlices, workers)
+  report = activeReport()
+
+  def runChunk(chunk):
+    if report is None or len(chunk) == 0:
+      return function(labelArray, axisIndex, chunk, *args, **kwargs)
+    start = time.perf_counter()
+    result = function(labelArray, axisIndex, chunk, *args, **kwargs)
+    report.record(function.__name__, start, time.perf_counter() - start, firstSlice=int(chunk[0]), lastSlice=int(chunk[-1]), slices=len(chunk))
+    return result
+
+  if len(chunks) == 1:
+    return runChunk(chunks[0])
+
+  from concurrent.futures import ThreadPoolExecutor
+  with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+    results = list(executor.map(runChunk, chunks))
+  return _mergeChunks(results)
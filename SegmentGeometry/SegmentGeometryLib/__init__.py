@@ -0,0 +1,14 @@
+from .BatchCLI import *
+from .Benchmark import *
+from .LabelmapCache import *
+from .ObliqueSections import *
+from .Profiling import *
+from .SectionFeret import *
+from .SectionMetrics import *
+from .SectionMoments import *
+from .SectionPerimeter import *
+from .SectionTable import *
+from .SegmentAxes import *
+from .SegmentBatch import *
+from .SlabStream import *
+from .SliceChunks import *